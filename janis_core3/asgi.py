@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "janis_core3.settings")
 
 application = get_asgi_application()
+
+# los contadores de versión del matching necesitan un cache compartido entre workers
+from properties.engine_matching.versions import warn_if_local_cache  # noqa: E402
+
+warn_if_local_cache()
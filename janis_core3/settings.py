@@ -150,6 +150,31 @@ DATABASES = {
     }
 }
 
+# Cache compartido (matching: resultados por requerimiento y versiones de inventario).
+# Con REDIS_URL se comparte entre workers; sin él cae a memoria local por proceso: cada
+# worker ve las invalidaciones de los otros recién al expirar sus caches. Con DEBUG apagado
+# wsgi/asgi y process_match_queue lo avisan en el log al arrancar
+# (engine_matching.versions.warn_if_local_cache); MATCHING_ALLOW_LOCAL_CACHE=true lo silencia.
+MATCHING_ALLOW_LOCAL_CACHE = os.environ.get('MATCHING_ALLOW_LOCAL_CACHE', 'False').lower() in ('1', 'true', 'yes')
+_redis_url = os.environ.get('REDIS_URL', '').strip()
+if _redis_url:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': _redis_url,
+            'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', 'janis'),
+            'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', '3600')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'janis-local',
+            'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', '3600')),
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -325,7 +350,13 @@ LOGGING = {
        "django.db.backends": {
            "handlers": ["console"],
            "level": "WARNING",
-       }
+       },
+       # una línea JSON por get_matches (INFO) / lentas o anchas (WARNING)
+       "properties.engine_matching.metrics": {
+           "handlers": ["console"],
+           "level": os.getenv("MATCHING_METRICS_LOG_LEVEL", "WARNING"),
+           "propagate": False,
+       },
    }
 }
 
@@ -334,3 +365,31 @@ WP_USER = os.getenv("WP_USER", "")
 WP_APP_PASSWORD = os.getenv("WP_APP_PASSWORD", "")
 WP_TIMEOUT = int(os.getenv("WP_TIMEOUT", "30"))
 INTERNAL_SYNC_KEY = os.getenv("INTERNAL_SYNC_KEY", "")
+
+# Matching: piso de proximidad por rango para filtrar candidatos en SQL (vacío = desactivado)
+# Ej: MATCHING_RANGE_FLOORS="price=0.2,built_area=0.2"
+MATCHING_RANGE_FLOORS = {
+    key.strip(): float(value)
+    for key, value in (
+        item.split("=", 1) for item in os.getenv("MATCHING_RANGE_FLOORS", "").split(",") if "=" in item
+    )
+}
+
+# Matching: pesos iguales para todos los criterios activos, como el motor anterior, ignorando
+# MatchingWeight (engine_matching/weights.py). Con pesos distintos los scores cambian y con ellos
+# quién pasa REVERSE_MATCH_MIN_SCORE (80): "0" recién después de revisar pesos y umbral.
+MATCHING_EQUAL_WEIGHTS = os.getenv("MATCHING_EQUAL_WEIGHTS", "1") != "0"
+
+# Matching: snapshot en memoria del catálogo de candidatos (engine_matching/snapshot.py). "0" = siempre SQL
+MATCHING_SNAPSHOT = os.getenv("MATCHING_SNAPSHOT", "1") != "0"
+
+# Matching: instrumentación (engine_matching/metrics.py, /dashboard/api/matching/metrics/)
+MATCHING_METRICS = os.getenv("MATCHING_METRICS", "1") != "0"
+MATCHING_SLOW_MS = float(os.getenv("MATCHING_SLOW_MS", "500"))
+MATCHING_WIDE_RATIO = float(os.getenv("MATCHING_WIDE_RATIO", "0.5"))
+
+# Dashboard: mapa por viewport (properties/geo.py, PropertyMapMarkersView). Con más puntos
+# que DASHBOARD_MAP_MAX_MARKERS en el bbox se devuelven clusters, salvo desde CLUSTER_MAX_ZOOM
+DASHBOARD_MAP_MAX_MARKERS = int(os.getenv("DASHBOARD_MAP_MAX_MARKERS", "300"))
+DASHBOARD_MAP_CLUSTER_MAX_ZOOM = int(os.getenv("DASHBOARD_MAP_CLUSTER_MAX_ZOOM", "17"))
+DASHBOARD_MAP_CACHE_TIMEOUT = int(os.getenv("DASHBOARD_MAP_CACHE_TIMEOUT", "60"))
@@ -1,4 +1,7 @@
+from decimal import Decimal
+
 from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 
 from notifications.models import Notification
 
@@ -41,6 +44,10 @@ EVENT_CONFIG = {
     }
 }
 
+def _json_number(value):
+    return float(value) if isinstance(value, Decimal) else value
+
+
 class EventHandler:
     def __init__(self, event_type, instance, context=None):
         self.event_type = event_type
@@ -121,22 +128,23 @@ class EventHandler:
     # -------------------------
     # Main
     # -------------------------
-    def perform(self):
-        # 1) validar condiciones del evento (si existen)
-        conditions = self.config.get("conditions", [])
-        for cond in conditions:
+    def _passes_conditions(self):
+        # validar condiciones del evento (si existen)
+        for cond in self.config.get("conditions", []):
             try:
                 if callable(cond) and not cond(self.instance):
-                    return
+                    return False
             except Exception:
-                return
-            
-        ct = ContentType.objects.get_for_model(self.instance.__class__)
+                return False
+        return True
 
+    def _pending_notifications(self):
+        """Arma (recipient, defaults) para cada destinatario resuelto, sin tocar la BD."""
         recipients_cfg = self.config.get("recipients", [])
         if not isinstance(recipients_cfg, list):
-            return
+            return []
 
+        pending = []
         seen_user_ids = set()
 
         for rcfg in recipients_cfg:
@@ -152,25 +160,77 @@ class EventHandler:
                 continue
             seen_user_ids.add(rid)
 
-            title = self._resolve_title_for_recipient(rcfg)
-            message = self._resolve_text_for_recipient(rcfg)
+            pending.append((recipient, {
+                "title": self._resolve_title_for_recipient(rcfg),
+                "message": self._resolve_text_for_recipient(rcfg),
+                "data": {
+                    "property_id": getattr(self.instance, "property_id", None),
+                    "requirement_id": getattr(self.instance, "requirement_id", None),
+                    "recipient_key": rcfg.get("recipient_key"),
+                    # score puede venir como Decimal si la instancia se leyó de la BD
+                    "score": _json_number(getattr(self.instance, "score", None)),
+                },
+            }))
+        return pending
 
+    def perform(self):
+        if not self._passes_conditions():
+            return
+
+        ct = ContentType.objects.get_for_model(self.instance.__class__)
+
+        for recipient, defaults in self._pending_notifications():
             Notification.objects.get_or_create(
                 user=recipient,
                 event_type=self.event_type,
                 content_type=ct,
                 object_id=self.source_id,
-                defaults={
-                    "title": title,
-                    "message": message,
-                    "data": {
-                        "property_id": getattr(self.instance, "property_id", None),
-                        "requirement_id": getattr(self.instance, "requirement_id", None),
-                        "recipient_key": rcfg.get("recipient_key"),
-                        "score": getattr(self.instance, "score", None),
-                    },
-                },
+                defaults=defaults,
             )
 
+    @classmethod
+    def perform_batch(cls, event_type, instances):
+        """
+        Igual que perform() para muchas instancias del mismo modelo:
+        una query para ver qué notificaciones ya existen y un bulk_create para el resto.
+        """
+        handlers = [cls(event_type, instance) for instance in instances]
+        handlers = [h for h in handlers if h._passes_conditions()]
+        if not handlers:
+            return 0
+
+        ct = ContentType.objects.get_for_model(handlers[0].instance.__class__)
+        existing = set(
+            Notification.objects
+            .filter(event_type=event_type, content_type=ct, object_id__in=[h.source_id for h in handlers])
+            .values_list("user_id", "object_id")
+        )
+
+        to_create = []
+        for h in handlers:
+            for recipient, defaults in h._pending_notifications():
+                key = (recipient.id, h.source_id)
+                if key in existing:
+                    continue
+                existing.add(key)
+                to_create.append(Notification(
+                    user=recipient,
+                    event_type=event_type,
+                    content_type=ct,
+                    object_id=h.source_id,
+                    **defaults,
+                ))
+
+        # SQL Server (mssql-django) no soporta ignore_conflicts; ya filtramos los existentes arriba
+        Notification.objects.bulk_create(
+            to_create, ignore_conflicts=connection.features.supports_ignore_conflicts,
+        )
+        return len(to_create)
+
 def on_property_matched(requirement_match):
-    EventHandler(EventTypes.PROPERTY_MATCHED, requirement_match).perform()
\ No newline at end of file
+    EventHandler(EventTypes.PROPERTY_MATCHED, requirement_match).perform()
+
+
+def on_properties_matched(requirement_matches):
+    """Versión batch de on_property_matched (persistencia masiva de RequirementMatch)."""
+    return EventHandler.perform_batch(EventTypes.PROPERTY_MATCHED, requirement_matches)
@@ -22,7 +22,7 @@ from .models import (
 
 from .models import Requirement, RequirementMatch
 from .models import CanalLead, LeadStatus, Lead
-from .models import MatchingWeight, MatchEvent
+from .models import MatchingWeight, MatchEvent, MatchRecalcJob, PropertyMatchJob
 
 
 # ===================== ADMIN PARA SERVICIOS =====================
@@ -539,6 +539,24 @@ class MatchEventAdmin(admin.ModelAdmin):
     ordering = ('-created_at',)
 
 
+@admin.register(MatchRecalcJob)
+class MatchRecalcJobAdmin(admin.ModelAdmin):
+    list_display = ('requirement', 'requested_at', 'run_after', 'locked_by', 'attempts')
+    list_filter = ('attempts',)
+    search_fields = ('requirement__id',)
+    readonly_fields = ('enqueued_at', 'last_error')
+    ordering = ('run_after',)
+
+
+@admin.register(PropertyMatchJob)
+class PropertyMatchJobAdmin(admin.ModelAdmin):
+    list_display = ('property', 'requested_at', 'run_after', 'locked_by', 'attempts')
+    list_filter = ('attempts',)
+    search_fields = ('property__id', 'property__code')
+    readonly_fields = ('enqueued_at', 'last_error')
+    ordering = ('run_after',)
+
+
 @admin.register(AgencyConfig)
 class AgencyConfigAdmin(admin.ModelAdmin):
     list_display = ('nombre_comercial', 'ruc', 'correo_electronico')
@@ -0,0 +1,131 @@
+"""Amenidades tokenizadas.
+
+`Property.amenities` y `Requirement.amenities` son texto libre ("Piscina; gimnasio, ascensor").
+Aquí se parte en tokens normalizados y cada token distinto recibe un id en la
+tabla AmenityToken (vocabulario). Property.save guarda los ids en `amenity_tokens`
+("3 7 12"): el motor los carga como bitset y puntúa con operaciones de bits.
+
+Solo Property agrega tokens al vocabulario (save / tokenize_amenities). Un
+requerimiento solo los lee: lo que pide y nadie tiene igual cuenta en amenity_count.
+
+El bit de cada token no es su id sino su posición en TokenIndex (0..n-1 en orden de
+id), así el ancho del bitset depende del tamaño del vocabulario. El índice se
+rearma cuando sube la versión del vocabulario (signals.py, al crear/borrar tokens);
+la versión se consulta a lo sumo cada VOCABULARY_VERSION_CHECK segundos.
+"""
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from django.db import IntegrityError, transaction
+
+from .engine_matching.criteria import encode_tokens
+from .engine_matching.versions import bump_version, get_version
+from .models import AmenityToken
+from .ubigeo import normalize_name
+
+TOKEN_SEPARATORS = re.compile(r"[,;/|\n\r\t]+")
+TOKEN_MAX_LENGTH = 100
+
+VOCABULARY_VERSION_KEY = "properties:amenity_vocabulary_version"
+VOCABULARY_VERSION_CHECK = 5.0
+
+# name -> id. Un token nunca cambia de id; se vacía junto con el índice (forget_token_index).
+_known: Dict[str, int] = {}
+_known_lock = threading.Lock()
+
+
+def tokenize(text) -> List[str]:
+    """'Piscina; GIMNASIO, piscina ' -> ['piscina', 'gimnasio'] (sin repetir, en orden)."""
+    tokens = []
+    for part in TOKEN_SEPARATORS.split(text or ""):
+        token = normalize_name(part)[:TOKEN_MAX_LENGTH]
+        if token and token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+def token_ids(names: Iterable[str], *, create: bool = False) -> Dict[str, int]:
+    """Ids de vocabulario de `names`; con create=True agrega los que falten."""
+    names = set(names)
+    found = {name: _known[name] for name in names if name in _known}
+    missing = names - found.keys()
+    if missing:
+        found.update(AmenityToken.objects.filter(name__in=missing).values_list("name", "id"))
+        if create:
+            for name in missing - found.keys():
+                try:
+                    with transaction.atomic():
+                        found[name] = AmenityToken.objects.create(name=name).pk
+                except IntegrityError:
+                    # otro proceso lo creó entre el SELECT y aquí
+                    found[name] = AmenityToken.objects.get(name=name).pk
+        # solo lo que quedó confirmado: un rollback podría deshacer un token recién creado
+        transaction.on_commit(lambda: _remember(found))
+    return found
+
+
+def _remember(found: Dict[str, int]) -> None:
+    with _known_lock:
+        _known.update(found)
+
+
+def encode_amenities(text) -> str:
+    """Texto de amenidades -> valor de Property.amenity_tokens (crea tokens nuevos)."""
+    names = tokenize(text)
+    if not names:
+        return ""
+    return encode_tokens(token_ids(names, create=True).values())
+
+
+# -----------------------------
+# Índice denso del vocabulario
+# -----------------------------
+class TokenIndex:
+    """id de AmenityToken -> posición de su bit (0..n-1, en orden de id)."""
+
+    __slots__ = ("version", "position", "checked_at")
+
+    def __init__(self, version: int):
+        self.version = version
+        self.position: Dict[int, int] = {
+            pk: i for i, pk in enumerate(AmenityToken.objects.order_by("id").values_list("id", flat=True))
+        }
+        self.checked_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.position)
+
+
+_index: Optional[TokenIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_token_index() -> TokenIndex:
+    global _index
+    index = _index
+    if index is not None and time.monotonic() - index.checked_at < VOCABULARY_VERSION_CHECK:
+        return index
+    version = get_version(VOCABULARY_VERSION_KEY)
+    with _index_lock:
+        index = _index
+        if index is not None and index.version == version:
+            index.checked_at = time.monotonic()
+            return index
+        _index = TokenIndex(version)
+        return _index
+
+
+def forget_token_index() -> None:
+    """Solo este proceso: el próximo get_token_index / token_ids relee el vocabulario (ve lo no commiteado)."""
+    global _index
+    with _index_lock:
+        _index = None
+    with _known_lock:
+        _known.clear()
+
+
+def invalidate_token_index() -> None:
+    bump_version(VOCABULARY_VERSION_KEY)
+    forget_token_index()
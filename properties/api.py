@@ -1,3 +1,5 @@
+import math
+
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin, CreateModelMixin
 from rest_framework import permissions, filters
@@ -18,6 +20,7 @@ from django.contrib.auth import get_user_model
 from django.core.paginator import Paginator
 
 
+from .geo import within_radius
 from .models import Property, Requirement
 from .serializers import PropertySerializer, PropertyWithDocsSerializer, RequirementSerializer, PropertyDocumentCreateSerializer, PropertyDocumentUpdateSerializer, DocumentTypeSerializer
 
@@ -167,6 +170,36 @@ class PropertyViewSet(GenericViewSet, ListModelMixin, RetrieveModelMixin):
         doc.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)    
 
+    @action(detail=True, methods=["get"], url_path="nearby")
+    def nearby(self, request, *args, **kwargs):
+        """
+        Propiedades publicadas a <= ?radius= metros (default 1000, máx 20000) de esta,
+        más cercanas primero, con `distance_m`. Radio y bbox se resuelven en SQL (geo.py).
+        """
+        prop = self.get_object()
+        if prop.latitude is None:
+            return Response({"detail": "La propiedad no tiene coordenadas."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            radius = float(request.query_params.get("radius", 1000))
+        except ValueError:
+            radius = math.nan
+        if not math.isfinite(radius):
+            return Response({"detail": "radius inválido"}, status=status.HTTP_400_BAD_REQUEST)
+        radius = min(max(radius, 1.0), 20000.0)
+
+        qs = within_radius(
+            self.get_queryset().filter(is_active=True, is_draft=False).exclude(pk=prop.pk),
+            prop.latitude, prop.longitude, radius,
+        )
+        page = self.paginate_queryset(qs)
+        rows = page if page is not None else list(qs)
+        data = self.get_serializer(rows, many=True).data
+        for item, obj in zip(data, rows):
+            item["distance_m"] = round(obj.distance_m, 1)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
     @action(detail=True, methods=["get"], url_path="with-docs")
     def with_docs(self, request, *args, **kwargs):
         prop = self.get_object()
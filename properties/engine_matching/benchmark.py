@@ -0,0 +1,319 @@
+# properties/engine_matching/benchmark.py
+"""
+Benchmark del motor de matching (comando benchmark_matching).
+
+- generate_catalog(): inventario sintético de N propiedades y M requerimientos
+  repartidos en distritos, tipos, monedas y formas de pago reales; todo con
+  bulk_create (sin signals, así no dispara fan-out ni notificaciones).
+- run_benchmark(): mide build_candidate_qs, load_candidates (snapshot), calculate_score,
+  score_property, get_matches y la persistencia, y devuelve un dict listo para volcar a JSON.
+
+Solo usa el ORM: corre igual en SQLite (DB_ENGINE=django.db.backends.sqlite3)
+que en SQL Server. El comando lo ejecuta dentro de una transacción que revierte.
+"""
+import platform
+import random
+import statistics
+import time
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.utils import timezone
+
+from properties import matching
+from properties.models import (
+    Currency,
+    Department,
+    District,
+    OperationType,
+    PaymentMethod,
+    Property,
+    PropertyType,
+    Province,
+    Requirement,
+)
+
+from .engine import build_candidate_qs, calculate_score, get_matches, load_candidates
+from .index import bump_requirement_index_version
+from .persistence import persist_requirement_matches
+from .profile import get_requirement_profile
+from .versions import bump_inventory_version
+from .weights import load_weights
+
+BENCH_CODE_PREFIX = "BENCH"
+
+DISTRICTS = (
+    "Miraflores", "San Isidro", "Santiago de Surco", "Barranco", "La Molina",
+    "San Borja", "Jesus Maria", "Lince", "Magdalena del Mar", "Pueblo Libre",
+    "San Miguel", "Surquillo", "Chorrillos", "Los Olivos", "Ate",
+)
+PROPERTY_TYPES = ("Departamento", "Casa", "Terreno", "Oficina", "Local Comercial")
+# (code, name, symbol, rango de precio típico)
+CURRENCIES = (
+    ("USD", "Dolar", "$", (60_000, 900_000)),
+    ("PEN", "Sol", "S/", (200_000, 3_000_000)),
+)
+# codes de PaymentMethod que entiende PAYMENT_CODE_MAP
+PAYMENT_METHODS = (("cash", "Contado"), ("credit", "Credito"), ("cont_y_credito", "Contado y Credito"))
+# sale/rent para Property, buy/rent para Requirement (ver OPERATION_CODE_MAP)
+OPERATIONS = (("sale", "Venta"), ("buy", "Compra"), ("rent", "Alquiler"))
+
+
+# -----------------------------
+# Catálogo sintético
+# -----------------------------
+def _reference_data() -> Dict[str, List[Any]]:
+    """Crea (o reutiliza) los catálogos base que usa el inventario sintético."""
+    dept, _ = Department.objects.get_or_create(name="Lima", defaults={"code": "LIM"})
+    prov, _ = Province.objects.get_or_create(department=dept, name="Lima", defaults={"code": "LIM"})
+    districts = [
+        District.objects.get_or_create(province=prov, name=name, defaults={"code": f"B{i:02d}"})[0]
+        for i, name in enumerate(DISTRICTS)
+    ]
+    operations = {
+        code: OperationType.objects.get_or_create(code=code, defaults={"name": f"{name} ({BENCH_CODE_PREFIX})"})[0]
+        for code, name in OPERATIONS
+    }
+    ptypes = [PropertyType.objects.get_or_create(name=name)[0] for name in PROPERTY_TYPES]
+    currencies = [
+        (Currency.objects.get_or_create(code=code, defaults={"name": name, "symbol": symbol})[0], price_range)
+        for code, name, symbol, price_range in CURRENCIES
+    ]
+    payments = [
+        PaymentMethod.objects.get_or_create(code=code, defaults={"name": name})[0]
+        for code, name in PAYMENT_METHODS
+    ]
+    return {
+        "districts": districts,
+        "operations": operations,
+        "ptypes": ptypes,
+        "currencies": currencies,
+        "payments": payments,
+    }
+
+
+def _range(rng: random.Random, center: float, spread: float, digits: int = 2):
+    lo = center * (1 - spread * rng.random())
+    hi = center * (1 + spread * rng.random())
+    return Decimal(str(round(lo, digits))), Decimal(str(round(hi, digits)))
+
+
+def generate_catalog(
+    n_properties: int,
+    n_requirements: int,
+    *,
+    seed: int = 42,
+    batch_size: int = 1000,
+) -> Dict[str, Any]:
+    """
+    Inserta el inventario sintético y devuelve {"properties": [ids], "requirements": [ids]}.
+    Con la misma semilla genera siempre los mismos datos.
+    """
+    rng = random.Random(seed)
+    ref = _reference_data()
+    User = get_user_model()
+    user, _ = User.objects.get_or_create(
+        username=f"{BENCH_CODE_PREFIX.lower()}_matching",
+        defaults={"email": "bench_matching@example.com"},
+    )
+
+    # códigos únicos: Property.save() los generaría con 1-2 queries por fila
+    start = (Property.objects.order_by("-id").values_list("id", flat=True).first() or 0) + 1
+    props = []
+    for i in range(n_properties):
+        currency, (pmin, pmax) = rng.choice(ref["currencies"])
+        operation = ref["operations"]["rent" if rng.random() < 0.2 else "sale"]
+        n = start + i
+        props.append(Property(
+            code=f"{BENCH_CODE_PREFIX}{seed}-{n:07d}"[:20],
+            codigo_unico_propiedad=f"ZB{n:09d}",
+            created_by=user,
+            operation_type=operation,
+            property_type=rng.choice(ref["ptypes"]),
+            currency=currency,
+            forma_de_pago=rng.choice(ref["payments"]),
+            district_fk=rng.choice(ref["districts"]),
+            price=Decimal(rng.randrange(pmin, pmax, 1000)),
+            bedrooms=rng.randint(1, 5),
+            bathrooms=rng.randint(1, 4),
+            garage_spaces=rng.randint(0, 3),
+            floors=rng.randint(1, 3),
+            built_area=Decimal(rng.randrange(40, 400)),
+            land_area=Decimal(rng.randrange(60, 600)),
+            antiquity_years=rng.randint(0, 40),
+            has_elevator=rng.random() < 0.5,
+            availability_status="available" if rng.random() < 0.9 else "reserved",
+        ))
+    created_props = Property.objects.bulk_create(props, batch_size=batch_size)
+
+    reqs = []
+    for _ in range(n_requirements):
+        currency, (pmin, pmax) = rng.choice(ref["currencies"])
+        price_lo, price_hi = _range(rng, rng.randrange(pmin, pmax), 0.3, 0)
+        bed_lo = rng.randint(1, 4)
+        area_lo, area_hi = _range(rng, rng.randrange(60, 300), 0.4, 0)
+        reqs.append(Requirement(
+            created_by=user,
+            operation_type=ref["operations"]["rent" if rng.random() < 0.2 else "buy"],
+            property_type=rng.choice(ref["ptypes"]),
+            currency=currency,
+            payment_method=rng.choice(ref["payments"]) if rng.random() < 0.7 else None,
+            price_min=price_lo,
+            price_max=price_hi,
+            bedrooms_min=Decimal(bed_lo),
+            bedrooms_max=Decimal(bed_lo + rng.randint(0, 2)),
+            built_area_min=area_lo,
+            built_area_max=area_hi,
+            has_elevator=rng.choice((True, False, None)),
+        ))
+    created_reqs = Requirement.objects.bulk_create(reqs, batch_size=batch_size)
+    req_ids = [r.pk for r in created_reqs]
+    if req_ids and req_ids[0] is None:
+        # backends sin RETURNING: los últimos M del usuario de benchmark
+        req_ids = sorted(
+            Requirement.objects.filter(created_by=user)
+            .order_by("-id").values_list("id", flat=True)[:n_requirements]
+        )
+
+    Through = Requirement.districts.through
+    links = []
+    for req_id in req_ids:
+        for district in rng.sample(ref["districts"], rng.randint(1, 3)):
+            links.append(Through(requirement_id=req_id, district_id=district.pk))
+    Through.objects.bulk_create(links, batch_size=batch_size)
+
+    # bulk_create no dispara signals: invalidamos a mano lo que dependa del inventario
+    bump_inventory_version()
+    bump_requirement_index_version()
+
+    if created_props and created_props[0].pk is None:
+        # backends sin RETURNING: recuperamos los ids por código
+        prop_ids = list(
+            Property.objects.filter(code__startswith=f"{BENCH_CODE_PREFIX}{seed}-")
+            .order_by("id").values_list("id", flat=True)
+        )
+    else:
+        prop_ids = [p.pk for p in created_props]
+    return {"properties": prop_ids, "requirements": req_ids}
+
+
+# -----------------------------
+# Mediciones
+# -----------------------------
+def _stats(samples: List[float]) -> Dict[str, Any]:
+    """Resumen en milisegundos de una lista de tiempos en segundos."""
+    if not samples:
+        return {"runs": 0}
+    ms = sorted(s * 1000.0 for s in samples)
+    return {
+        "runs": len(ms),
+        "total_ms": round(sum(ms), 3),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "min_ms": round(ms[0], 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+def _timed(fn: Callable[[], Any]):
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+
+def run_benchmark(
+    requirement_ids: List[int],
+    *,
+    repeat: int = 3,
+    limit: int = 20,
+    min_score: Optional[float] = None,
+    sample: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Mide el camino caliente del matching sobre `requirement_ids` (o una muestra de `sample`).
+    Cada operación se repite `repeat` veces por requerimiento; calculate_score y
+    score_property se miden por par (requerimiento, candidato).
+    """
+    reqs = list(
+        Requirement.objects
+        .filter(pk__in=requirement_ids)
+        .select_related("operation_type", "payment_method")
+        .order_by("id")
+    )
+    if sample:
+        reqs = reqs[:sample]
+    profiles = [get_requirement_profile(req) for req in reqs]
+    weights = load_weights()
+
+    timings: Dict[str, List[float]] = {
+        "build_candidate_qs": [],
+        "load_candidates": [],
+        "calculate_score": [],
+        "score_property": [],
+        "get_matches": [],
+        "persist_matches": [],
+    }
+    candidates = []
+    matched = []
+    written = 0
+    started = time.perf_counter()
+
+    for req, profile in zip(reqs, profiles):
+        # build_candidate_qs es lazy: medimos armar + evaluar el queryset
+        cands = []
+        for _ in range(repeat):
+            elapsed, cands = _timed(lambda: list(build_candidate_qs(profile)))
+            timings["build_candidate_qs"].append(elapsed)
+        candidates.append(len(cands))
+
+        # lo que usa get_matches: snapshot en memoria (o SQL si MATCHING_SNAPSHOT está apagado)
+        for _ in range(repeat):
+            elapsed, _ = _timed(lambda: load_candidates(profile))
+            timings["load_candidates"].append(elapsed)
+
+        for prop in cands:
+            elapsed, _ = _timed(lambda: calculate_score(profile, prop, weights))
+            timings["calculate_score"].append(elapsed)
+            elapsed, _ = _timed(lambda: matching.score_property(req, prop, weights, profile=profile))
+            timings["score_property"].append(elapsed)
+
+        results = []
+        for _ in range(repeat):
+            elapsed, results = _timed(lambda: get_matches(profile, limit=limit, min_score=min_score, weights=weights))
+            timings["get_matches"].append(elapsed)
+        matched.append(len(results))
+
+        # una sola vez: la segunda pasada no escribe nada (el diff sale vacío)
+        elapsed, res = _timed(lambda: persist_requirement_matches(req, results, notify=False))
+        timings["persist_matches"].append(elapsed)
+        written += res["created"] + res["updated"]
+
+    total = time.perf_counter() - started
+    return {
+        "meta": {
+            "generated_at": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "requirements": len(reqs),
+            "repeat": repeat,
+            "limit": limit,
+            "min_score": min_score,
+        },
+        "candidates": {
+            "total": int(sum(candidates)),
+            "mean": round(statistics.fmean(candidates), 2) if candidates else 0,
+            "max": max(candidates, default=0),
+        },
+        "matches": {
+            "total": int(sum(matched)),
+            "rows_written": written,
+        },
+        "timings": {name: _stats(samples) for name, samples in timings.items()},
+        "elapsed_s": round(total, 3),
+        "requirements_per_s": round(len(reqs) / total, 2) if total > 0 else None,
+    }
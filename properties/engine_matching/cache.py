@@ -0,0 +1,107 @@
+# properties/engine_matching/cache.py
+"""
+Cache de resultados de matching.
+
+Clave: (requirement_id, requirement.updated_at, versión global del inventario).
+- Editar el requerimiento (o sus distritos, ver signals.py) cambia updated_at.
+- Cualquier save/delete de Property sube la versión del inventario.
+- Cambiar MatchingWeight sube la versión de pesos (también va en la clave).
+Así nunca hay que borrar entradas: las viejas simplemente dejan de leerse y expiran.
+
+En el cache guardamos solo ids + score + details; en un hit no se corre el motor,
+solo se traen las Property del top-K con un in_bulk.
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+from django.core.cache import cache
+
+from properties.models import Property
+
+from .engine import build_candidate_qs, explain_match, get_matches, RequirementLike
+from .profile import get_requirement_profile
+from .versions import get_inventory_version, get_weights_version
+
+logger = logging.getLogger(__name__)
+
+MATCH_CACHE_TIMEOUT = 60 * 60
+
+
+def _key(prefix: str, profile, *parts) -> str:
+    stamp = profile.updated_at.timestamp() if profile.updated_at else 0
+    tail = ":".join(str(p) for p in parts)
+    versions = f"{get_inventory_version()}.{get_weights_version()}"
+    return f"engine_matching:{prefix}:{profile.id}:{stamp}:{versions}:{tail}"
+
+
+def _cache_get(key: str):
+    try:
+        return cache.get(key)
+    except Exception:
+        logger.debug("Cache no disponible al leer %s", key)
+        return None
+
+
+def _cache_set(key: str, value) -> None:
+    try:
+        cache.set(key, value, MATCH_CACHE_TIMEOUT)
+    except Exception:
+        logger.debug("Cache no disponible al guardar %s", key)
+
+
+def get_cached_matches(
+    req: RequirementLike,
+    limit: int = 20,
+    min_score: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Igual que get_matches(req, limit, min_score), pero servido desde cache si
+    ni el requerimiento ni el inventario cambiaron desde el último cálculo.
+    """
+    profile = get_requirement_profile(req)
+    if profile.id is None:
+        return get_matches(profile, limit=limit, min_score=min_score)
+
+    key = _key("top", profile, limit, min_score)
+    cached = _cache_get(key)
+
+    if cached is None:
+        results = get_matches(profile, limit=limit, min_score=min_score)
+        _cache_set(key, [(r["property"].id, r["score"], r["details"]) for r in results])
+        return results
+
+    # hit: solo traemos las propiedades (mismo select_related que el motor)
+    props = build_candidate_qs(profile).in_bulk([prop_id for prop_id, _, _ in cached])
+    results = []
+    for prop_id, score, details in cached:
+        prop = props.get(prop_id)
+        if prop is None:
+            continue
+        results.append({"property": prop, "score": score, "details": details})
+    return results
+
+
+def _pair_score(profile, prop: Property) -> Optional[Dict[str, Any]]:
+    sc = explain_match(profile, prop)
+    return {"score": sc["score"], "details": sc["details"]} if sc["admitted"] else None
+
+
+def get_cached_score(req: RequirementLike, prop: Property) -> Optional[Dict[str, Any]]:
+    """
+    {"score", "details"} de un solo par, o None si la propiedad no pasa los hard filters.
+    Mismas reglas de invalidación que get_cached_matches. Solo evalúa este par
+    (explain_match), nunca el set completo de candidatos.
+    """
+    profile = get_requirement_profile(req)
+    if profile.id is None or prop.pk is None:
+        return _pair_score(profile, prop)
+
+    key = _key("pair", profile, prop.pk)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached.get("sc")
+
+    sc = _pair_score(profile, prop)
+    # envolvemos en un dict para distinguir "no admite" (None) de un miss
+    _cache_set(key, {"sc": sc})
+    return sc
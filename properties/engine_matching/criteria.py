@@ -1,5 +1,7 @@
 # properties/engine_matching/criteria.py
-from typing import Optional, Tuple
+from typing import Mapping, Optional, Tuple
+
+import numpy as np
 
 Range = Tuple[Optional[float], Optional[float]]  # (min, max)
 
@@ -70,7 +72,146 @@ def proximity_score(value: Optional[float], mn: Optional[float], mx: Optional[fl
     return max(0.0, 1 - (diff / mn) * 0.5)
 
 
+def tolerance_band(mn: Optional[float], mx: Optional[float], floor: Optional[float]) -> Optional[Range]:
+    """
+    Inverso de proximity_score: (lo, hi) fuera del cual el subscore queda < floor.
+    - lo/hi None => sin cota por ese lado
+    - None => el piso no descarta nada (floor <= 0, o rango sin cotas positivas)
+    Ej: max=100, floor=0.5 -> hi=200 (a partir de ahí el score baja de 0.5).
+    """
+    if floor is None or floor <= 0:
+        return None
+    slack = 2 * (1 - min(float(floor), 1.0))
+
+    lo = mn * (1 - slack) if mn is not None and mn > 0 and slack < 1 else None
+    hi = mx * (1 + slack) if mx is not None and mx > 0 else None
+    if lo is None and hi is None:
+        return None
+    return (lo, hi)
+
+
 def boolean_score(req_value: bool, prop_value: Optional[bool]) -> float:
     if prop_value is None:
         return 0.5
-    return 1.0 if req_value == prop_value else 0.1
\ No newline at end of file
+    return 1.0 if req_value == prop_value else 0.1
+
+
+# -----------------------------
+# Versiones vectorizadas (batch)
+# -----------------------------
+def proximity_score_array(values: np.ndarray, mn: Optional[float], mx: Optional[float]) -> np.ndarray:
+    """
+    Igual que `proximity_score` pero sobre un array completo de candidatos.
+    - NaN (valor None en BD) => 0.5 neutral
+    - Misma aritmética que la versión escalar para que los scores coincidan.
+    """
+    v = np.asarray(values, dtype=float)
+    out = np.full(v.shape, 0.5)
+    known = ~np.isnan(v)
+
+    if mn is None and mx is None:
+        return out
+
+    with np.errstate(invalid="ignore"):
+        if mn is not None and mx is None:
+            inside = known & (v >= mn)
+            below = known & ~inside
+            out[inside] = 1.0
+            out[below] = np.maximum(0.0, 1 - ((mn - v[below]) / mn) * 0.5)
+            return out
+
+        if mn is None and mx is not None:
+            inside = known & (v <= mx)
+            above = known & ~inside
+            out[inside] = 1.0
+            out[above] = np.maximum(0.0, 1 - ((v[above] - mx) / mx) * 0.5)
+            return out
+
+        above = known & (v > mx)
+        below = known & (v < mn) & ~above
+        inside = known & ~above & ~below
+        out[inside] = 1.0
+        out[above] = np.maximum(0.0, 1 - ((v[above] - mx) / mx) * 0.5)
+        out[below] = np.maximum(0.0, 1 - ((mn - v[below]) / mn) * 0.5)
+    return out
+
+
+# -----------------------------
+# Conjuntos de tokens (amenidades) como bitsets
+# -----------------------------
+def encode_tokens(ids) -> str:
+    """{12, 3, 7} -> "3 7 12" (formato de Property.amenity_tokens)."""
+    return " ".join(str(i) for i in sorted(set(ids)))
+
+
+def decode_tokens(value) -> frozenset:
+    return frozenset(int(t) for t in (value or "").split())
+
+
+def token_coverage(tokens: frozenset, wanted: frozenset, n_wanted: int) -> float:
+    """
+    Qué fracción de lo pedido tiene la propiedad (lo que tenga de más no resta).
+    - n_wanted cuenta también los pedidos que no están en el vocabulario (ninguna propiedad los tiene)
+    - propiedad sin tokens => 0.5 neutral (sin dato)
+    """
+    if not tokens:
+        return 0.5
+    return len(tokens & wanted) / n_wanted
+
+
+def token_bitset(values, position: Optional[Mapping[int, int]] = None, words: int = 1) -> np.ndarray:
+    """
+    Strings de encode_tokens -> matriz uint64 (n, words).
+    - con `position` (amenities.TokenIndex.position) el bit de cada token es su posición
+      densa, el ancho alcanza para todo el vocabulario y los ids que no están se ignoran
+    - sin `position` el bit es el id
+    `words` es el ancho mínimo; crece si algún bit no entra.
+    """
+    decoded = [decode_tokens(v) for v in values]
+    if position is not None:
+        decoded = [[position[i] for i in s if i in position] for s in decoded]
+        words = max(words, (len(position) + 63) // 64)
+    counts = np.fromiter((len(s) for s in decoded), dtype=np.int64, count=len(decoded))
+    ids = np.fromiter((i for s in decoded for i in s), dtype=np.int64, count=int(counts.sum()))
+    if len(ids):
+        words = max(words, int(ids.max()) // 64 + 1)
+
+    bits = np.zeros((len(decoded), words), dtype=np.uint64)
+    rows = np.repeat(np.arange(len(decoded)), counts)
+    np.bitwise_or.at(bits, (rows, ids >> 6), np.left_shift(np.uint64(1), (ids & 63).astype(np.uint64)))
+    return bits
+
+
+def concat_column(*parts: np.ndarray) -> np.ndarray:
+    """Como np.concatenate; los bitsets de distinto ancho se completan con ceros."""
+    if parts[0].ndim == 2:
+        width = max(p.shape[1] for p in parts)
+        parts = tuple(np.pad(p, ((0, 0), (0, width - p.shape[1]))) for p in parts)
+    return np.concatenate(parts)
+
+
+def _popcount(bits: np.ndarray) -> np.ndarray:
+    """Bits en 1 por fila."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits).sum(axis=1, dtype=np.int64)
+    return np.unpackbits(bits.view(np.uint8), axis=1).sum(axis=1, dtype=np.int64)
+
+
+def token_coverage_array(
+    bits: np.ndarray,
+    wanted: frozenset,
+    n_wanted: int,
+    position: Optional[Mapping[int, int]] = None,
+) -> np.ndarray:
+    """
+    Igual que `token_coverage` sobre la matriz de token_bitset: AND + popcount por fila.
+    `position` debe ser el mismo con el que se armó `bits`.
+    """
+    words = bits.shape[1]
+    if position is not None:
+        wanted = frozenset(position[i] for i in wanted if i in position)
+    # pedidos fuera del ancho: ningún candidato los tiene, solo cuentan en n_wanted
+    mask = token_bitset([encode_tokens(i for i in wanted if i < 64 * words)], words=words)[0]
+    out = _popcount(bits & mask) / n_wanted
+    out[~bits.any(axis=1)] = 0.5
+    return out
@@ -1,173 +1,64 @@
 # properties/engine_matching/engine.py
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple, Union
 
+import numpy as np
 from django.db.models import QuerySet
 
-from .criteria import normalize_range, proximity_score
-from django.db.models import Q
+from .metrics import engine_metrics
+from .profile import RequirementProfile, get_requirement_profile
+from .criteria import token_bitset
+from .registry import HardFilterCriterion, get_criterion, score_columns, token_columns
+from .snapshot import property_snapshot, snapshot_enabled
+from .weights import field_weights
+from properties.amenities import get_token_index
 from properties.models import Property, Requirement
 
+# Todas las funciones aceptan el Requirement o su profile ya compilado.
+RequirementLike = Union[Requirement, RequirementProfile]
+
+# FKs que leen los criterios (admits / details): con esto una Property es una sola query
+CANDIDATE_RELATED = (
+    "operation_type",
+    "property_type",
+    "property_subtype",
+    "currency",
+    "forma_de_pago",
+    "district_fk",
+)
+
 
 # -----------------------------
 # 1) SQL: hard filters
 # -----------------------------
-def build_candidate_qs(req: Requirement) -> QuerySet[Property]:
+def apply_prefilters(req: RequirementLike, qs: QuerySet[Property]) -> QuerySet[Property]:
+    """Aplica sobre `qs` el aporte SQL de cada criterio activo (registry.py)."""
+    profile = get_requirement_profile(req)
+    for name in profile.criteria:
+        qs = get_criterion(name).prefilter(profile, qs)
+    return qs
+
+
+def build_candidate_qs(req: RequirementLike) -> QuerySet[Property]:
     qs = (
         Property.objects
         .filter(is_active=True, is_draft=False)
-        .select_related(
-            "operation_type",
-            "property_type",
-            "property_subtype",
-            "currency",
-            "forma_de_pago",
-            "district_fk",
-        )
+        .select_related(*CANDIDATE_RELATED)
     )
-
-    # (A) OperationType mapping por CODE (NO name)
-    # Requirement: buy/rent ; Property: sale/rent
-    if req.operation_type_id:
-        req_code = (req.operation_type.code or "").strip().lower()
-
-        if req_code == "buy":
-            qs = qs.filter(operation_type__code="sale")
-        elif req_code == "rent":
-            qs = qs.filter(operation_type__code="rent")
-        else:
-            # fallback: mismo code si existiera (por si agregas otros)
-            qs = qs.filter(operation_type__code=req_code)
-
-    # (B) Tipo / subtipo
-    if req.property_type_id:
-        qs = qs.filter(property_type_id=req.property_type_id)
-
-    if req.property_subtype_id:
-        qs = qs.filter(
-            Q(property_subtype_id=req.property_subtype_id) | Q(property_subtype__isnull=True)
-        )
-
-    # (C) Distritos: FK real (ya NO usamos prop.district char)
-    district_ids = list(req.districts.values_list("id", flat=True))
-    if district_ids:
-        qs = qs.filter(district_fk_id__in=district_ids)
-
-    # (D) Moneda
-    if req.currency_id:
-        qs = qs.filter(currency_id=req.currency_id)
-
-    # (E) Forma de pago (Requirement.payment_method -> Property.forma_de_pago)
-    # Regla:
-    # - req CASH  -> Property CASH + cont_y_credito
-    # - req credit -> Property credit + cont_y_credito
-    # - req cont_y_credito -> Property cont_y_credito (solo)
-    if req.payment_method_id and req.payment_method:
-        req_code = (req.payment_method.code or "").strip().lower()
-
-        # Nota: normalizamos por si tienes CASH en mayúscula en DB
-        if req_code == "cash":
-            qs = qs.filter(forma_de_pago__code__in=["CASH", "cash", "cont_y_credito"])
-        elif req_code == "credit":
-            qs = qs.filter(forma_de_pago__code__in=["credit", "cont_y_credito"])
-        elif req_code == "cont_y_credito":
-            qs = qs.filter(forma_de_pago__code__in=["cont_y_credito"])
-        else:
-            # fallback: si agregas nuevos métodos
-            qs = qs.filter(forma_de_pago__code__iexact=req_code)
-
-    # (F) Estado comercial (si quieres que sea excluyente)
-    # Si NO quieres hacerlo hard filter, comenta esto.
-    qs = qs.filter(availability_status="available")
-
-    return qs
+    return apply_prefilters(req, qs)
 
 
 # -----------------------------
 # 2) Python: scoring
 # -----------------------------
-def calculate_score(req: Requirement, prop: Property) -> Dict[str, Any]:
-    active_fields = {}
-    scores = {}
-
-    # -------------------------
-    # HARD FILTERS como "peso base"
-    # -------------------------
-    # Nota: como ya filtraste en SQL, si el prop está aquí, ya cumple.
-    hard_fields = []
-
-    if req.operation_type_id:
-        hard_fields.append("operation_type")
-    if req.property_type_id:
-        hard_fields.append("property_type")
-    if req.property_subtype_id:
-        hard_fields.append("property_subtype")  # ojo: tu SQL deja pasar NULL también
-    if req.districts.exists():
-        hard_fields.append("districts")
-    if req.currency_id:
-        hard_fields.append("currency")
-    if req.payment_method_id:
-        hard_fields.append("payment_method")
-
-    # availability_status siempre lo filtras, pero solo mételo si quieres que pese
-    hard_fields.append("availability_status")
-
-    for f in hard_fields:
-        active_fields[f] = True
-        scores[f] = 1.0
-
-    # -------------------------
-    # SOFT SCORE (lo tuyo actual)
-    # -------------------------
-    pr = normalize_range(req.price_min, req.price_max)
-    if pr:
-        active_fields["price"] = True
-        scores["price"] = proximity_score(prop.price, pr[0], pr[1])
-
-    br = normalize_range(req.bedrooms_min, req.bedrooms_max)
-    if br:
-        active_fields["bedrooms"] = True
-        scores["bedrooms"] = proximity_score(prop.bedrooms, br[0], br[1])
-
-    bar = normalize_range(req.bathrooms_min, req.bathrooms_max)
-    if bar:
-        active_fields["bathrooms"] = True
-        scores["bathrooms"] = proximity_score(prop.bathrooms, bar[0], bar[1])
-
-    gr = normalize_range(req.garage_spaces_min, req.garage_spaces_max)
-    if gr:
-        active_fields["garage_spaces"] = True
-        scores["garage_spaces"] = proximity_score(prop.garage_spaces, gr[0], gr[1])
-
-    lar = normalize_range(req.land_area_min, req.land_area_max)
-    if lar:
-        active_fields["land_area"] = True
-        scores["land_area"] = proximity_score(prop.land_area, lar[0], lar[1])
-
-    bur = normalize_range(req.built_area_min, req.built_area_max)
-    if bur:
-        active_fields["built_area"] = True
-        scores["built_area"] = proximity_score(prop.built_area, bur[0], bur[1])
-
-    fr = normalize_range(req.floors_min, req.floors_max)
-    if fr:
-        active_fields["floors"] = True
-        scores["floors"] = proximity_score(prop.floors, fr[0], fr[1])
-
-    ar = normalize_range(req.antiquity_years_min, req.antiquity_years_max)
-    if ar:
-        active_fields["antiquity_years"] = True
-        scores["antiquity_years"] = proximity_score(prop.antiquity_years, ar[0], ar[1])
-
-    if req.has_elevator is not None:
-        active_fields["has_elevator"] = True
-        scores["has_elevator"] = 1.0 if req.has_elevator == prop.has_elevator else 0.1
-
-    # ✅ nunca 0 porque al menos metimos hard_fields
-    weight = 100.0 / len(active_fields)
+def _criterion_weights(profile: RequirementProfile, weights: Optional[Dict[str, float]]) -> Dict[str, float]:
+    return field_weights((get_criterion(name) for name in profile.criteria), weights)
+
 
+def _details(subscores: Dict[str, float], fw: Dict[str, float]) -> Tuple[float, Dict[str, Any]]:
     total = 0.0
     details = {}
-    for field, sub in scores.items():
+    for field, sub in subscores.items():
+        weight = fw[field]
         contribution = sub * weight
         total += contribution
         details[field] = {
@@ -175,20 +66,235 @@ def calculate_score(req: Requirement, prop: Property) -> Dict[str, Any]:
             "weight": round(weight, 2),
             "contribution": round(contribution, 2),
         }
-
+    return total, details
+
+
+def calculate_score(
+    req: RequirementLike,
+    prop: Property,
+    weights: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
+    """
+    Score 0..100 de una Property ya filtrada por SQL.
+    `weights` es el dict de load_weights(); si no viene se lee MatchingWeight.
+    """
+    profile = get_requirement_profile(req)
+    fw = _criterion_weights(profile, weights)
+
+    subscores = {name: get_criterion(name).score(profile, prop) for name in profile.criteria}
+    total, details = _details(subscores, fw)
     return {"score": round(total, 2), "details": details}
 
 
+def pair_subscores(req: RequirementLike, prop: Property) -> Dict[str, float]:
+    """
+    Subscores de una Property que NO viene del SQL: los hard filters se chequean
+    de verdad (1.0 si pasa, 0.0 si no) en vez de asumir 1.0 como calculate_score.
+    """
+    profile = get_requirement_profile(req)
+    subscores = {}
+    for name in profile.criteria:
+        criterion = get_criterion(name)
+        if isinstance(criterion, HardFilterCriterion):
+            subscores[name] = 1.0 if criterion.admits(profile, prop) else 0.0
+        else:
+            subscores[name] = criterion.score(profile, prop)
+    return subscores
+
+
+def explain_match(
+    req: RequirementLike,
+    prop: Union[Property, int],
+    weights: Optional[Dict[str, float]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Desglose de un solo par (requerimiento, propiedad) sin tocar el resto de candidatos.
+    `prop` puede ser la instancia o su id (una sola query, con CANDIDATE_RELATED).
+
+    Retorna {"score", "details", "admitted", "rejected"} o None si la propiedad no existe.
+    - admitted: pasa los hard filters (y está activa / no es borrador)
+    - rejected: filtros que no pasa; los hard filters van con subscore 0 en details
+    Si admitted, score/details son idénticos a calculate_score.
+    """
+    if not isinstance(prop, Property):
+        prop = Property.objects.select_related(*CANDIDATE_RELATED).filter(pk=prop).first()
+        if prop is None:
+            return None
+
+    profile = get_requirement_profile(req)
+    subscores = pair_subscores(profile, prop)
+    total, details = _details(subscores, _criterion_weights(profile, weights))
+
+    # incluye los rangos con tolerance band (MATCHING_RANGE_FLOORS), que también filtran
+    rejected = [name for name in profile.criteria if not get_criterion(name).admits(profile, prop)]
+    if not prop.is_active or prop.is_draft:
+        rejected.insert(0, "is_active")
+    return {
+        "score": round(total, 2),
+        "details": details,
+        "admitted": not rejected,
+        "rejected": rejected,
+    }
+
+
+# -----------------------------
+# 3) Batch: scoring vectorizado
+# -----------------------------
+def load_candidate_arrays(qs: QuerySet[Property]) -> Dict[str, np.ndarray]:
+    """
+    Trae los candidatos como columnas (values_list) en vez de instanciar Property.
+    - "id" -> int64
+    - columnas numéricas -> float64 (None => NaN, bool => 1.0/0.0)
+    - columnas de tokens -> bitset uint64 (n, words), bits según get_token_index()
+    """
+    columns = score_columns()
+    tokens = token_columns()
+    rows = list(qs.values_list("id", *columns, *tokens))
+    n = len(columns) + 1
+    numeric = [r[:n] for r in rows] if tokens else rows
+    matrix = np.array(numeric, dtype=float).reshape(-1, n)
+
+    arrays = {"id": matrix[:, 0].astype(np.int64)}
+    for i, field in enumerate(columns, start=1):
+        arrays[field] = matrix[:, i]
+    for i, field in enumerate(tokens, start=n):
+        arrays[field] = token_bitset([r[i] for r in rows], get_token_index().position)
+    return arrays
+
+
+def load_candidates(req: RequirementLike) -> Dict[str, np.ndarray]:
+    """
+    Arrays de candidatos (mismo formato que load_candidate_arrays): del snapshot
+    en memoria si está activo (settings.MATCHING_SNAPSHOT), si no por SQL.
+    """
+    return _load_candidates(get_requirement_profile(req))[0]
+
+
+def _load_candidates(profile: RequirementProfile) -> Tuple[Dict[str, np.ndarray], str, Optional[int]]:
+    """(arrays, origen, tamaño del catálogo o None si no se conoce sin otra query)."""
+    if snapshot_enabled():
+        state = property_snapshot.current()
+        arrays = property_snapshot.candidate_arrays(profile, state)
+        if arrays is not None:
+            return arrays, "snapshot", len(state)
+    return load_candidate_arrays(build_candidate_qs(profile)), "sql", None
+
+
+def calculate_scores_batch(
+    req: RequirementLike,
+    arrays: Dict[str, np.ndarray],
+    weights: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
+    """
+    Misma regla que calculate_score, pero para todo el set de candidatos en una pasada.
+
+    Retorna:
+    {
+        "ids": array de property ids,
+        "score": array de totales (sin redondear),
+        "subscores": {field: array | float},   # float para hard filters (1.0)
+        "weights": {field: peso normalizado},
+    }
+    Usa batch_details(batch, i) para armar el dict "details" de una fila.
+    """
+    profile = get_requirement_profile(req)
+    fw = _criterion_weights(profile, weights)
+    ids = arrays["id"]
+
+    subscores: Dict[str, Any] = {
+        name: get_criterion(name).score_array(profile, arrays) for name in profile.criteria
+    }
+
+    total = np.zeros(len(ids))
+    for field, sub in subscores.items():
+        total = total + sub * fw[field]
+
+    return {"ids": ids, "score": total, "subscores": subscores, "weights": fw}
+
+
+def batch_details(batch: Dict[str, Any], i: int) -> Dict[str, Any]:
+    """Arma {"score", "details"} (mismo formato que calculate_score) para la fila i del batch."""
+    subscores = {
+        field: float(sub if np.isscalar(sub) else sub[i])
+        for field, sub in batch["subscores"].items()
+    }
+    _, details = _details(subscores, batch["weights"])
+    return {"score": round(float(batch["score"][i]), 2), "details": details}
+
+
+def top_k_indices(scores: np.ndarray, k: int, min_score: Optional[float] = None) -> np.ndarray:
+    """
+    Índices de los k mejores scores (desc) sin ordenar todo el array.
+    - np.partition para ubicar el k-ésimo score (O(n))
+    - solo se ordenan los k seleccionados
+    - empates: gana el que vino primero (igual que un sort estable)
+    - min_score: corte previo sobre el score redondeado (como se persiste)
+    """
+    idx = np.arange(len(scores))
+    if min_score is not None:
+        idx = idx[np.round(scores, 2) >= min_score]
+    if k <= 0 or not len(idx):
+        return idx[:0]
+
+    s = scores[idx]
+    if len(s) > k:
+        kth = -np.partition(-s, k - 1)[k - 1]
+        above = np.flatnonzero(s > kth)
+        ties = np.flatnonzero(s == kth)[: k - len(above)]
+        sel = np.concatenate([above, ties])
+    else:
+        sel = np.arange(len(s))
+
+    return idx[sel[np.argsort(-s[sel], kind="stable")]]
+
+
 # -----------------------------
-# 3) Entry point
+# 4) Entry point
 # -----------------------------
-def get_matches(req: Requirement, limit: int = 20) -> List[Dict[str, Any]]:
-    qs = build_candidate_qs(req)
+def get_matches(
+    req: RequirementLike,
+    limit: int = 20,
+    min_score: Optional[float] = None,
+    weights: Optional[Dict[str, float]] = None,
+) -> List[Dict[str, Any]]:
+    profile = get_requirement_profile(req)
+    qs = build_candidate_qs(profile)
+    call = engine_metrics.start(profile)
+
+    for attempt in range(2):
+        # columnas -> numpy (sin instanciar Property por candidato)
+        arrays, source, catalog = _load_candidates(profile)
+        if call:
+            call.lap("load")
+        batch = calculate_scores_batch(profile, arrays, weights)
+
+        order = top_k_indices(batch["score"], limit, min_score=min_score)
+        if call:
+            call.lap("score")
+
+        # solo instanciamos las Property que realmente se devuelven
+        top_ids = [int(batch["ids"][i]) for i in order]
+        props = qs.in_bulk(top_ids)
+        if call:
+            call.lap("fetch")
+
+        # el SQL manda: si el snapshot tenía filas viejas, se releen y se puntúa otra vez
+        missing = [prop_id for prop_id in top_ids if prop_id not in props]
+        if not missing or attempt or not snapshot_enabled():
+            break
+        property_snapshot.reload(missing)
 
     results = []
-    for prop in qs.iterator():  # iterator() para no reventar RAM si igual vienen muchos
-        sc = calculate_score(req, prop)
+    for i, prop_id in zip(order, top_ids):
+        prop = props.get(prop_id)
+        if prop is None:
+            continue
+        sc = batch_details(batch, i)
         results.append({"property": prop, "score": sc["score"], "details": sc["details"]})
 
-    results.sort(key=lambda x: x["score"], reverse=True)
-    return results[:limit]
\ No newline at end of file
+    if call:
+        call.lap("fetch")
+        call.source, call.catalog, call.returned = source, catalog, len(results)
+        call.scores(batch["score"])
+        engine_metrics.record(call)
+    return results
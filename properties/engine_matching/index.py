@@ -0,0 +1,123 @@
+# properties/engine_matching/index.py
+"""
+Índice invertido de hard filters: Property -> ids de Requirement.
+
+Clave: (operation code, property_type_id, district_id, currency_id, payment code)
+tal como los guarda el Requirement (codes en lower). Un filtro vacío en el
+requerimiento se indexa como None (comodín).
+
+Para una Property basta con probar las combinaciones (valor de la propiedad | None)
+de cada dimensión: son unas pocas decenas de lookups en un dict, sin tocar la BD.
+El resultado es un superset; el chequeo exacto sigue siendo RequirementProfile.admits().
+
+Invalidación: cada cambio en Requirement (save/delete/districts) sube una versión
+compartida en el cache de Django. Cada proceso reconstruye su índice (2 queries)
+en el siguiente lookup si su versión quedó atrás.
+"""
+import itertools
+import threading
+from typing import Dict, Optional, Set, Tuple
+
+from properties.models import Requirement
+
+from .profile import OPERATION_CODE_MAP, PAYMENT_CODE_MAP, requirement_codes_for
+from .versions import bump_version, get_version
+
+INDEX_VERSION_KEY = "engine_matching:requirement_index_version"
+
+IndexKey = Tuple[Optional[str], Optional[int], Optional[int], Optional[int], Optional[str]]
+
+
+def _norm_code(code: Optional[str]) -> Optional[str]:
+    code = (code or "").strip().lower()
+    return code or None
+
+
+def _current_version() -> int:
+    return get_version(INDEX_VERSION_KEY)
+
+
+def bump_requirement_index_version() -> None:
+    """Marca el índice como desactualizado en todos los procesos."""
+    if not bump_version(INDEX_VERSION_KEY):
+        # sin cache compartido: al menos este proceso se reconstruye
+        requirement_index.clear()
+
+
+class RequirementIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[IndexKey, Set[int]] = {}
+        self._version: Optional[int] = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = {}
+            self._version = None
+
+    def build(self) -> None:
+        """Reconstruye desde la BD: requerimientos activos + su m2m de distritos."""
+        version = _current_version()
+
+        districts: Dict[int, list] = {}
+        through = Requirement.districts.through
+        for req_id, district_id in (
+            through.objects
+            .filter(requirement__is_active=True)
+            .values_list("requirement_id", "district_id")
+        ):
+            districts.setdefault(req_id, []).append(district_id)
+
+        entries: Dict[IndexKey, Set[int]] = {}
+        for req_id, op_code, type_id, currency_id, pay_code in (
+            Requirement.objects
+            .filter(is_active=True)
+            .values_list(
+                "id",
+                "operation_type__code",
+                "property_type_id",
+                "currency_id",
+                "payment_method__code",
+            )
+        ):
+            op_code = _norm_code(op_code)
+            pay_code = _norm_code(pay_code)
+            for district_id in districts.get(req_id) or (None,):
+                key = (op_code, type_id, district_id, currency_id, pay_code)
+                entries.setdefault(key, set()).add(req_id)
+
+        with self._lock:
+            self._entries = entries
+            self._version = version
+
+    def _ensure_fresh(self) -> None:
+        if self._version is None or self._version != _current_version():
+            self.build()
+
+    def candidates_for(self, prop) -> Set[int]:
+        """Ids de requerimientos activos que podrían admitir `prop` (superset)."""
+        self._ensure_fresh()
+
+        ops: Set[Optional[str]] = {None}
+        if prop.operation_type_id:
+            ops |= requirement_codes_for(prop.operation_type.code or "", OPERATION_CODE_MAP)
+
+        pays: Set[Optional[str]] = {None}
+        if prop.forma_de_pago_id:
+            pays |= requirement_codes_for(prop.forma_de_pago.code or "", PAYMENT_CODE_MAP)
+
+        types = {None, prop.property_type_id}
+        districts = {None, prop.district_fk_id}
+        currencies = {None, prop.currency_id}
+
+        entries = self._entries
+        found: Set[int] = set()
+        for key in itertools.product(ops, types, districts, currencies, pays):
+            ids = entries.get(key)
+            if ids:
+                found |= ids
+        return found
+
+
+# Instancia por proceso
+requirement_index = RequirementIndex()
@@ -0,0 +1,220 @@
+# properties/engine_matching/metrics.py
+"""
+Instrumentación del camino caliente del matching.
+
+Por cada get_matches:
+- tiempos por etapa: load (candidatos, snapshot o SQL), score (scoring vectorizado
+  + top-k) y fetch (in_bulk de las Property devueltas); persist_matches suma "persist".
+- candidatos antes (catálogo) y después de los hard filters.
+- histograma de scores de todos los candidatos (bins de 10 puntos).
+
+Se acumula en memoria del proceso (engine_metrics; lo expone la vista
+matching_metrics) y cada llamada deja una línea JSON en el logger de este módulo:
+INFO normal, WARNING si fue lenta (MATCHING_SLOW_MS) o "ancha" (después de los
+hard filters queda más de MATCHING_WIDE_RATIO del catálogo, p.ej. sin distrito).
+Los requerimientos más anchos se guardan para revisarlos.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+
+from .registry import HardFilterCriterion, iter_criteria
+
+logger = logging.getLogger(__name__)
+
+SCORE_BINS = np.linspace(0.0, 100.0, 11)
+TIMING_WINDOW = 1000   # últimos N tiempos por etapa (p50 / p95)
+WIDE_TOP = 20
+WIDE_MIN_CANDIDATES = 200
+
+
+def metrics_enabled() -> bool:
+    return getattr(settings, "MATCHING_METRICS", True)
+
+
+def _setting(name: str, default: float) -> float:
+    return float(getattr(settings, name, default))
+
+
+class MatchCall:
+    """Lo que se mide en una llamada a get_matches (ver EngineMetrics.record)."""
+
+    __slots__ = ("requirement_id", "missing_filters", "source", "catalog", "candidates",
+                 "returned", "timings", "histogram", "_mark")
+
+    def __init__(self, profile):
+        self.requirement_id = profile.id
+        # hard filters que el requerimiento no usa: candidatos a escaneo de todo el catálogo
+        self.missing_filters = [
+            c.name for c in iter_criteria()
+            if isinstance(c, HardFilterCriterion) and c.name not in profile.criteria
+        ]
+        self.source = None
+        self.catalog: Optional[int] = None
+        self.candidates = 0
+        self.returned = 0
+        self.timings: Dict[str, float] = {}
+        self.histogram = None
+        self._mark = time.perf_counter()
+
+    def lap(self, stage: str) -> None:
+        """Suma a `stage` el tiempo desde el lap anterior."""
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + (now - self._mark)
+        self._mark = now
+
+    def scores(self, scores: np.ndarray) -> None:
+        self.candidates = len(scores)
+        self.histogram = np.histogram(np.clip(scores, 0.0, 100.0), bins=SCORE_BINS)[0]
+
+    @property
+    def elapsed(self) -> float:
+        return sum(self.timings.values())
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "requirement": self.requirement_id,
+            "source": self.source,
+            "catalog": self.catalog,
+            "candidates": self.candidates,
+            "returned": self.returned,
+            "missing_filters": self.missing_filters,
+            "ms": {stage: round(s * 1000.0, 3) for stage, s in self.timings.items()},
+        }
+
+
+class _StageStats:
+    __slots__ = ("count", "total", "max", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=TIMING_WINDOW)
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def as_dict(self) -> Dict[str, Any]:
+        if not self.count:
+            return {"count": 0}
+        recent = np.fromiter(self.recent, dtype=float) * 1000.0
+        return {
+            "count": self.count,
+            "total_ms": round(self.total * 1000.0, 3),
+            "mean_ms": round(self.total * 1000.0 / self.count, 3),
+            "p50_ms": round(float(np.percentile(recent, 50)), 3),
+            "p95_ms": round(float(np.percentile(recent, 95)), 3),
+            "max_ms": round(self.max * 1000.0, 3),
+        }
+
+
+class EngineMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = time.time()
+            self.calls = 0
+            self.empty_calls = 0
+            self.candidates_total = 0
+            self.candidates_max = 0
+            self.catalog_total = 0
+            self.catalog_calls = 0
+            self.stages: Dict[str, _StageStats] = {}
+            self.histogram = np.zeros(len(SCORE_BINS) - 1, dtype=np.int64)
+            self.wide: Dict[int, Dict[str, Any]] = {}
+
+    # -----------------------------
+    # Registro
+    # -----------------------------
+    def start(self, profile) -> Optional[MatchCall]:
+        return MatchCall(profile) if metrics_enabled() else None
+
+    def observe(self, stage: str, seconds: float) -> None:
+        if not metrics_enabled():
+            return
+        with self._lock:
+            self.stages.setdefault(stage, _StageStats()).add(seconds)
+
+    def record(self, call: Optional[MatchCall]) -> None:
+        if call is None:
+            return
+        wide = (
+            call.catalog
+            and call.candidates >= WIDE_MIN_CANDIDATES
+            and call.candidates / call.catalog >= _setting("MATCHING_WIDE_RATIO", 0.5)
+        )
+        with self._lock:
+            self.calls += 1
+            self.empty_calls += call.candidates == 0
+            self.candidates_total += call.candidates
+            self.candidates_max = max(self.candidates_max, call.candidates)
+            if call.catalog is not None:
+                self.catalog_total += call.catalog
+                self.catalog_calls += 1
+            for stage, seconds in call.timings.items():
+                self.stages.setdefault(stage, _StageStats()).add(seconds)
+            if call.histogram is not None:
+                self.histogram += call.histogram
+            if wide:
+                self._add_wide(call)
+
+        payload = call.as_dict()
+        slow = call.elapsed * 1000.0 >= _setting("MATCHING_SLOW_MS", 500)
+        level = logging.WARNING if (wide or slow) else logging.INFO
+        if logger.isEnabledFor(level):
+            payload.update(wide=bool(wide), slow=slow)
+            logger.log(level, "get_matches %s", json.dumps(payload, separators=(",", ":")))
+
+    def _add_wide(self, call: MatchCall) -> None:
+        self.wide[call.requirement_id] = {
+            "requirement": call.requirement_id,
+            "candidates": call.candidates,
+            "catalog": call.catalog,
+            "ratio": round(call.candidates / call.catalog, 3),
+            "missing_filters": call.missing_filters,
+            "ms": round(call.elapsed * 1000.0, 3),
+        }
+        if len(self.wide) > WIDE_TOP:
+            narrowest = min(self.wide.values(), key=lambda w: w["candidates"])
+            del self.wide[narrowest["requirement"]]
+
+    # -----------------------------
+    # Lectura
+    # -----------------------------
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            labels = [f"{int(lo)}-{int(hi)}" for lo, hi in zip(SCORE_BINS[:-1], SCORE_BINS[1:])]
+            wide: List[Dict[str, Any]] = sorted(self.wide.values(), key=lambda w: -w["candidates"])
+            return {
+                "pid": os.getpid(),
+                "since": self.started_at,
+                "calls": self.calls,
+                "empty_calls": self.empty_calls,
+                "candidates": {
+                    "mean": round(self.candidates_total / self.calls, 2) if self.calls else 0,
+                    "max": self.candidates_max,
+                    "catalog_mean": (
+                        round(self.catalog_total / self.catalog_calls, 2) if self.catalog_calls else None
+                    ),
+                },
+                "timings": {stage: stats.as_dict() for stage, stats in sorted(self.stages.items())},
+                "score_histogram": dict(zip(labels, self.histogram.tolist())),
+                "wide_requirements": wide,
+            }
+
+
+engine_metrics = EngineMetrics()
@@ -0,0 +1,249 @@
+# properties/engine_matching/persistence.py
+"""
+Persistencia de RequirementMatch en bloque.
+
+Un solo camino para guardar el top-K de uno o varios requerimientos (persist_matches)
+o filas sueltas del matching inverso (upsert_matches):
+1) diff contra las filas existentes (1 query)
+2) bulk delete de las que salieron, bulk update de las que siguen, bulk insert de las nuevas
+3) notificaciones en un solo batch (on_properties_matched)
+
+bulk_* no dispara post_save, así que requirement_match_saved no corre aquí:
+las notificaciones se emiten explícitamente al final, con la misma regla.
+"""
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from notifications.events import on_properties_matched
+from properties.models import RequirementMatch
+
+from .metrics import engine_metrics
+
+logger = logging.getLogger(__name__)
+
+# (requirement_id, property_id, score, details)
+MatchRow = Tuple[int, int, float, Dict[str, Any]]
+
+UPDATE_FIELDS = ["score", "details", "computed_at"]
+
+
+def rows_from_results(requirement_id: int, results: Iterable[Dict[str, Any]]) -> List[MatchRow]:
+    """Convierte la salida de get_matches ({"property","score","details"}) a filas."""
+    return [
+        (
+            requirement_id,
+            item["property"].id,
+            round(float(item.get("score") or 0), 2),
+            item.get("details") or {},
+        )
+        for item in results
+    ]
+
+
+def persist_matches(
+    scored: Dict[int, List[MatchRow]],
+    *,
+    batch_size: int = 500,
+    notify: bool = True,
+) -> Dict[str, Any]:
+    """
+    Reemplaza los RequirementMatch de cada requerimiento en `scored` por sus filas.
+    Un requerimiento con lista vacía queda sin matches.
+
+    Retorna {"created", "updated", "deleted", "saved": [(req_id, prop_id, score), ...]}.
+    """
+    req_ids = list(scored.keys())
+    if not req_ids:
+        return {"created": 0, "updated": 0, "deleted": 0, "saved": []}
+
+    started = time.perf_counter()
+    existing = list(
+        RequirementMatch.objects
+        .filter(requirement_id__in=req_ids)
+        .values_list("id", "requirement_id", "property_id")
+    )
+    pk_by_pair = {(r, p): pk for pk, r, p in existing}
+
+    keep, to_create, to_update, saved = _diff(
+        (row for rows in scored.values() for row in rows), pk_by_pair
+    )
+
+    stale_ids = [pk for (r, p), pk in pk_by_pair.items() if (r, p) not in keep]
+
+    _write(to_create, to_update, stale_ids, req_ids, keep, batch_size=batch_size, notify=notify)
+    engine_metrics.observe("persist", time.perf_counter() - started)
+    return {
+        "created": len(to_create),
+        "updated": len(to_update),
+        "deleted": len(stale_ids),
+        "saved": saved,
+    }
+
+
+def upsert_matches(
+    rows: Iterable[MatchRow],
+    *,
+    delete_ids: Iterable[int] = (),
+    batch_size: int = 500,
+    notify: bool = True,
+) -> Dict[str, Any]:
+    """
+    Inserta/actualiza solo estas filas y borra `delete_ids`, sin tocar el resto de
+    matches de cada requerimiento (persist_matches, en cambio, reemplaza el top-K).
+    Lo usa el matching inverso: pocas propiedades contra muchos requerimientos, así
+    que el diff se consulta por property_id.
+
+    Retorna {"created", "updated", "deleted", "saved": [(req_id, prop_id, score), ...]}.
+    """
+    rows = list(rows)
+    delete_ids = list(delete_ids)
+    if not rows and not delete_ids:
+        return {"created": 0, "updated": 0, "deleted": 0, "saved": []}
+
+    started = time.perf_counter()
+    pairs = {(r, p) for r, p, _, _ in rows}
+    pk_by_pair = {
+        (r, p): pk
+        for pk, r, p in (
+            RequirementMatch.objects
+            .filter(property_id__in={p for _, p in pairs})
+            .values_list("id", "requirement_id", "property_id")
+        )
+        if (r, p) in pairs
+    } if pairs else {}
+
+    keep, to_create, to_update, saved = _diff(rows, pk_by_pair)
+    _write(to_create, to_update, delete_ids, list({r for r, _ in keep}), keep, batch_size=batch_size, notify=notify)
+    engine_metrics.observe("persist", time.perf_counter() - started)
+    return {
+        "created": len(to_create),
+        "updated": len(to_update),
+        "deleted": len(delete_ids),
+        "saved": saved,
+    }
+
+
+def _diff(rows: Iterable[MatchRow], pk_by_pair: Dict[Tuple[int, int], int]):
+    """(keep, to_create, to_update, saved): filas con pk existente van a update, el resto a insert."""
+    now = timezone.now()
+    keep: Set[Tuple[int, int]] = set()
+    to_create: List[RequirementMatch] = []
+    to_update: List[RequirementMatch] = []
+    saved = []
+    for r, p, score, details in rows:
+        if (r, p) in keep:
+            continue
+        keep.add((r, p))
+        obj = RequirementMatch(
+            pk=pk_by_pair.get((r, p)),
+            requirement_id=r,
+            property_id=p,
+            score=score,
+            details=details,
+            computed_at=now,
+        )
+        (to_update if obj.pk else to_create).append(obj)
+        saved.append((r, p, score))
+    return keep, to_create, to_update, saved
+
+
+def _write(
+    to_create: List[RequirementMatch],
+    to_update: List[RequirementMatch],
+    delete_ids: List[int],
+    req_ids: List[int],
+    keep: Set[Tuple[int, int]],
+    *,
+    batch_size: int,
+    notify: bool,
+) -> None:
+    """bulk delete + bulk update + bulk insert en una transacción; notificaciones en un batch tras el commit."""
+    with transaction.atomic():
+        if delete_ids:
+            RequirementMatch.objects.filter(pk__in=delete_ids).delete()
+        if to_update:
+            RequirementMatch.objects.bulk_update(to_update, UPDATE_FIELDS, batch_size=batch_size)
+        if to_create:
+            if connection.features.supports_update_conflicts_with_target:
+                # si otro proceso insertó el mismo par entre el diff y aquí, se actualiza
+                RequirementMatch.objects.bulk_create(
+                    to_create,
+                    batch_size=batch_size,
+                    update_conflicts=True,
+                    unique_fields=["requirement", "property"],
+                    update_fields=UPDATE_FIELDS,
+                )
+            else:
+                _create_or_update(to_create, batch_size)
+
+        if notify and keep:
+            transaction.on_commit(lambda: _notify(req_ids, keep))
+
+
+def _create_or_update(to_create: List[RequirementMatch], batch_size: int) -> None:
+    """
+    bulk_create sin upsert (MSSQL): si otro proceso (worker de la cola + matching inverso)
+    insertó un par del lote entre el diff y aquí, el unique de (requirement, property) falla.
+    Ese lote se reintenta: los pares que ya existen van a update, el resto a insert.
+    """
+    for start in range(0, len(to_create), batch_size):
+        chunk = to_create[start:start + batch_size]
+        try:
+            with transaction.atomic():
+                RequirementMatch.objects.bulk_create(chunk)
+            continue
+        except IntegrityError:
+            pass
+
+        pairs = {(obj.requirement_id, obj.property_id) for obj in chunk}
+        pk_by_pair = {
+            (r, p): pk
+            for pk, r, p in (
+                RequirementMatch.objects
+                .filter(requirement_id__in={r for r, _ in pairs}, property_id__in={p for _, p in pairs})
+                .values_list("id", "requirement_id", "property_id")
+            )
+            if (r, p) in pairs
+        }
+        to_update, retry = [], []
+        for obj in chunk:
+            obj.pk = pk_by_pair.get((obj.requirement_id, obj.property_id))
+            obj._state.adding = obj.pk is None
+            (to_update if obj.pk else retry).append(obj)
+        if to_update:
+            RequirementMatch.objects.bulk_update(to_update, UPDATE_FIELDS)
+        if retry:
+            RequirementMatch.objects.bulk_create(retry)
+
+
+def persist_requirement_matches(
+    requirement,
+    results: Iterable[Dict[str, Any]],
+    *,
+    notify: bool = True,
+) -> Dict[str, Any]:
+    """Atajo para un solo requerimiento con la salida de get_matches / get_matches_for_requirement."""
+    return persist_matches({requirement.pk: rows_from_results(requirement.pk, results)}, notify=notify)
+
+
+def _notify(req_ids: List[int], pairs: Set[Tuple[int, int]]) -> None:
+    """
+    Igual que requirement_match_saved (post_save por fila), pero en batch:
+    se notifican todas las filas escritas; Notification ya deduplica por match.
+    """
+    try:
+        matches = [
+            m for m in (
+                RequirementMatch.objects
+                .filter(requirement_id__in=req_ids, property_id__in={p for _, p in pairs})
+                .select_related("requirement__created_by", "property__created_by", "property__owner")
+            )
+            if (m.requirement_id, m.property_id) in pairs
+        ]
+        on_properties_matched(matches)
+    except Exception:
+        logger.exception("Error notificando matches de requerimientos %s", req_ids[:20])
@@ -0,0 +1,215 @@
+# properties/engine_matching/profile.py
+"""
+RequirementProfile: versión "compilada" e inmutable de un Requirement.
+
+Se construye una sola vez por requerimiento (cache por id + updated_at) y
+contiene todo lo que el scoring necesita: rangos ya normalizados, criterios
+activos (ver registry.py), distritos (ids y nombres) y codes de operación / forma de pago.
+Así el motor no vuelve a tocar la BD ni a normalizar por cada candidato.
+"""
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from properties.amenities import get_token_index, token_ids, tokenize
+
+from .criteria import normalize_range
+from .registry import RANGE_CRITERIA, get_criterion, iter_criteria
+
+# Requirement: buy/rent ; Property: sale/rent
+OPERATION_CODE_MAP = {
+    "buy": "sale",
+    "rent": "rent",
+}
+
+# Requirement.payment_method -> Property.forma_de_pago (codes admitidos)
+# - req CASH  -> Property CASH + cont_y_credito
+# - req credit -> Property credit + cont_y_credito
+# - req cont_y_credito -> Property cont_y_credito (solo)
+PAYMENT_CODE_MAP = {
+    "cash": ("CASH", "cash", "cont_y_credito"),
+    "credit": ("credit", "cont_y_credito"),
+    "cont_y_credito": ("cont_y_credito",),
+}
+
+PROFILE_CACHE_SIZE = 2048
+
+
+def requirement_codes_for(prop_code: str, code_map: dict) -> set:
+    """
+    Invierte OPERATION_CODE_MAP / PAYMENT_CODE_MAP: qué codes de Requirement
+    aceptan una Property con `prop_code`. Los codes que no están en el mapa
+    usan fallback por igualdad (igual que build_candidate_qs).
+    """
+    prop_code = prop_code.strip().lower()
+    codes = set()
+    for req_code, admitted in code_map.items():
+        admitted = admitted if isinstance(admitted, tuple) else (admitted,)
+        if prop_code in (a.lower() for a in admitted):
+            codes.add(req_code)
+    if prop_code not in code_map:
+        codes.add(prop_code)
+    return codes
+
+
+class RequirementProfile:
+    __slots__ = (
+        "id",
+        "updated_at",
+        "operation_code",           # code que debe tener la Property (ya mapeado buy->sale)
+        "property_type_id",
+        "property_subtype_id",
+        "currency_id",
+        "payment_method_id",
+        "payment_method_code",      # code del requerimiento (lower)
+        "payment_codes",            # codes admitidos en Property.forma_de_pago (minúsculas), o None si es fallback iexact
+        "district_ids",             # frozenset[int]
+        "ranges",                   # {field: (min, max)} solo los activos (no modificar)
+        "has_elevator",
+        "amenity_ids",              # frozenset[int] ids de AmenityToken pedidos (los que existen)
+        "amenity_count",            # cuántas amenidades pidió (incluye las que no están en el vocabulario)
+        "vocabulary_version",       # versión de TokenIndex con la que se buscaron amenity_ids
+        "criteria",                 # tuple[str] criterios activos, en orden de registro
+    )
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RequirementProfile es inmutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("RequirementProfile es inmutable")
+
+    def __repr__(self):
+        return f"<RequirementProfile req={self.id} fields={len(self.criteria)}>"
+
+    @classmethod
+    def from_requirement(cls, req) -> "RequirementProfile":
+        operation_code = None
+        if req.operation_type_id:
+            req_code = (req.operation_type.code or "").strip().lower()
+            # fallback: mismo code si existiera (por si agregas otros)
+            operation_code = OPERATION_CODE_MAP.get(req_code, req_code)
+
+        payment_method_code = None
+        payment_codes = None
+        if req.payment_method_id and req.payment_method:
+            payment_method_code = (req.payment_method.code or "").strip().lower()
+            admitted = PAYMENT_CODE_MAP.get(payment_method_code)
+            if admitted is not None:
+                # en minúsculas, como el snapshot; sin repetir "CASH"/"cash"
+                payment_codes = tuple(dict.fromkeys(code.lower() for code in admitted))
+
+        district_ids = frozenset(req.districts.values_list("id", flat=True))
+
+        ranges = {}
+        for field, min_attr, max_attr in RANGE_CRITERIA:
+            rng = normalize_range(getattr(req, min_attr), getattr(req, max_attr))
+            if rng:
+                ranges[field] = rng
+
+        vocabulary_version = get_token_index().version
+        amenity_names = tokenize(req.amenities)
+        amenity_ids = frozenset(token_ids(amenity_names).values()) if amenity_names else frozenset()
+
+        profile = cls(
+            id=req.pk,
+            updated_at=req.updated_at,
+            operation_code=operation_code,
+            property_type_id=req.property_type_id,
+            property_subtype_id=req.property_subtype_id,
+            currency_id=req.currency_id,
+            payment_method_id=req.payment_method_id,
+            payment_method_code=payment_method_code,
+            payment_codes=payment_codes,
+            district_ids=district_ids,
+            ranges=ranges,
+            has_elevator=req.has_elevator,
+            amenity_ids=amenity_ids,
+            amenity_count=len(amenity_names),
+            vocabulary_version=vocabulary_version,
+            criteria=(),
+        )
+        # los criterios deciden si aplican a partir del resto del profile
+        # ✅ nunca vacío porque availability_status siempre está activo
+        active = tuple(c.name for c in iter_criteria() if c.is_active(profile))
+        object.__setattr__(profile, "criteria", active)
+        return profile
+
+    @property
+    def signature(self) -> tuple:
+        """
+        Todo lo que define el set de candidatos de build_candidate_qs.
+        Dos requerimientos con la misma firma comparten la carga de candidatos.
+        """
+        return (
+            self.operation_code,
+            self.property_type_id,
+            self.property_subtype_id,
+            self.district_ids,
+            self.currency_id,
+            self.payment_method_code,
+            self.payment_codes,
+            # rangos con tolerance band en SQL (MATCHING_RANGE_FLOORS)
+            tuple(
+                key for key in (get_criterion(name).prefilter_key(self) for name in self.criteria)
+                if key is not None
+            ),
+        )
+
+    def missing_tokens_stale(self) -> bool:
+        """Pidió amenidades que no estaban en el vocabulario y el vocabulario cambió desde entonces."""
+        return len(self.amenity_ids) < self.amenity_count and self.vocabulary_version != get_token_index().version
+
+    def admits(self, prop) -> bool:
+        """
+        Versión en Python de los hard filters de build_candidate_qs, para una sola Property.
+        Útil cuando ya tienes la instancia y no quieres otra query.
+        """
+        if not prop.is_active or prop.is_draft:
+            return False
+        return all(get_criterion(name).admits(self, prop) for name in self.criteria)
+
+
+_cache: "OrderedDict[int, RequirementProfile]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_requirement_profile(req) -> RequirementProfile:
+    """
+    Devuelve el profile compilado del requerimiento (cache LRU en proceso).
+    La clave es (id, updated_at): cualquier save del Requirement invalida solo.
+    Los cambios en `districts` (m2m) tocan updated_at desde signals.py.
+    Si pidió amenidades que aún no existían, se rearma cuando crece el vocabulario.
+    """
+    if isinstance(req, RequirementProfile):
+        return req
+    if req.pk is None:
+        return RequirementProfile.from_requirement(req)
+
+    with _cache_lock:
+        profile = _cache.get(req.pk)
+        if profile is not None and profile.updated_at == req.updated_at and not profile.missing_tokens_stale():
+            _cache.move_to_end(req.pk)
+            return profile
+
+    profile = RequirementProfile.from_requirement(req)
+
+    with _cache_lock:
+        _cache[req.pk] = profile
+        _cache.move_to_end(req.pk)
+        while len(_cache) > PROFILE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return profile
+
+
+def invalidate_requirement_profile(req_id: Optional[int] = None) -> None:
+    """Saca del cache un requerimiento (o todo si req_id es None)."""
+    with _cache_lock:
+        if req_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(req_id, None)
+
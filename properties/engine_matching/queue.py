@@ -0,0 +1,189 @@
+# properties/engine_matching/queue.py
+"""
+Colas de matching en background (comando process_match_queue), una fila por objeto:
+
+- MatchRecalcJob: recálculo completo de un requerimiento editado (rematch_all); si quedó
+  inactivo, se borran sus matches.
+- PropertyMatchJob: matching inverso de una propiedad guardada (reverse.fan_out_property),
+  fuera del request que la guardó.
+
+- enqueue_requirement_recalc() / enqueue_property_fan_out(): los llaman los signals,
+  dentro de la misma transacción que la edición. Cada edición corre run_after, así
+  varias ediciones seguidas (save + save_m2m del form, por ejemplo) terminan en un solo recálculo.
+- Un objeto que se edita sin parar corre igual a los RECALC_MAX_DELAY del primer encolado
+  (o del primer pedido tras liberarse, ver _process).
+- claim_jobs(): toma un lote con un UPDATE condicional (varios workers no toman el mismo job;
+  un lock de más de RECALC_LOCK_TIMEOUT se considera abandonado).
+- Al terminar se borran solo los jobs que nadie volvió a pedir después del claim;
+  los demás se liberan y corren otra vez.
+"""
+import logging
+import os
+import socket
+import uuid
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, List
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from properties.models import MatchRecalcJob, Property, PropertyMatchJob, Requirement, RequirementMatch
+
+from .rematch import rematch_all
+from .reverse import REVERSE_MATCH_LIMIT, REVERSE_MATCH_MIN_SCORE, fan_out_property
+
+logger = logging.getLogger(__name__)
+
+RECALC_DEBOUNCE = timedelta(seconds=30)
+# un save de propiedad es una sola transacción (más el update de is_active): ventana corta
+FAN_OUT_DEBOUNCE = timedelta(seconds=5)
+RECALC_MAX_DELAY = timedelta(minutes=5)
+RECALC_LOCK_TIMEOUT = timedelta(minutes=10)
+RECALC_RETRY_DELAY = timedelta(minutes=1)
+RECALC_MAX_ATTEMPTS = 5
+
+
+def _enqueue(model, field: str, obj_ids: Iterable[int], debounce: timedelta) -> None:
+    ids = {i for i in obj_ids if i}
+    if not ids:
+        return
+    now = timezone.now()
+    # una edición nueva también le da otra oportunidad a un job que venía fallando
+    values = {"requested_at": now, "run_after": now + debounce, "attempts": 0}
+    lookup = f"{field}_id"
+
+    updated = model.objects.filter(**{f"{lookup}__in": ids}).update(**values)
+    if updated == len(ids):
+        return
+
+    existing = set(model.objects.filter(**{f"{lookup}__in": ids}).values_list(lookup, flat=True))
+    for obj_id in ids - existing:
+        try:
+            with transaction.atomic():
+                model.objects.create(**{lookup: obj_id}, **values)
+        except IntegrityError:
+            # otro proceso lo creó entre el UPDATE y aquí
+            model.objects.filter(**{lookup: obj_id}).update(**values)
+
+
+def enqueue_requirement_recalc(req_ids: Iterable[int]) -> None:
+    """Pide (o pospone) el recálculo de estos requerimientos."""
+    _enqueue(MatchRecalcJob, "requirement", req_ids, RECALC_DEBOUNCE)
+
+
+def enqueue_property_fan_out(prop_ids: Iterable[int]) -> None:
+    """Pide (o pospone) el matching inverso de estas propiedades."""
+    _enqueue(PropertyMatchJob, "property", prop_ids, FAN_OUT_DEBOUNCE)
+
+
+def _worker_token() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"[:64]
+
+
+def claim_jobs(batch_size: int = 100, model=MatchRecalcJob):
+    """
+    Toma hasta `batch_size` jobs vencidos de `model`. Devuelve (token, claimed_at, jobs);
+    jobs vacío si no hay nada que hacer.
+    """
+    now = timezone.now()
+    token = _worker_token()
+    due = Q(run_after__lte=now) | Q(enqueued_at__lte=now - RECALC_MAX_DELAY, attempts=0)
+    free = Q(locked_at__isnull=True) | Q(locked_at__lt=now - RECALC_LOCK_TIMEOUT)
+
+    ids = list(
+        model.objects
+        .filter(due & free, attempts__lt=RECALC_MAX_ATTEMPTS)
+        .order_by("run_after")
+        .values_list("id", flat=True)[:batch_size]
+    )
+    if not ids:
+        return token, now, []
+
+    model.objects.filter(free, pk__in=ids).update(locked_at=now, locked_by=token)
+    return token, now, list(model.objects.filter(pk__in=ids, locked_by=token))
+
+
+def _process(model, batch_size: int, stats: Dict[str, Any], run: Callable[[List], None]) -> Dict[str, Any]:
+    """Claim + run(jobs) + borrar/liberar. run() completa `stats`; si falla, el lote se reintenta."""
+    token, claimed_at, jobs = claim_jobs(batch_size, model)
+    stats.update(claimed=len(jobs), failed=0)
+    if not jobs:
+        return stats
+
+    job_ids = [job.pk for job in jobs]
+    try:
+        run(jobs)
+    except Exception as exc:
+        logger.exception("Error procesando %s jobs de %s", len(jobs), model.__name__)
+        model.objects.filter(pk__in=job_ids, locked_by=token).update(
+            attempts=F("attempts") + 1,
+            last_error=repr(exc)[:2000],
+            locked_at=None,
+            locked_by="",
+            run_after=timezone.now() + RECALC_RETRY_DELAY,
+        )
+        stats["failed"] = len(jobs)
+        return stats
+
+    # lo que se volvió a pedir durante el recálculo queda en la cola; RECALC_MAX_DELAY
+    # se cuenta desde ese nuevo pedido (si no, cada edición posterior saltaría el debounce)
+    model.objects.filter(pk__in=job_ids, requested_at__lte=claimed_at).delete()
+    model.objects.filter(pk__in=job_ids, locked_by=token).update(
+        locked_at=None, locked_by="", enqueued_at=F("requested_at"),
+    )
+    return stats
+
+
+def process_jobs(
+    batch_size: int = 100,
+    *,
+    limit: int = REVERSE_MATCH_LIMIT,
+    min_score: float = REVERSE_MATCH_MIN_SCORE,
+) -> Dict[str, Any]:
+    """Procesa un lote de la cola de requerimientos. Devuelve contadores (claimed=0 => cola vacía)."""
+    stats = {"requirements": 0, "written": 0, "deleted": 0}
+
+    def run(jobs):
+        job_req_ids = [job.requirement_id for job in jobs]
+        req_ids = list(
+            Requirement.objects
+            .filter(pk__in=job_req_ids, is_active=True)
+            .values_list("id", flat=True)
+        )
+        if req_ids:
+            res = rematch_all(req_ids, limit=limit, min_score=min_score)
+            for k in ("requirements", "written", "deleted"):
+                stats[k] = res[k]
+        # desactivados: sus matches ya no valen (los borrados caen por CASCADE)
+        inactive = set(job_req_ids) - set(req_ids)
+        if inactive:
+            deleted, _ = RequirementMatch.objects.filter(requirement_id__in=inactive).delete()
+            stats["deleted"] += deleted
+
+    return _process(MatchRecalcJob, batch_size, stats, run)
+
+
+def process_property_jobs(
+    batch_size: int = 100,
+    *,
+    limit: int = REVERSE_MATCH_LIMIT,
+    min_score: float = REVERSE_MATCH_MIN_SCORE,
+) -> Dict[str, Any]:
+    """Procesa un lote de la cola de matching inverso. Devuelve contadores (claimed=0 => cola vacía)."""
+    stats = {"properties": 0, "saved": 0, "removed": 0}
+
+    def run(jobs):
+        # borradas: el job ya cayó por CASCADE; se leen todas antes de escribir (MSSQL sin MARS)
+        props = list(
+            Property.objects
+            .select_related("operation_type", "forma_de_pago")
+            .filter(pk__in=[job.property_id for job in jobs])
+        )
+        for prop in props:
+            res = fan_out_property(prop, limit=limit, min_score=min_score)
+            stats["properties"] += 1
+            stats["saved"] += res["saved"]
+            stats["removed"] += res["removed"] + res["pushed_out"]
+
+    return _process(PropertyMatchJob, batch_size, stats, run)
@@ -0,0 +1,432 @@
+# properties/engine_matching/registry.py
+"""
+Registro de criterios del motor de matching.
+
+Cada criterio declara en un solo lugar:
+- is_active(profile): si el requerimiento lo usa
+- prefilter(profile, qs): su aporte al filtro SQL (hard filters)
+- mask(profile, snapshot): el mismo filtro como máscara bool sobre el snapshot en memoria
+- admits(profile, prop): el mismo filtro en Python, para una sola Property
+- prefilter_key(profile): qué parte del profile cambia su prefilter (para RequirementProfile.signature)
+- score(profile, prop) / score_array(profile, arrays): subscore 0..1 escalar y vectorizado
+- columns: columnas numéricas de Property que necesita el batch
+- token_columns: columnas de tokens ("3 7 12"), llegan al batch como bitset uint64 (n, words)
+- weight_key: clave en MatchingWeight
+
+El orden de registro es el orden de "details" y de la suma del score.
+Para agregar un criterio: subclase de Criterion + register(MiCriterio()).
+"""
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q, QuerySet
+
+from properties.amenities import get_token_index
+
+from .criteria import (
+    decode_tokens,
+    proximity_score,
+    proximity_score_array,
+    token_coverage,
+    token_coverage_array,
+    tolerance_band,
+)
+
+# (campo de score, campo min en Requirement, campo max en Requirement)
+RANGE_CRITERIA = (
+    ("price", "price_min", "price_max"),
+    ("bedrooms", "bedrooms_min", "bedrooms_max"),
+    ("bathrooms", "bathrooms_min", "bathrooms_max"),
+    ("garage_spaces", "garage_spaces_min", "garage_spaces_max"),
+    ("land_area", "land_area_min", "land_area_max"),
+    ("built_area", "built_area_min", "built_area_max"),
+    ("floors", "floors_min", "floors_max"),
+    ("antiquity_years", "antiquity_years_min", "antiquity_years_max"),
+)
+
+RANGE_DEFAULT_WEIGHTS = {
+    "price": 3.0,
+    "land_area": 2.0,
+    "built_area": 2.0,
+    "garage_spaces": 0.8,
+    "floors": 0.5,
+}
+
+
+def code_in(lookup: str, codes: Iterable[str]) -> Q:
+    """OR de iexact: el profile normaliza a lower, así que el prefiltro no debe depender del collation."""
+    q = Q(pk__in=[])
+    for code in codes:
+        q |= Q(**{f"{lookup}__iexact": code})
+    return q
+
+
+class Criterion:
+    name: str = ""
+    weight_key: Optional[str] = None
+    default_weight: float = 1.0   # si MatchingWeight no tiene la clave (weights.default_weights)
+    columns: Tuple[str, ...] = ()
+    token_columns: Tuple[str, ...] = ()
+
+    @property
+    def key(self) -> str:
+        """Clave en MatchingWeight (por defecto, el mismo nombre del criterio)."""
+        return self.weight_key or self.name
+
+    def is_active(self, profile) -> bool:
+        return True
+
+    def prefilter(self, profile, qs: QuerySet) -> QuerySet:
+        return qs
+
+    def admits(self, profile, prop) -> bool:
+        return True
+
+    def mask(self, profile, snapshot) -> Optional[np.ndarray]:
+        """
+        prefilter() sobre el snapshot (snapshot.py): array bool por fila, o None si no filtra.
+        Un criterio con prefilter propio y sin mask hace que el motor vuelva al SQL.
+        """
+        if type(self).prefilter is not Criterion.prefilter:
+            raise NotImplementedError(f"{self.name}: prefilter sin mask")
+        return None
+
+    def prefilter_key(self, profile):
+        """
+        Solo para criterios no excluyentes que igual filtran en SQL: lo que define
+        su prefilter (None si no filtra). Los hard filters ya van en la firma.
+        """
+        return None
+
+    def score(self, profile, prop) -> float:
+        return 1.0
+
+    def score_array(self, profile, arrays: Dict[str, np.ndarray]):
+        return 1.0
+
+
+class HardFilterCriterion(Criterion):
+    """
+    Excluyente: filtra en SQL y, si la propiedad llegó hasta el scoring, ya cumple.
+    Suma su peso completo (subscore 1.0) como "peso base".
+    """
+
+
+# -----------------------------
+# Hard filters
+# -----------------------------
+class OperationTypeCriterion(HardFilterCriterion):
+    name = "operation_type"
+
+    def is_active(self, profile):
+        return profile.operation_code is not None
+
+    def prefilter(self, profile, qs):
+        # Requirement: buy/rent ; Property: sale/rent (ver OPERATION_CODE_MAP)
+        return qs.filter(operation_type__code__iexact=profile.operation_code)
+
+    def admits(self, profile, prop):
+        return prop.operation_type_id is not None and (prop.operation_type.code or "").lower() == profile.operation_code
+
+    def mask(self, profile, snapshot):
+        return snapshot.code_mask("operation_code", (profile.operation_code,))
+
+
+class PropertyTypeCriterion(HardFilterCriterion):
+    name = "property_type"
+    default_weight = 5.0
+
+    def is_active(self, profile):
+        return bool(profile.property_type_id)
+
+    def prefilter(self, profile, qs):
+        return qs.filter(property_type_id=profile.property_type_id)
+
+    def admits(self, profile, prop):
+        return prop.property_type_id == profile.property_type_id
+
+    def mask(self, profile, snapshot):
+        return snapshot.column("property_type_id") == profile.property_type_id
+
+
+class PropertySubtypeCriterion(HardFilterCriterion):
+    name = "property_subtype"
+    default_weight = 3.0
+
+    def is_active(self, profile):
+        return bool(profile.property_subtype_id)
+
+    def prefilter(self, profile, qs):
+        # ojo: el SQL deja pasar NULL también
+        return qs.filter(Q(property_subtype_id=profile.property_subtype_id) | Q(property_subtype__isnull=True))
+
+    def admits(self, profile, prop):
+        return prop.property_subtype_id in (profile.property_subtype_id, None)
+
+    def mask(self, profile, snapshot):
+        col = snapshot.column("property_subtype_id")
+        return (col == profile.property_subtype_id) | (col == snapshot.NULL_ID)
+
+
+class DistrictCriterion(HardFilterCriterion):
+    name = "districts"
+    weight_key = "district"
+    default_weight = 5.0
+
+    def is_active(self, profile):
+        return bool(profile.district_ids)
+
+    def prefilter(self, profile, qs):
+        # FK real (ya NO usamos prop.district char)
+        return qs.filter(district_fk_id__in=profile.district_ids)
+
+    def admits(self, profile, prop):
+        return prop.district_fk_id in profile.district_ids
+
+    def mask(self, profile, snapshot):
+        return np.isin(snapshot.column("district_fk_id"), list(profile.district_ids))
+
+
+class CurrencyCriterion(HardFilterCriterion):
+    name = "currency"
+    default_weight = 2.0
+
+    def is_active(self, profile):
+        return bool(profile.currency_id)
+
+    def prefilter(self, profile, qs):
+        return qs.filter(currency_id=profile.currency_id)
+
+    def admits(self, profile, prop):
+        return prop.currency_id == profile.currency_id
+
+    def mask(self, profile, snapshot):
+        return snapshot.column("currency_id") == profile.currency_id
+
+
+class PaymentMethodCriterion(HardFilterCriterion):
+    name = "payment_method"
+    default_weight = 2.0
+
+    def is_active(self, profile):
+        return profile.payment_method_code is not None
+
+    def prefilter(self, profile, qs):
+        # Requirement.payment_method -> Property.forma_de_pago (regla en PAYMENT_CODE_MAP)
+        if profile.payment_codes is not None:
+            return qs.filter(code_in("forma_de_pago__code", profile.payment_codes))
+        # fallback: si agregas nuevos métodos
+        return qs.filter(forma_de_pago__code__iexact=profile.payment_method_code)
+
+    def admits(self, profile, prop):
+        if prop.forma_de_pago_id is None:
+            return False
+        prop_code = (prop.forma_de_pago.code or "").lower()
+        if profile.payment_codes is not None:
+            return prop_code in profile.payment_codes
+        return prop_code == profile.payment_method_code
+
+    def mask(self, profile, snapshot):
+        if profile.payment_codes is not None:
+            return snapshot.code_mask("payment_code", profile.payment_codes)
+        return snapshot.code_mask("payment_code", (profile.payment_method_code,))
+
+
+class AvailabilityCriterion(HardFilterCriterion):
+    """Estado comercial: siempre activo (garantiza que ningún requerimiento quede sin peso)."""
+    name = "availability_status"
+
+    def prefilter(self, profile, qs):
+        return qs.filter(availability_status="available")
+
+    def admits(self, profile, prop):
+        return prop.availability_status == "available"
+
+    def mask(self, profile, snapshot):
+        return snapshot.code_mask("availability_status", ("available",))
+
+
+# -----------------------------
+# Soft score
+# -----------------------------
+class RangeCriterion(Criterion):
+    """
+    Proximidad a un rango min/max del requerimiento (ya normalizado en profile.ranges).
+
+    Opcional: con settings.MATCHING_RANGE_FLOORS = {"price": 0.2, ...} también filtra
+    en SQL (price__range) las propiedades cuyo subscore quedaría bajo ese piso.
+    Sin piso configurado no filtra nada (una propiedad lejos en precio puede
+    igual sumar mucho por el resto de criterios).
+    """
+
+    def __init__(self, field: str):
+        self.name = field
+        self.columns = (field,)
+        self.default_weight = RANGE_DEFAULT_WEIGHTS.get(field, 1.0)
+
+    @property
+    def floor(self) -> Optional[float]:
+        return getattr(settings, "MATCHING_RANGE_FLOORS", {}).get(self.name)
+
+    def band(self, profile):
+        mn, mx = profile.ranges[self.name]
+        return tolerance_band(mn, mx, self.floor)
+
+    def is_active(self, profile):
+        return self.name in profile.ranges
+
+    def prefilter_key(self, profile):
+        band = self.band(profile)
+        return (self.name, band) if band is not None else None
+
+    def prefilter(self, profile, qs):
+        band = self.band(profile)
+        if band is None:
+            return qs
+        lo, hi = band
+        if lo is not None and hi is not None:
+            q = Q(**{f"{self.name}__range": (lo, hi)})
+        elif lo is not None:
+            q = Q(**{f"{self.name}__gte": lo})
+        else:
+            q = Q(**{f"{self.name}__lte": hi})
+        if self.floor <= 0.5:
+            # sin dato el subscore es 0.5 (neutral)
+            q |= Q(**{f"{self.name}__isnull": True})
+        return qs.filter(q)
+
+    def mask(self, profile, snapshot):
+        band = self.band(profile)
+        if band is None:
+            return None
+        lo, hi = band
+        values = snapshot.column(self.name)
+        out = np.ones(len(values), dtype=bool)
+        with np.errstate(invalid="ignore"):
+            if lo is not None:
+                out &= values >= lo
+            if hi is not None:
+                out &= values <= hi
+        if self.floor <= 0.5:
+            out |= np.isnan(values)
+        return out
+
+    def admits(self, profile, prop):
+        band = self.band(profile)
+        if band is None:
+            return True
+        value = getattr(prop, self.name)
+        if value is None:
+            return self.floor <= 0.5
+        lo, hi = band
+        v = float(value)
+        return (lo is None or v >= lo) and (hi is None or v <= hi)
+
+    def score(self, profile, prop):
+        mn, mx = profile.ranges[self.name]
+        return proximity_score(getattr(prop, self.name), mn, mx)
+
+    def score_array(self, profile, arrays):
+        mn, mx = profile.ranges[self.name]
+        return proximity_score_array(arrays[self.name], mn, mx)
+
+
+class ElevatorCriterion(Criterion):
+    name = "has_elevator"
+    weight_key = "ascensor"
+    default_weight = 0.5
+    columns = ("has_elevator",)
+
+    def is_active(self, profile):
+        return profile.has_elevator is not None
+
+    def score(self, profile, prop):
+        return 1.0 if profile.has_elevator == prop.has_elevator else 0.1
+
+    def score_array(self, profile, arrays):
+        # misma regla que score(): None en la propiedad cuenta como no-match
+        return np.where(arrays["has_elevator"] == float(profile.has_elevator), 1.0, 0.1)
+
+
+class AmenitiesCriterion(Criterion):
+    """Cobertura de las amenidades pedidas (tokens precalculados, ver properties/amenities.py)."""
+
+    name = "amenities"
+    token_columns = ("amenity_tokens",)
+
+    def is_active(self, profile):
+        return profile.amenity_count > 0
+
+    def score(self, profile, prop):
+        return token_coverage(decode_tokens(prop.amenity_tokens), profile.amenity_ids, profile.amenity_count)
+
+    def score_array(self, profile, arrays):
+        return token_coverage_array(
+            arrays["amenity_tokens"], profile.amenity_ids, profile.amenity_count, get_token_index().position
+        )
+
+
+# -----------------------------
+# Registro
+# -----------------------------
+_registry: "OrderedDict[str, Criterion]" = OrderedDict()
+
+
+def register(criterion: Criterion, *, replace: bool = False) -> Criterion:
+    """
+    Registra un criterio. Hacerlo al importar (o en AppConfig.ready): los
+    RequirementProfile ya cacheados no lo ven hasta invalidate_requirement_profile().
+    """
+    if criterion.name in _registry and not replace:
+        raise ValueError(f"Criterio ya registrado: {criterion.name}")
+    _registry[criterion.name] = criterion
+    return criterion
+
+
+def unregister(name: str) -> None:
+    _registry.pop(name, None)
+
+
+def get_criterion(name: str) -> Criterion:
+    return _registry[name]
+
+
+def iter_criteria() -> Iterator[Criterion]:
+    return iter(list(_registry.values()))
+
+
+def score_columns() -> Tuple[str, ...]:
+    """Columnas de Property que necesita el batch (sin repetir, en orden de registro)."""
+    cols = []
+    for c in _registry.values():
+        for col in c.columns:
+            if col not in cols:
+                cols.append(col)
+    return tuple(cols)
+
+
+def token_columns() -> Tuple[str, ...]:
+    """Columnas de tokens que necesita el batch (sin repetir, en orden de registro)."""
+    cols = []
+    for c in _registry.values():
+        for col in c.token_columns:
+            if col not in cols:
+                cols.append(col)
+    return tuple(cols)
+
+
+for _criterion in (
+    OperationTypeCriterion(),
+    PropertyTypeCriterion(),
+    PropertySubtypeCriterion(),
+    DistrictCriterion(),
+    CurrencyCriterion(),
+    PaymentMethodCriterion(),
+    AvailabilityCriterion(),
+    *(RangeCriterion(field) for field, _, _ in RANGE_CRITERIA),
+    ElevatorCriterion(),
+    AmenitiesCriterion(),
+):
+    register(_criterion)
@@ -0,0 +1,229 @@
+# properties/engine_matching/rematch.py
+"""
+Recálculo masivo de RequirementMatch (rematch_all).
+
+- Agrupa los requerimientos por firma de hard filters: cada grupo carga sus
+  candidatos (load_candidate_arrays) una sola vez y los puntúa en batch por requerimiento.
+- El scoring puede ir en un pool de procesos (fork) que comparte un snapshot de
+  solo lectura de los candidatos; la escritura siempre en el proceso principal.
+- Escribe con persistence.persist_matches (bulk insert/update/delete) en vez de update_or_create por fila.
+"""
+import logging
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
+
+from properties.models import Property, Requirement
+
+from .engine import build_candidate_qs, calculate_scores_batch, batch_details, load_candidate_arrays, load_candidates, top_k_indices
+from .index import requirement_index
+from .persistence import MatchRow, persist_matches
+from .profile import get_requirement_profile
+from .snapshot import property_snapshot, snapshot_enabled
+from .weights import load_weights
+
+logger = logging.getLogger(__name__)
+
+def select_requirement_ids(since: Optional[datetime] = None) -> List[int]:
+    """
+    Requerimientos activos a recalcular.
+    Con `since`: los editados desde esa fecha + los que podrían admitir
+    propiedades editadas desde esa fecha (vía índice invertido).
+    """
+    qs = Requirement.objects.filter(is_active=True)
+    if since is None:
+        return list(qs.order_by("id").values_list("id", flat=True))
+
+    ids: Set[int] = set(qs.filter(updated_at__gte=since).values_list("id", flat=True))
+    changed_props = (
+        Property.objects
+        .filter(updated_at__gte=since)
+        .select_related("operation_type", "forma_de_pago")
+    )
+    for prop in changed_props.iterator():
+        ids |= requirement_index.candidates_for(prop)
+    return sorted(ids)
+
+
+def _group_profiles(req_ids: Iterable[int]) -> List[list]:
+    """Profiles de `req_ids` agrupados por RequirementProfile.signature (en orden de id)."""
+    groups: Dict[tuple, list] = {}
+    reqs = (
+        Requirement.objects
+        .filter(pk__in=list(req_ids))
+        .select_related("operation_type", "payment_method")
+        .order_by("id")
+    )
+    for req in reqs:
+        profile = get_requirement_profile(req)
+        groups.setdefault(profile.signature, []).append(profile)
+    return list(groups.values())
+
+
+def group_by_signature(req_ids: Iterable[int]) -> List[List[int]]:
+    """Agrupa ids de requerimientos por RequirementProfile.signature."""
+    return [[p.id for p in profiles] for profiles in _group_profiles(req_ids)]
+
+
+def _score_profiles(profiles, arrays, weights, limit: int, min_score: Optional[float]) -> Dict[int, List[MatchRow]]:
+    """Puntúa en batch cada profile contra los mismos candidatos. Sin DB."""
+    out: Dict[int, List[MatchRow]] = {}
+    for profile in profiles:
+        batch = calculate_scores_batch(profile, arrays, weights)
+        rows = []
+        for i in top_k_indices(batch["score"], limit, min_score=min_score):
+            sc = batch_details(batch, i)
+            rows.append((profile.id, int(batch["ids"][i]), sc["score"], sc["details"]))
+        out[profile.id] = rows
+    return out
+
+
+def score_group(req_ids: List[int], limit: int, min_score: Optional[float]) -> Dict[int, List[MatchRow]]:
+    """
+    Puntúa un grupo que comparte firma: una sola carga de candidatos para todos.
+    Devuelve {requirement_id: filas top-k}; un requerimiento sin matches queda con [].
+    """
+    reqs = (
+        Requirement.objects
+        .filter(pk__in=req_ids)
+        .select_related("operation_type", "payment_method")
+        .order_by("id")
+    )
+    profiles = [get_requirement_profile(req) for req in reqs]
+    if not profiles:
+        return {}
+    arrays = load_candidates(profiles[0])
+    return _score_profiles(profiles, arrays, load_weights(), limit, min_score)
+
+
+# -----------------------------
+# Pool de procesos
+# -----------------------------
+# Máximo de filas de candidatos (sumando grupos) cargadas a la vez en el snapshot.
+# ~90 bytes por fila con las columnas actuales => ~90 MB.
+SNAPSHOT_MAX_ROWS = 1_000_000
+# Shards por worker: más de uno para repartir bien grupos de distinto tamaño
+SHARDS_PER_WORKER = 4
+
+# Snapshot de solo lectura para los workers. Se arma en el padre justo antes del
+# fork y el hijo lo hereda (copy-on-write): ni pickle de arrays ni queries en el worker.
+_snapshot: Dict[str, Any] = {}
+
+
+def _shards(groups: List[list], workers: int) -> List[Tuple[int, list]]:
+    """Parte los grupos en trozos (índice de grupo, profiles) de tamaño parejo."""
+    total = sum(len(g) for g in groups)
+    size = max(1, math.ceil(total / (workers * SHARDS_PER_WORKER)))
+    return [
+        (gi, profiles[i:i + size])
+        for gi, profiles in enumerate(groups)
+        for i in range(0, len(profiles), size)
+    ]
+
+
+def _score_shard(shard: int) -> Dict[int, List[MatchRow]]:
+    gi, profiles = _snapshot["shards"][shard]
+    return _score_profiles(
+        profiles, _snapshot["arrays"][gi], _snapshot["weights"], _snapshot["limit"], _snapshot["min_score"],
+    )
+
+
+def _score_wave(groups, arrays, weights, *, limit, min_score, workers) -> Iterator[Dict[int, List[MatchRow]]]:
+    """Puntúa una ola de grupos ya cargados; con workers > 1, repartida en shards entre procesos."""
+    if workers <= 1:
+        for profiles, group_arrays in zip(groups, arrays):
+            yield _score_profiles(profiles, group_arrays, weights, limit, min_score)
+        return
+
+    _snapshot.update(
+        arrays=arrays,
+        weights=weights,
+        shards=_shards(groups, workers),
+        limit=limit,
+        min_score=min_score,
+    )
+    try:
+        # Los workers no tocan la DB (todo viene en el snapshot). Tampoco cierran las
+        # conexiones heredadas: cerrarlas desde el hijo cortaría la sesión del padre.
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("fork"),
+        ) as pool:
+            # con fork todos los procesos se crean al primer submit: después el padre ya puede usar la DB
+            yield from pool.map(_score_shard, range(len(_snapshot["shards"])))
+    finally:
+        _snapshot.clear()
+
+
+def write_group(scored: Dict[int, List[MatchRow]], batch_size: int = 500) -> Dict[str, int]:
+    """Persiste el resultado de un grupo con el servicio de persistencia en bloque."""
+    res = persist_matches(scored, batch_size=batch_size)
+    return {
+        "written": res["created"] + res["updated"],
+        "created": res["created"],
+        "deleted": res["deleted"],
+    }
+
+
+def rematch_all(
+    req_ids: List[int],
+    *,
+    limit: int = 10,
+    min_score: Optional[float] = 80.0,
+    workers: int = 1,
+    batch_size: int = 500,
+) -> Dict[str, Any]:
+    """
+    Recalcula y persiste los matches de `req_ids`. Devuelve contadores para el reporte.
+
+    Los candidatos de cada grupo se arman en el proceso principal (del snapshot en
+    memoria, o por SQL), por olas de hasta SNAPSHOT_MAX_ROWS filas; con workers > 1
+    el scoring se reparte en shards entre procesos que leen esas olas, y los
+    resultados vuelven al padre para el bulk write.
+    """
+    groups = _group_profiles(req_ids)
+    stats = {"requirements": 0, "groups": len(groups), "written": 0, "created": 0, "deleted": 0}
+    if not groups:
+        return stats
+
+    # Solo con fork: con spawn el hijo importaría models.py antes de django.setup()
+    if workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+        logger.warning("rematch_all: fork no disponible, se ejecuta en un solo proceso")
+        workers = 1
+    if sum(len(g) for g in groups) < 2:
+        workers = 1
+
+    weights = load_weights()
+    # un solo estado del snapshot para toda la corrida (None: cada grupo va por SQL)
+    state = property_snapshot.current() if snapshot_enabled() else None
+
+    def _load(profile):
+        arrays = property_snapshot.candidate_arrays(profile, state) if state is not None else None
+        if arrays is None:
+            arrays = load_candidate_arrays(build_candidate_qs(profile))
+        return arrays
+
+    def _run(wave_groups, wave_arrays):
+        for scored in _score_wave(
+            wave_groups, wave_arrays, weights, limit=limit, min_score=min_score, workers=workers,
+        ):
+            res = write_group(scored, batch_size=batch_size)
+            stats["requirements"] += len(scored)
+            for k in ("written", "created", "deleted"):
+                stats[k] += res[k]
+
+    wave_groups, wave_arrays, rows = [], [], 0
+    for profiles in groups:
+        arrays = _load(profiles[0])
+        wave_groups.append(profiles)
+        wave_arrays.append(arrays)
+        rows += len(arrays["id"])
+        if rows >= SNAPSHOT_MAX_ROWS:
+            _run(wave_groups, wave_arrays)
+            wave_groups, wave_arrays, rows = [], [], 0
+    if wave_groups:
+        _run(wave_groups, wave_arrays)
+
+    return stats
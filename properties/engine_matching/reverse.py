@@ -0,0 +1,167 @@
+# properties/engine_matching/reverse.py
+"""
+Matching inverso: Property -> Requirements.
+
+Cuando se publica o cambia una Property no recalculamos todos los
+requerimientos: buscamos solo los que la admiten por hard filters y
+actualizamos sus filas de RequirementMatch para esa propiedad.
+Corre en el worker (queue.process_property_jobs), no en el request que guardó.
+"""
+import logging
+from typing import Dict, Any, List, Set, Tuple
+
+from django.db import transaction
+from django.db.models import Q, QuerySet
+
+from properties.models import Property, Requirement, RequirementMatch
+
+from .engine import calculate_score
+from .index import requirement_index
+from .persistence import upsert_matches
+from .profile import OPERATION_CODE_MAP, PAYMENT_CODE_MAP, get_requirement_profile, requirement_codes_for
+from .registry import code_in, score_columns, token_columns
+from .weights import load_weights
+
+logger = logging.getLogger(__name__)
+
+# Mismos valores con los que se recalcula al crear/editar un requerimiento
+REVERSE_MATCH_LIMIT = 10
+REVERSE_MATCH_MIN_SCORE = 80.0
+
+# Campos de Property que cambian el resultado del matching.
+# Si un save(update_fields=...) no toca ninguno, no hacemos fan-out.
+MATCH_RELEVANT_FIELDS = frozenset({
+    "is_active",
+    "is_draft",
+    "availability_status",
+    "operation_type",
+    "property_type",
+    "property_subtype",
+    "district_fk",
+    "currency",
+    "forma_de_pago",
+    *score_columns(),
+    *token_columns(),
+})
+
+
+def candidate_requirements_qs(prop: Property) -> QuerySet[Requirement]:
+    """
+    Prefiltro SQL (superset) de requerimientos activos que podrían admitir `prop`.
+    Cada hard filter del requerimiento pasa si está vacío o si coincide con la propiedad.
+    Equivale a requirement_index.candidates_for(prop) pero contra la BD (sin índice en memoria).
+    El chequeo exacto se hace luego con RequirementProfile.admits().
+    """
+    qs = Requirement.objects.filter(is_active=True)
+
+    # (A) Operación
+    if prop.operation_type_id:
+        req_codes = requirement_codes_for(prop.operation_type.code or "", OPERATION_CODE_MAP)
+        qs = qs.filter(Q(operation_type__isnull=True) | code_in("operation_type__code", req_codes))
+    else:
+        qs = qs.filter(operation_type__isnull=True)
+
+    # (B) Tipo / subtipo (property_subtype NULL en la propiedad pasa siempre)
+    qs = qs.filter(Q(property_type__isnull=True) | Q(property_type_id=prop.property_type_id))
+    if prop.property_subtype_id:
+        qs = qs.filter(Q(property_subtype__isnull=True) | Q(property_subtype_id=prop.property_subtype_id))
+
+    # (C) Distritos
+    if prop.district_fk_id:
+        qs = qs.filter(Q(districts__isnull=True) | Q(districts__id=prop.district_fk_id))
+    else:
+        qs = qs.filter(districts__isnull=True)
+
+    # (D) Moneda
+    qs = qs.filter(Q(currency__isnull=True) | Q(currency_id=prop.currency_id))
+
+    # (E) Forma de pago
+    if prop.forma_de_pago_id:
+        req_codes = requirement_codes_for(prop.forma_de_pago.code or "", PAYMENT_CODE_MAP)
+        qs = qs.filter(Q(payment_method__isnull=True) | code_in("payment_method__code", req_codes))
+    else:
+        qs = qs.filter(payment_method__isnull=True)
+
+    return qs.distinct()
+
+
+def fan_out_property(
+    prop: Property,
+    *,
+    limit: int = REVERSE_MATCH_LIMIT,
+    min_score: float = REVERSE_MATCH_MIN_SCORE,
+) -> Dict[str, Any]:
+    """
+    Actualiza RequirementMatch solo para los requerimientos que admiten `prop`.
+    - fila existente => se actualiza score/details
+    - fila nueva => solo si score >= min_score y entra al top `limit` del requerimiento;
+      la fila que queda fuera del top `limit` se borra en la misma transacción
+    - requerimientos que ya no la admiten => se borra su fila
+    """
+    admitted: Dict[int, Any] = {}
+    weights = load_weights()
+    if prop.is_active and not prop.is_draft and prop.availability_status == "available":
+        candidate_ids = requirement_index.candidates_for(prop)
+        reqs = (
+            Requirement.objects
+            .filter(pk__in=candidate_ids, is_active=True)
+            .select_related("operation_type", "payment_method")
+        ) if candidate_ids else []
+        for req in reqs:
+            profile = get_requirement_profile(req)
+            if profile.admits(prop):
+                admitted[profile.id] = calculate_score(profile, prop, weights)
+
+    # Filas existentes de los requerimientos admitidos (una sola query)
+    current: Dict[int, List[Tuple[float, int]]] = {}
+    already: Set[int] = set()
+    for pk, req_id, prop_id, score in (
+        RequirementMatch.objects
+        .filter(requirement_id__in=list(admitted.keys()))
+        .values_list("id", "requirement_id", "property_id", "score")
+    ):
+        if prop_id == prop.id:
+            already.add(req_id)
+        else:
+            current.setdefault(req_id, []).append((float(score), pk))
+
+    to_save = []
+    pushed_out: List[int] = []
+    for req_id, sc in admitted.items():
+        if req_id in already:
+            to_save.append(req_id)
+            continue
+        if sc["score"] < min_score:
+            continue
+        others = sorted(current.get(req_id, []), reverse=True)
+        if len(others) < limit:
+            to_save.append(req_id)
+        elif sc["score"] > others[limit - 1][0]:
+            to_save.append(req_id)
+            # con la nueva fila, las de la posición limit-1 en adelante quedan fuera del top
+            pushed_out.extend(pk for _, pk in others[limit - 1:])
+
+    with transaction.atomic():
+        # la propiedad ya no pasa los hard filters de estos requerimientos
+        removed, _ = (
+            RequirementMatch.objects
+            .filter(property=prop)
+            .exclude(requirement_id__in=list(admitted.keys()))
+            .delete()
+        )
+        # un bulk insert + un bulk update + notificaciones en batch (sin post_save por fila)
+        upsert_matches(
+            [
+                (req_id, prop.id, round(float(admitted[req_id]["score"]), 2), admitted[req_id]["details"])
+                for req_id in to_save
+            ],
+            delete_ids=pushed_out,
+        )
+
+    return {
+        "property_id": prop.id,
+        "admitted": len(admitted),
+        "saved": len(to_save),
+        "removed": removed,
+        "pushed_out": len(pushed_out),
+    }
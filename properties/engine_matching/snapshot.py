@@ -0,0 +1,252 @@
+# properties/engine_matching/snapshot.py
+"""
+Snapshot columnar en memoria del catálogo de candidatos.
+
+Todas las Property activas y no borrador, como arrays NumPy:
+- id, FKs (property_type, property_subtype, district_fk, currency) -> int64, NULL = -1
+- codes (operation_type.code, forma_de_pago.code, availability_status) -> ints categóricos;
+  los de catálogo en minúsculas (el SQL los compara sin distinguir mayúsculas)
+- columnas de score (registry.score_columns()) -> float64, NULL = NaN
+- columnas de tokens (registry.token_columns()) -> bitset uint64 (n, words), con las
+  posiciones del TokenIndex del estado (si el vocabulario cambia, se recarga todo)
+
+Los hard filters se aplican como máscaras bool (Criterion.mask) en vez de un
+query con seis joins por cada llamada al motor.
+
+Actualización incremental: cada save/delete de Property sube la versión del
+inventario y deja su id en el log (versions.py). Al cambiar la versión solo se
+vuelven a leer esas filas; si el log está incompleto (bulk_create, .update()
+masivos, cache reiniciado) o pasó SNAPSHOT_MAX_AGE, se recarga todo.
+Cada actualización arma arrays nuevos: quien ya tiene un estado lo sigue leyendo entero.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from properties.amenities import get_token_index
+from properties.models import Property
+
+from .profile import get_requirement_profile
+from .criteria import concat_column, token_bitset
+from .registry import get_criterion, score_columns, token_columns
+from .versions import get_inventory_version, inventory_changes
+
+logger = logging.getLogger(__name__)
+
+# Recarga completa cada tanto: acota cualquier desvío (p.ej. un rollback en este proceso)
+SNAPSHOT_MAX_AGE = 15 * 60
+# Con más cambios que esto sale más barato recargar todo
+SNAPSHOT_MAX_DELTA = 2000
+
+CODE_COLUMNS = (
+    ("operation_code", "operation_type__code"),
+    ("payment_code", "forma_de_pago__code"),
+    ("availability_status", "availability_status"),
+)
+# codes de catálogo cargados a mano ("CASH"/"cash"): se comparan en minúsculas
+CASELESS_CODES = frozenset({"operation_code", "payment_code"})
+ID_COLUMNS = ("property_type_id", "property_subtype_id", "district_fk_id", "currency_id")
+
+
+def snapshot_enabled() -> bool:
+    return getattr(settings, "MATCHING_SNAPSHOT", True)
+
+
+class SnapshotState:
+    """Un estado inmutable del snapshot (lo que ven las máscaras de los criterios)."""
+
+    NULL_ID = -1
+
+    __slots__ = ("version", "built_at", "score_cols", "token_cols", "token_index", "columns", "row_of", "categories")
+
+    def __init__(self, version, built_at, score_cols, token_cols, token_index, columns, row_of, categories):
+        self.version = version
+        self.built_at = built_at
+        self.score_cols = score_cols
+        self.token_cols = token_cols
+        self.token_index = token_index
+        self.columns: Dict[str, np.ndarray] = columns
+        self.row_of: Dict[int, int] = row_of
+        self.categories: Dict[str, Dict[str, int]] = categories
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def code_mask(self, name: str, codes: Iterable[str]) -> np.ndarray:
+        """Filas cuyo code categórico `name` está en `codes` (sin mayúsculas si es CASELESS_CODES)."""
+        cats = self.categories[name]
+        if name in CASELESS_CODES:
+            codes = {c.lower() for c in codes if c is not None}
+        ids = [cats[c] for c in codes if c in cats]
+        return np.isin(self.columns[name], ids)
+
+
+def _fetch(score_cols: Tuple[str, ...], token_cols: Tuple[str, ...], ids: Optional[Iterable[int]] = None) -> List[tuple]:
+    qs = Property.objects.filter(is_active=True, is_draft=False)
+    if ids is not None:
+        qs = qs.filter(pk__in=list(ids))
+    fields = ["id", *(lookup for _, lookup in CODE_COLUMNS), *ID_COLUMNS, *score_cols, *token_cols]
+    return list(qs.values_list(*fields))
+
+
+def _to_columns(rows: List[tuple], score_cols, token_cols, token_index, categories) -> Dict[str, np.ndarray]:
+    """Filas de _fetch -> arrays; agrega a `categories` los codes nuevos."""
+    n_codes = len(CODE_COLUMNS)
+    n_ids = len(ID_COLUMNS)
+    out = {"id": np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))}
+
+    for j, (name, _) in enumerate(CODE_COLUMNS, start=1):
+        cats = categories.setdefault(name, {})
+        caseless = name in CASELESS_CODES
+        values = []
+        for r in rows:
+            code = r[j]
+            if code is None:
+                values.append(SnapshotState.NULL_ID)
+            else:
+                values.append(cats.setdefault(code.lower() if caseless else code, len(cats)))
+        out[name] = np.array(values, dtype=np.int32)
+
+    start = 1 + n_codes
+    for j, name in enumerate(ID_COLUMNS, start=start):
+        out[name] = np.array(
+            [SnapshotState.NULL_ID if r[j] is None else r[j] for r in rows], dtype=np.int64
+        )
+
+    start += n_ids
+    for j, name in enumerate(score_cols, start=start):
+        out[name] = np.array([r[j] for r in rows], dtype=float).reshape(len(rows))
+
+    start += len(score_cols)
+    for j, name in enumerate(token_cols, start=start):
+        out[name] = token_bitset([r[j] for r in rows], token_index.position)
+    return out
+
+
+class PropertySnapshot:
+    def __init__(self):
+        self._state: Optional[SnapshotState] = None
+        self._lock = threading.Lock()
+
+    # -----------------------------
+    # Carga
+    # -----------------------------
+    def _build(self, version: int) -> SnapshotState:
+        score_cols = score_columns()
+        token_cols = token_columns()
+        token_index = get_token_index()
+        categories: Dict[str, Dict[str, int]] = {}
+        columns = _to_columns(_fetch(score_cols, token_cols), score_cols, token_cols, token_index, categories)
+        row_of = {int(pk): i for i, pk in enumerate(columns["id"])}
+        return SnapshotState(
+            version, time.monotonic(), score_cols, token_cols, token_index, columns, row_of, categories
+        )
+
+    def _apply(self, state: SnapshotState, version: int, changed: Iterable[int]) -> SnapshotState:
+        """Estado nuevo con las filas `changed` releídas (las que ya no califican se quitan)."""
+        changed = set(changed)
+        categories = {name: dict(cats) for name, cats in state.categories.items()}
+        fresh = _to_columns(
+            _fetch(state.score_cols, state.token_cols, changed),
+            state.score_cols, state.token_cols, state.token_index, categories,
+        )
+        fresh_row = {int(pk): i for i, pk in enumerate(fresh["id"])}
+
+        keep = np.ones(len(state.columns["id"]), dtype=bool)
+        for pk in changed:
+            row = state.row_of.get(pk)
+            if row is not None:
+                keep[row] = False
+        keep_idx = np.flatnonzero(keep)
+
+        columns = {
+            name: concat_column(col[keep_idx], fresh[name])
+            for name, col in state.columns.items()
+        }
+        row_of = {int(pk): i for i, pk in enumerate(columns["id"])}
+        logger.debug(
+            "snapshot: v%s -> v%s, %s releídas, %s filas", state.version, version, len(fresh_row), len(row_of)
+        )
+        return SnapshotState(
+            version, state.built_at, state.score_cols, state.token_cols, state.token_index, columns, row_of, categories
+        )
+
+    def current(self) -> SnapshotState:
+        """Estado vigente; lo actualiza si subió la versión del inventario."""
+        version = get_inventory_version()
+        state = self._state
+        if state is not None and state.version == version and not self._stale(state):
+            return state
+
+        with self._lock:
+            state = self._state
+            if state is None or self._stale(state):
+                state = self._build(version)
+            elif state.version != version:
+                changed = inventory_changes(state.version, version)
+                if changed is None or len(changed) > SNAPSHOT_MAX_DELTA:
+                    state = self._build(version)
+                else:
+                    state = self._apply(state, version, changed)
+            self._state = state
+            return state
+
+    def _stale(self, state: SnapshotState) -> bool:
+        return (
+            time.monotonic() - state.built_at > SNAPSHOT_MAX_AGE
+            or state.score_cols != score_columns()
+            or state.token_cols != token_columns()
+            or state.token_index is not get_token_index()
+        )
+
+    def reload(self, ids: Iterable[int]) -> None:
+        """Relee estas filas ya (p.ej. ids que el motor no encontró en la DB)."""
+        with self._lock:
+            if self._state is not None:
+                self._state = self._apply(self._state, self._state.version, ids)
+
+    def rebuild(self) -> SnapshotState:
+        """Recarga completa (rematch_all la fuerza al empezar)."""
+        with self._lock:
+            self._state = self._build(get_inventory_version())
+            return self._state
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._state = None
+
+    # -----------------------------
+    # Consulta
+    # -----------------------------
+    def candidate_arrays(self, req, state: Optional[SnapshotState] = None) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Mismo resultado que load_candidate_arrays(build_candidate_qs(req)), sin query.
+        None si algún criterio activo no sabe filtrar en memoria (usar SQL).
+        """
+        profile = get_requirement_profile(req)
+        state = state or self.current()
+
+        mask = np.ones(len(state), dtype=bool)
+        try:
+            for name in profile.criteria:
+                m = get_criterion(name).mask(profile, state)
+                if m is not None:
+                    mask &= m
+        except NotImplementedError:
+            return None
+
+        idx = np.flatnonzero(mask)
+        arrays = {"id": state.columns["id"][idx]}
+        for col in (*state.score_cols, *state.token_cols):
+            arrays[col] = state.columns[col][idx]
+        return arrays
+
+
+property_snapshot = PropertySnapshot()
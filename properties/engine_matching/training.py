@@ -0,0 +1,275 @@
+# properties/engine_matching/training.py
+"""
+Ajuste offline de MatchingWeight a partir del historial (comando train_matching_weights).
+
+Ejemplos (requerimiento, propiedad):
+- positivos: MatchEvent y Proposal aceptadas
+- negativos: Proposal rechazadas y, por cada requerimiento con positivos, los
+  RequirementMatch que se le mostraron y no terminaron en positivo (los de mayor score,
+  hasta `negatives_per_positive` por positivo)
+
+Features: subscore de cada criterio no excluyente (calculate_scores_batch), centrado en
+el neutral: x = subscore - 0.5, y 0 si el criterio no aplica al requerimiento. Los hard
+filters valen 1.0 en todo par admitido, no se pueden aprender y no se tocan.
+
+Modelo: regresión logística con L2, resuelta por Newton (IRLS) en NumPy; clases
+balanceadas con pesos por muestra. Un coeficiente alto = coincidir en ese criterio
+predice aceptación. Los coeficientes se pasan a pesos (piso MIN_WEIGHT), se reescalan
+a la misma suma que tenían esas claves (los hard filters conservan su parte) y se
+mezclan con los actuales (`blend`). Se escriben en una transacción que sube la
+versión de pesos, así todos los procesos recargan.
+"""
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from properties.models import MatchEvent, MatchingWeight, Property, Proposal, Requirement, RequirementMatch
+
+from .criteria import concat_column
+from .engine import calculate_scores_batch, load_candidate_arrays
+from .profile import get_requirement_profile
+from .registry import HardFilterCriterion, get_criterion, iter_criteria
+from .weights import default_weights, invalidate_matching_weights, load_weights
+
+logger = logging.getLogger(__name__)
+
+MIN_WEIGHT = 0.1        # mismo piso que record_positive_match
+LOAD_CHUNK = 1000       # ids por query (SQL Server admite ~2100 parámetros)
+
+Pair = Tuple[int, int]
+
+
+# -----------------------------
+# Datos
+# -----------------------------
+def collect_labels(negatives_per_positive: int = 3) -> Dict[Pair, int]:
+    """{(requirement_id, property_id): 1 | 0}. Si un par es positivo y negativo, gana el positivo."""
+    labels: Dict[Pair, int] = {}
+    for pair in MatchEvent.objects.values_list("requirement_id", "property_id"):
+        labels[pair] = 1
+
+    proposals = (
+        Proposal.objects
+        .filter(requirement_match__isnull=False, status__in=(Proposal.STATUS_ACCEPTED, Proposal.STATUS_REJECTED))
+        .values_list("requirement_match__requirement_id", "property_id", "status")
+    )
+    for req_id, prop_id, status in proposals:
+        if status == Proposal.STATUS_ACCEPTED:
+            labels[(req_id, prop_id)] = 1
+        else:
+            labels.setdefault((req_id, prop_id), 0)
+
+    positives = defaultdict(int)
+    for (req_id, _), label in labels.items():
+        positives[req_id] += label
+    if negatives_per_positive > 0 and positives:
+        budget = {req_id: n * negatives_per_positive for req_id, n in positives.items() if n}
+        shown = (
+            RequirementMatch.objects
+            .filter(requirement_id__in=list(budget))
+            .order_by("requirement_id", "-score")
+            .values_list("requirement_id", "property_id")
+        )
+        for pair in shown:
+            if pair in labels or budget[pair[0]] <= 0:
+                continue
+            labels[pair] = 0
+            budget[pair[0]] -= 1
+    return labels
+
+
+def feature_keys() -> List[str]:
+    """Claves de MatchingWeight que se pueden aprender (criterios no excluyentes, en orden de registro)."""
+    keys = []
+    for c in iter_criteria():
+        if not isinstance(c, HardFilterCriterion) and c.key not in keys:
+            keys.append(c.key)
+    return keys
+
+
+def _load_arrays(prop_ids: List[int]) -> Tuple[Dict[str, np.ndarray], Dict[int, int]]:
+    """Columnas de score de estas propiedades (activas o no: el historial incluye vendidas)."""
+    parts = [
+        load_candidate_arrays(Property.objects.filter(pk__in=prop_ids[i:i + LOAD_CHUNK]))
+        for i in range(0, len(prop_ids), LOAD_CHUNK)
+    ]
+    arrays = {name: concat_column(*(p[name] for p in parts)) for name in parts[0]}
+    return arrays, {int(pk): i for i, pk in enumerate(arrays["id"])}
+
+
+def build_dataset(labels: Mapping[Pair, int], keys: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """(X, y): una fila por par con features de `keys` (ver docstring del módulo)."""
+    by_req: Dict[int, List[Tuple[int, int]]] = defaultdict(list)
+    for (req_id, prop_id), label in labels.items():
+        by_req[req_id].append((prop_id, label))
+    if not by_req:
+        return np.zeros((0, len(keys))), np.zeros(0)
+
+    arrays, row_of = _load_arrays(sorted({prop_id for _, prop_id in labels}))
+    column = {key: j for j, key in enumerate(keys)}
+    weights = load_weights()
+    blocks, targets = [], []
+
+    reqs = list(
+        Requirement.objects
+        .filter(pk__in=list(by_req))
+        .select_related("operation_type", "payment_method")
+    )
+    for req in reqs:
+        pairs = [(row_of[p], label) for p, label in by_req[req.pk] if p in row_of]
+        if not pairs:
+            continue
+        idx = np.array([row for row, _ in pairs])
+        sub = {name: col[idx] for name, col in arrays.items()}
+        batch = calculate_scores_batch(get_requirement_profile(req), sub, weights)
+
+        block = np.zeros((len(idx), len(keys)))
+        for name, values in batch["subscores"].items():
+            j = column.get(get_criterion(name).key)
+            if j is not None:
+                block[:, j] = np.asarray(values, dtype=float) - 0.5
+        blocks.append(block)
+        targets.append(np.array([label for _, label in pairs], dtype=float))
+
+    if not blocks:
+        return np.zeros((0, len(keys))), np.zeros(0)
+    return np.vstack(blocks), np.concatenate(targets)
+
+
+# -----------------------------
+# Modelo
+# -----------------------------
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -35.0, 35.0)))
+
+
+def fit_logistic(
+    X: np.ndarray,
+    y: np.ndarray,
+    *,
+    l2: float = 1.0,
+    sample_weight: Optional[np.ndarray] = None,
+    max_iter: int = 50,
+    tol: float = 1e-8,
+) -> Dict[str, Any]:
+    """
+    Regresión logística (con intercepto, sin regularizarlo) por Newton-Raphson.
+    Retorna {"intercept", "coef", "iterations", "log_loss"}.
+    """
+    n, d = X.shape
+    A = np.hstack([np.ones((n, 1)), X])
+    sw = np.ones(n) if sample_weight is None else sample_weight
+    reg = np.full(d + 1, float(l2))
+    reg[0] = 0.0
+
+    beta = np.zeros(d + 1)
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        p = _sigmoid(A @ beta)
+        grad = A.T @ (sw * (p - y)) + reg * beta
+        hess = (A.T * (sw * p * (1.0 - p))) @ A + np.diag(reg)
+        step = np.linalg.lstsq(hess, grad, rcond=None)[0]
+        beta -= step
+        if np.max(np.abs(step)) < tol:
+            break
+
+    p = np.clip(_sigmoid(A @ beta), 1e-12, 1 - 1e-12)
+    log_loss = float(-np.sum(sw * (y * np.log(p) + (1 - y) * np.log(1 - p))) / np.sum(sw))
+    return {"intercept": float(beta[0]), "coef": beta[1:], "iterations": iterations, "log_loss": log_loss}
+
+
+def weights_from_coef(
+    coef: np.ndarray,
+    keys: List[str],
+    current: Mapping[str, float],
+    *,
+    blend: float = 0.5,
+) -> Dict[str, float]:
+    """Coeficientes -> pesos nuevos de `keys` (misma suma que los actuales, mezclados por `blend`)."""
+    defaults = default_weights()
+    old = np.array([float(current.get(k, defaults.get(k, 1.0))) for k in keys])
+    fitted = np.maximum(coef, MIN_WEIGHT)
+    fitted = fitted * (old.sum() / fitted.sum())
+    new = (1.0 - blend) * old + blend * fitted
+    return {key: round(max(MIN_WEIGHT, float(w)), 4) for key, w in zip(keys, new)}
+
+
+# -----------------------------
+# Entry point
+# -----------------------------
+def train_weights(
+    *,
+    l2: float = 1.0,
+    blend: float = 0.5,
+    negatives_per_positive: int = 3,
+    min_samples: int = 30,
+    dry_run: bool = False,
+) -> Dict[str, Any]:
+    """
+    Entrena y (salvo dry_run) escribe los pesos. Retorna un reporte; "written" dice si se escribió.
+    No escribe si hay menos de `min_samples` positivos o negativos.
+    """
+    labels = collect_labels(negatives_per_positive)
+    all_keys = feature_keys()
+    X, y = build_dataset(labels, all_keys)
+    n_pos, n_neg = int(y.sum()), int(len(y) - y.sum())
+    report: Dict[str, Any] = {"samples": len(y), "positives": n_pos, "negatives": n_neg, "written": False}
+
+    if min(n_pos, n_neg) < max(min_samples, 1):
+        report["skipped"] = f"se necesitan al menos {min_samples} positivos y negativos"
+        return report
+
+    # un criterio que no varía en el historial no dice nada: su peso queda igual
+    varying = np.flatnonzero(X.std(axis=0) > 1e-9)
+    keys = [all_keys[j] for j in varying]
+    if not keys:
+        report["skipped"] = "ningún criterio varía en el historial"
+        return report
+
+    sample_weight = np.where(y == 1, len(y) / (2.0 * n_pos), len(y) / (2.0 * n_neg))
+    model = fit_logistic(X[:, varying], y, l2=l2, sample_weight=sample_weight)
+    current = load_weights()
+    new = weights_from_coef(model["coef"], keys, current, blend=blend)
+
+    report.update(
+        iterations=model["iterations"],
+        log_loss=round(model["log_loss"], 6),
+        intercept=round(model["intercept"], 6),
+        weights={
+            key: {
+                "current": float(current.get(key, 1.0)),
+                "coef": round(float(c), 6),
+                "new": new[key],
+            }
+            for key, c in zip(keys, model["coef"])
+        },
+    )
+    if not dry_run:
+        write_weights(new)
+        report["written"] = True
+    return report
+
+
+@transaction.atomic
+def write_weights(new: Mapping[str, float]) -> None:
+    """Reemplaza estos pesos en una sola transacción y sube la versión (todos los procesos recargan)."""
+    existing = {w.key: w for w in MatchingWeight.objects.select_for_update().filter(key__in=list(new))}
+    now = timezone.now()
+    to_update = []
+    for key, weight in new.items():
+        obj = existing.get(key)
+        if obj is None:
+            MatchingWeight.objects.create(key=key, weight=weight)
+        elif obj.weight != weight:
+            obj.weight = weight
+            obj.updated_at = now
+            to_update.append(obj)
+    if to_update:
+        MatchingWeight.objects.bulk_update(to_update, ["weight", "updated_at"])
+    # bulk_update no dispara post_save
+    invalidate_matching_weights()
+    logger.info("MatchingWeight reentrenados: %s", dict(new))
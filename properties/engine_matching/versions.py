@@ -0,0 +1,121 @@
+# properties/engine_matching/versions.py
+"""
+Contadores de versión en el cache de Django, para invalidar caches en proceso
+(índice invertido, resultados de matching) sin tener que avisar a cada worker.
+
+El inventario además deja un log de cambios: versión -> id de la Property que la
+subió, para que el snapshot (snapshot.py) pueda actualizarse solo con esas filas.
+
+Los contadores solo sirven si el cache es compartido entre procesos: con LocMem cada
+worker tiene los suyos y nunca ve los bumps de los demás (warn_if_local_cache lo avisa
+al arrancar con DEBUG apagado; los caches de cada proceso igual expiran solos). Y aun en Redis una clave puede desaparecer (LRU,
+reinicio): por eso un contador nuevo arranca en el reloj (µs) y no en 1, así no
+vuelve a un número que algún proceso ya tenga cacheado.
+"""
+import logging
+import time
+from typing import Optional, Set
+
+from django.conf import settings
+from django.core.cache import cache
+
+INVENTORY_VERSION_KEY = "engine_matching:inventory_version"
+INVENTORY_CHANGES_KEY = "engine_matching:inventory_changes"
+WEIGHTS_VERSION_KEY = "engine_matching:weights_version"
+
+logger = logging.getLogger(__name__)
+
+CHANGE_LOG_TIMEOUT = 24 * 60 * 60
+# Más versiones que esto entre dos lecturas (o un contador resembrado): recarga completa
+CHANGE_LOG_MAX_SPAN = 5000
+
+LOCAL_CACHE_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def warn_if_local_cache() -> bool:
+    """
+    Avisa (logger.warning) si, con DEBUG apagado, el cache default es por proceso: las
+    invalidaciones (snapshot, profiles, pesos, facets) no llegan a los demás workers y
+    cada uno ve los cambios ajenos recién al expirar sus caches. No impide arrancar:
+    hasta tener REDIS_URL producción corre así. MATCHING_ALLOW_LOCAL_CACHE=True lo silencia
+    (un solo proceso). True si avisó.
+    """
+    if settings.DEBUG or getattr(settings, "MATCHING_ALLOW_LOCAL_CACHE", False):
+        return False
+    backend = settings.CACHES.get("default", {}).get("BACKEND", "")
+    if backend not in LOCAL_CACHE_BACKENDS:
+        return False
+    logger.warning(
+        "CACHES['default'] usa %s: los contadores de versión del matching no se comparten "
+        "entre procesos. Configura REDIS_URL (o MATCHING_ALLOW_LOCAL_CACHE=True si corre un solo proceso).",
+        backend,
+    )
+    return True
+
+
+def get_version(key: str) -> int:
+    try:
+        return cache.get(key, 0)
+    except Exception:
+        return 0
+
+
+def bump_version(key: str) -> Optional[int]:
+    """Sube la versión y devuelve la nueva. None si el cache no está disponible."""
+    seed = time.time_ns() // 1000
+    try:
+        if cache.add(key, seed, None):
+            return seed
+        return cache.incr(key)
+    except Exception:
+        return None
+
+
+def get_inventory_version() -> int:
+    """Versión global del inventario de propiedades (sube en cada save/delete de Property)."""
+    return get_version(INVENTORY_VERSION_KEY)
+
+
+def bump_inventory_version(prop_id: Optional[int] = None) -> None:
+    """
+    Sin `prop_id` (bulk_create, .update() masivos) la versión queda sin entrada en el
+    log y quien la lea tiene que recargar todo.
+    """
+    version = bump_version(INVENTORY_VERSION_KEY)
+    if version is None or prop_id is None:
+        return
+    try:
+        cache.set(f"{INVENTORY_CHANGES_KEY}:{version}", prop_id, CHANGE_LOG_TIMEOUT)
+    except Exception:
+        pass
+
+
+def inventory_changes(since: int, until: int) -> Optional[Set[int]]:
+    """
+    Ids de Property cambiadas entre dos versiones del inventario (since, until].
+    None si el log está incompleto (bump masivo, entrada expirada o cache reiniciado).
+    """
+    if until < since or until - since > CHANGE_LOG_MAX_SPAN:
+        return None
+    keys = [f"{INVENTORY_CHANGES_KEY}:{v}" for v in range(since + 1, until + 1)]
+    if not keys:
+        return set()
+    try:
+        found = cache.get_many(keys)
+    except Exception:
+        return None
+    if len(found) != len(keys):
+        return None
+    return set(found.values())
+
+
+def get_weights_version() -> int:
+    """Versión de la tabla MatchingWeight (sube en cada save/delete o ajuste de pesos)."""
+    return get_version(WEIGHTS_VERSION_KEY)
+
+
+def bump_weights_version() -> None:
+    bump_version(WEIGHTS_VERSION_KEY)
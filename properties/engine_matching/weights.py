@@ -0,0 +1,85 @@
+# properties/engine_matching/weights.py
+"""
+Pesos del motor: la tabla MatchingWeight, con default_weights() para las claves que no existan.
+Cada criterio usa su `key` (ver registry.py); una clave sin peso vale 1.0.
+Con settings.MATCHING_EQUAL_WEIGHTS (el default) todos valen 1.0 y la tabla no se lee:
+los scores quedan iguales a los del motor anterior (100 / criterios activos).
+
+Los pesos se cachean por proceso y se recargan solo cuando sube la versión
+compartida (signals.py la sube en cada save/delete de MatchingWeight;
+record_positive_match, que actualiza con F(), la sube a mano).
+"""
+import threading
+from types import MappingProxyType
+from typing import Dict, Iterable, Mapping, Optional
+
+from django.conf import settings
+from django.db import transaction
+
+from properties.models import MatchingWeight
+
+from .registry import iter_criteria
+from .versions import bump_weights_version, get_weights_version
+
+
+def default_weights() -> Dict[str, float]:
+    """Peso por defecto de cada clave registrada (Criterion.default_weight); solo estas claves existen."""
+    defaults: Dict[str, float] = {}
+    for criterion in iter_criteria():
+        defaults.setdefault(criterion.key, criterion.default_weight)
+    return defaults
+
+
+_cached: Optional[tuple] = None  # (versión, pesos)
+_cached_lock = threading.Lock()
+
+
+def load_weights() -> Mapping[str, float]:
+    """Pesos vigentes (solo lectura). Sin query mientras la versión no cambie."""
+    global _cached
+    if getattr(settings, "MATCHING_EQUAL_WEIGHTS", False):
+        return MappingProxyType(dict.fromkeys(default_weights(), 1.0))
+    version = get_weights_version()
+    cached = _cached
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    weights = default_weights()
+    weights.update(MatchingWeight.objects.values_list("key", "weight"))
+    frozen = MappingProxyType(weights)
+    with _cached_lock:
+        _cached = (version, frozen)
+    return frozen
+
+
+def invalidate_weights() -> None:
+    """Descarta solo el cache de este proceso."""
+    global _cached
+    with _cached_lock:
+        _cached = None
+
+
+def invalidate_matching_weights() -> None:
+    """
+    Invalida los pesos en todos los procesos: este proceso ahora, y la versión
+    compartida ahora y otra vez tras el commit (por si alguien recargó antes del commit).
+    """
+    invalidate_weights()
+    bump_weights_version()
+    transaction.on_commit(bump_weights_version)
+
+
+def field_weights(criteria: Iterable, weights: Optional[Mapping[str, float]] = None) -> Dict[str, float]:
+    """
+    Peso de cada criterio activo, normalizado para que la suma sea 100.
+    Si todos los pesos son 0 (o negativos), se reparte en partes iguales.
+    """
+    criteria = list(criteria)
+    if weights is None:
+        weights = load_weights()
+
+    raw = {c.name: max(0.0, float(weights.get(c.key, 1.0))) for c in criteria}
+    total = sum(raw.values())
+    if total <= 0:
+        return {name: 100.0 / len(raw) for name in raw} if raw else {}
+    return {name: 100.0 * w / total for name, w in raw.items()}
@@ -0,0 +1,111 @@
+# properties/facets.py
+"""
+Opciones de los filtros del dashboard (tipos, distritos, métodos de pago, agentes,
+orígenes, urbanizaciones, estados), calculadas una vez y guardadas en el cache de
+Django: cada carga del dashboard es una lectura de cache en vez de siete queries.
+
+Invalidación por contador de versión (como engine_matching/versions.py): signals.py
+la sube al guardar/borrar los catálogos, usuarios o roles. Property cambia demasiado
+seguido para eso: solo invalida si trae un `source` o `district` que no está en las
+opciones (note_property). Lo que deja de usarse sale al expirar FACETS_TIMEOUT, igual
+que los cambios por .update()/bulk_create, que no disparan signals.
+"""
+from typing import Any, Dict, Optional
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from .engine_matching.versions import bump_version, get_version
+from .models import PaymentMethod, Property, PropertyStatus, PropertyType, Urbanization
+from .ubigeo import get_ubigeo_names
+
+FACETS_VERSION_KEY = "properties:dashboard_facets_version"
+FACETS_TIMEOUT = 60 * 60
+
+AGENT_ROLES = ("Agente interno", "Agente externo", "Agente remax")
+
+
+def _cache_key() -> str:
+    return f"properties:dashboard_facets:{get_version(FACETS_VERSION_KEY)}"
+
+
+def _districts(values) -> list:
+    """`district` guarda ID (formulario) o nombre (importadores): una opción por valor distinto."""
+    names = get_ubigeo_names()
+    seen = set()
+    districts = []
+    for value in values:
+        if value.isdigit():
+            key = (value, names.district(value))
+            option = {'id': int(value), 'name': key[1]}
+        else:
+            key = ('', value)
+            option = {'id': '', 'name': value}
+        if key not in seen:
+            seen.add(key)
+            districts.append(option)
+    return sorted(districts, key=lambda x: (x.get('name') or ''))
+
+
+def build_dashboard_facets() -> Dict[str, Any]:
+    district_values = sorted({
+        str(d).strip()
+        for d in Property.objects.filter(is_draft=False).order_by().values_list('district', flat=True).distinct()
+        if d and str(d).strip()
+    })
+    agents = (
+        get_user_model().objects
+        .filter(is_active=True, role__name__in=AGENT_ROLES)
+        .order_by("first_name", "last_name", "username")
+    )
+    return {
+        'property_types': list(PropertyType.objects.filter(is_active=True).order_by('name').values('id', 'name')),
+        'payment_methods': list(PaymentMethod.objects.filter(is_active=True).order_by('order').values('id', 'name')),
+        'agents': [{'id': u.id, 'name': u.get_full_name() or u.username} for u in agents],
+        'districts_list': _districts(district_values),
+        'district_values': district_values,
+        'sources': list(
+            Property.objects.exclude(source__isnull=True)
+            .exclude(source="")
+            .values_list("source", flat=True)
+            .distinct()
+            .order_by("source")
+        ),
+        'urbanizations_list': list(Urbanization.objects.filter(is_active=True).order_by('name').values('id', 'name')),
+        'statuses': list(PropertyStatus.objects.filter(is_active=True).order_by('order').values('id', 'name')),
+    }
+
+
+def _cached() -> Optional[Dict[str, Any]]:
+    try:
+        return cache.get(_cache_key())
+    except Exception:
+        return None
+
+
+def get_dashboard_facets() -> Dict[str, Any]:
+    facets = _cached()
+    if facets is None:
+        facets = build_dashboard_facets()
+        try:
+            cache.set(_cache_key(), facets, FACETS_TIMEOUT)
+        except Exception:
+            pass
+    return facets
+
+
+def invalidate_dashboard_facets() -> None:
+    bump_version(FACETS_VERSION_KEY)
+
+
+def note_property(prop) -> None:
+    """Invalida solo si la propiedad trae un origen o distrito que las opciones no tienen."""
+    facets = _cached()
+    if facets is None:
+        return
+    source = prop.source or ""
+    district = str(prop.district or "").strip()
+    if (source and source not in facets['sources']) or (
+        district and not prop.is_draft and district not in facets['district_values']
+    ):
+        invalidate_dashboard_facets()
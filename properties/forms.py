@@ -383,6 +383,9 @@ class RequirementCreateForm(forms.ModelForm):
             # m2m
             "districts",
 
+            # amenidades deseadas (texto, separadas por coma)
+            "amenities",
+
             # notas
             "notes",
             "source_group",
@@ -430,6 +433,8 @@ class RequirementCreateForm(forms.ModelForm):
             # m2m districts
             "districts": forms.SelectMultiple(attrs={"class": "form-select", "multiple": "multiple"}),
 
+            "amenities": forms.TextInput(attrs={"class": "form-control", "placeholder": "Piscina, gimnasio, terraza"}),
+
             # notes
             "notes": forms.Textarea(attrs={"class": "form-control", "rows": 2}),
             "source_group": forms.TextInput(attrs={"class": "form-control"}),
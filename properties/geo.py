@@ -0,0 +1,211 @@
+# properties/geo.py
+"""
+Coordenadas numéricas de Property y markers del mapa del dashboard.
+
+`coordinates` es texto libre ("lat, lng"): save() lo parsea una sola vez a
+latitude/longitude + geohash (Property._sync_lat_lng) y las consultas espaciales
+corren en SQL sobre esas columnas.
+
+Geohash: celdas de GEOHASH_PRECISION caracteres (~5 m). Un bbox se cubre con pocos
+prefijos (a lo sumo MAX_COVER_CELLS, de la precisión más fina que alcance), que son
+LIKE 'prefijo%' sobre idx_prop_geohash; el rango exacto de lat/lng recorta los bordes.
+Un radio es su bbox más la distancia haversine calculada en la BD.
+
+Tiling: los clusters se agrupan en una grilla alineada a los tiles del mapa
+(CELLS_PER_TILE celdas por tile de 256px en cada eje, para el zoom pedido). Un mismo
+punto cae en la misma celda al desplazar el mapa, y el bbox se expande a celdas
+enteras, así dos viewports parecidos piden (y cachean) lo mismo.
+"""
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+from django.db.models import Avg, Count, F, FloatField, Max, Min, Q, Value
+from django.db.models.functions import ASin, Cos, Floor, Power, Radians, Sin, Sqrt
+
+CELLS_PER_TILE = 4
+MAX_ZOOM = 21
+
+GEOHASH_PRECISION = 9
+MAX_COVER_CELLS = 16
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = 111320.0
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+BBox = Tuple[float, float, float, float]   # (south, west, north, east)
+
+_NUMBER_RE = re.compile(r"[-+]?\d+(?:\.\d+)?")
+
+
+def parse_coordinates(value) -> Tuple[Optional[float], Optional[float]]:
+    """'lat, lng' -> (lat, lng). (None, None) si no son exactamente dos números en rango."""
+    if not value:
+        return None, None
+    numbers = _NUMBER_RE.findall(str(value))
+    if len(numbers) != 2:
+        return None, None
+    lat, lng = float(numbers[0]), float(numbers[1])
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0) or (lat == 0.0 and lng == 0.0):
+        return None, None
+    return lat, lng
+
+
+def geohash_for(value) -> Tuple[Optional[float], Optional[float], str]:
+    """(latitude, longitude, geohash) de un texto `coordinates`; (None, None, "") si no se entiende."""
+    lat, lng = parse_coordinates(value)
+    if lat is None:
+        return None, None, ""
+    return lat, lng, encode_geohash(lat, lng)
+
+
+def parse_bbox(value) -> Optional[BBox]:
+    """
+    'south,west,north,east' (como LatLngBounds.toUrlValue()) recortado al rango válido,
+    o None si no es válido o queda fuera del mundo.
+    """
+    try:
+        south, west, north, east = (float(x) for x in str(value or "").split(","))
+    except ValueError:
+        return None
+    if not all(map(math.isfinite, (south, west, north, east))):
+        return None
+    south, west, north, east = max(south, -90.0), max(west, -180.0), min(north, 90.0), min(east, 180.0)
+    if south > north or west > east:
+        return None
+    return south, west, north, east
+
+
+def cell_size(zoom: int) -> float:
+    """Lado de una celda de la grilla, en grados, para este zoom."""
+    return 360.0 / (2 ** zoom * CELLS_PER_TILE)
+
+
+def snap_bbox(bbox: BBox, size: float) -> BBox:
+    """Expande el bbox a celdas enteras de la grilla."""
+    south, west, north, east = bbox
+    return (
+        max(math.floor(south / size) * size, -90.0),
+        max(math.floor(west / size) * size, -180.0),
+        min(math.ceil(north / size) * size, 90.0),
+        min(math.ceil(east / size) * size, 180.0),
+    )
+
+
+# -----------------------------
+# Geohash
+# -----------------------------
+def encode_geohash(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = value = 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """(alto, ancho) en grados de una celda de esta precisión."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def geohash_cover(bbox: BBox, max_cells: int = MAX_COVER_CELLS) -> List[str]:
+    """Prefijos que cubren el bbox: la precisión más fina con <= max_cells celdas ([] = todo el mundo)."""
+    south, west, north, east = bbox
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = geohash_cell_size(precision)
+        rows = range(math.floor((south + 90.0) / height), math.floor((north + 90.0) / height) + 1)
+        cols = range(math.floor((west + 180.0) / width), math.floor((east + 180.0) / width) + 1)
+        if len(rows) * len(cols) > max_cells:
+            continue
+        return sorted({
+            encode_geohash(
+                min(-90.0 + (r + 0.5) * height, 90.0),
+                min(-180.0 + (c + 0.5) * width, 180.0),
+                precision,
+            )
+            for r in rows for c in cols
+        })
+    return []
+
+
+# -----------------------------
+# Consultas
+# -----------------------------
+def in_bbox(queryset, bbox: BBox):
+    south, west, north, east = bbox
+    cover = Q()
+    for prefix in geohash_cover(bbox):
+        cover |= Q(geohash__startswith=prefix)
+    return queryset.filter(cover, latitude__range=(south, north), longitude__range=(west, east))
+
+
+def radius_bbox(lat: float, lng: float, meters: float) -> BBox:
+    dlat = meters / METERS_PER_DEGREE
+    dlng = meters / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    return max(lat - dlat, -90.0), max(lng - dlng, -180.0), min(lat + dlat, 90.0), min(lng + dlng, 180.0)
+
+
+def distance_expression(lat: float, lng: float):
+    """Distancia haversine en metros desde (lat, lng) a latitude/longitude de la fila."""
+    lat1, lng1 = Value(math.radians(lat), FloatField()), Value(math.radians(lng), FloatField())
+    lat2, lng2 = Radians(F("latitude")), Radians(F("longitude"))
+    a = (
+        Power(Sin((lat2 - lat1) / 2), 2)
+        + Cos(lat1) * Cos(lat2) * Power(Sin((lng2 - lng1) / 2), 2)
+    )
+    return Value(2 * EARTH_RADIUS_M, FloatField()) * ASin(Sqrt(a))
+
+
+def within_radius(queryset, lat: float, lng: float, meters: float):
+    """Propiedades a <= `meters` de (lat, lng), anotadas con distance_m y ordenadas por cercanía."""
+    return (
+        in_bbox(queryset, radius_bbox(lat, lng, meters))
+        .annotate(distance_m=distance_expression(lat, lng))
+        .filter(distance_m__lte=meters)
+        .order_by("distance_m", "id")
+    )
+
+
+def cluster_cells(queryset, size: float) -> List[Dict]:
+    """Un cluster por celda no vacía (GROUP BY en la BD): centroide, cantidad y bbox de la celda."""
+    rows = (
+        queryset
+        .annotate(cell_y=Floor(F("latitude") / size), cell_x=Floor(F("longitude") / size))
+        .order_by()
+        .values("cell_y", "cell_x")
+        .annotate(count=Count("id"), lat=Avg("latitude"), lng=Avg("longitude"))
+    )
+    clusters = []
+    for row in rows:
+        y, x = int(row["cell_y"]), int(row["cell_x"])
+        clusters.append({
+            "lat": round(row["lat"], 6),
+            "lng": round(row["lng"], 6),
+            "count": row["count"],
+            "bbox": [y * size, x * size, (y + 1) * size, (x + 1) * size],
+        })
+    return clusters
+
+
+def extent(queryset) -> Optional[BBox]:
+    """Bbox que contiene todas las propiedades con coordenadas del queryset (None si no hay)."""
+    agg = queryset.filter(latitude__isnull=False, longitude__isnull=False).aggregate(
+        south=Min("latitude"), west=Min("longitude"), north=Max("latitude"), east=Max("longitude"),
+    )
+    if agg["south"] is None:
+        return None
+    return agg["south"], agg["west"], agg["north"], agg["east"]
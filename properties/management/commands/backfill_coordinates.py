@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from properties.engine_matching.versions import bump_inventory_version
+from properties.geo import geohash_for
+from properties.models import Property
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula Property.latitude/longitude/geohash a partir de `coordinates` (propiedades "
+        "guardadas antes de las columnas numéricas o cargadas con bulk_create/.update())."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Filas por bulk_update (default 1000)")
+        parser.add_argument("--dry-run", action="store_true", help="Solo reportar, no escribir")
+
+    def handle(self, *args, **opts):
+        batch_size = opts["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size debe ser >= 1")
+
+        qs = Property.objects.only("id", "coordinates", "latitude", "longitude", "geohash").order_by("id")
+        ids = list(qs.values_list("id", flat=True))
+        scanned = updated = invalid = 0
+
+        for start in range(0, len(ids), batch_size):
+            changed = []
+            for prop in qs.filter(pk__in=ids[start:start + batch_size]):
+                scanned += 1
+                values = geohash_for(prop.coordinates)
+                if values[0] is None and (prop.coordinates or "").strip():
+                    invalid += 1
+                if values != (prop.latitude, prop.longitude, prop.geohash):
+                    prop.latitude, prop.longitude, prop.geohash = values
+                    changed.append(prop)
+            if changed and not opts["dry_run"]:
+                with transaction.atomic():
+                    Property.objects.bulk_update(changed, ["latitude", "longitude", "geohash"], batch_size=batch_size)
+            updated += len(changed)
+
+        if updated and not opts["dry_run"]:
+            # bulk_update no dispara signals: caches del dashboard y del mapa
+            bump_inventory_version()
+
+        prefix = "[dry-run] " if opts["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}OK. revisadas={scanned} actualizadas={updated} sin_parsear={invalid}"
+        ))
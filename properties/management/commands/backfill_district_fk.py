@@ -0,0 +1,68 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from properties.engine_matching.versions import bump_inventory_version
+from properties.models import Property
+from properties.ubigeo import DistrictResolver
+
+
+class Command(BaseCommand):
+    help = (
+        "Completa Property.district_fk a partir del campo legacy `district` (ID o nombre). "
+        "Después conviene correr rematch_all."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Filas por bulk_update (default 1000)")
+        parser.add_argument("--overwrite", action="store_true", help="Recalcular también los que ya tienen district_fk")
+        parser.add_argument("--dry-run", action="store_true", help="Solo reportar, no escribir")
+
+    def handle(self, *args, **opts):
+        batch_size = opts["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size debe ser >= 1")
+
+        resolver = DistrictResolver()
+        qs = Property.objects.exclude(district__isnull=True).exclude(district="")
+        if not opts["overwrite"]:
+            qs = qs.filter(district_fk__isnull=True)
+        qs = qs.only("id", "district", "province", "department", "district_fk").order_by("id")
+
+        scanned = 0
+        changed = []
+        unresolved = Counter()
+        updated = 0
+
+        def flush():
+            nonlocal updated
+            if changed and not opts["dry_run"]:
+                with transaction.atomic():
+                    Property.objects.bulk_update(changed, ["district_fk"], batch_size=batch_size)
+            updated += len(changed)
+            changed.clear()
+
+        # ids primero: no escribir con un cursor abierto (SQL Server sin MARS)
+        ids = list(qs.values_list("id", flat=True))
+        for start in range(0, len(ids), batch_size):
+            for prop in qs.filter(pk__in=ids[start:start + batch_size]):
+                scanned += 1
+                district_id = resolver.resolve(prop.district, prop.province, prop.department)
+                if district_id is None:
+                    unresolved[prop.district.strip()] += 1
+                elif district_id != prop.district_fk_id:
+                    prop.district_fk_id = district_id
+                    changed.append(prop)
+            flush()
+
+        if updated and not opts["dry_run"]:
+            # bulk_update no dispara signals: recarga completa de snapshots y caches
+            bump_inventory_version()
+
+        prefix = "[dry-run] " if opts["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}OK. revisadas={scanned} actualizadas={updated} sin_resolver={sum(unresolved.values())}"
+        ))
+        for value, count in unresolved.most_common(20):
+            self.stdout.write(f"  sin resolver: {value!r} x{count}")
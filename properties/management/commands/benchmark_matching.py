@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from properties.engine_matching.benchmark import generate_catalog, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark del motor de matching sobre un inventario sintético "
+        "(se revierte al terminar salvo --keep). Emite un reporte JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--properties", type=int, default=2000, help="Propiedades sintéticas (default 2000)")
+        parser.add_argument("--requirements", type=int, default=100, help="Requerimientos sintéticos (default 100)")
+        parser.add_argument("--seed", type=int, default=42, help="Semilla del generador (default 42)")
+        parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por requerimiento (default 3)")
+        parser.add_argument("--limit", type=int, default=20, help="Top N de get_matches (default 20)")
+        parser.add_argument("--min-score", type=float, default=None, help="Score mínimo de get_matches")
+        parser.add_argument("--sample", type=int, default=None, help="Medir solo los primeros N requerimientos")
+        parser.add_argument("--output", default=None, help="Archivo JSON de salida (default: stdout)")
+        parser.add_argument("--keep", action="store_true", help="No revertir el inventario sintético")
+
+    def handle(self, *args, **opts):
+        for name in ("properties", "requirements", "repeat"):
+            if opts[name] < 1:
+                raise CommandError(f"--{name} debe ser >= 1")
+
+        with transaction.atomic():
+            catalog = generate_catalog(opts["properties"], opts["requirements"], seed=opts["seed"])
+            report = run_benchmark(
+                catalog["requirements"],
+                repeat=opts["repeat"],
+                limit=opts["limit"],
+                min_score=opts["min_score"],
+                sample=opts["sample"],
+            )
+            report["meta"].update(properties=len(catalog["properties"]), seed=opts["seed"])
+            if not opts["keep"]:
+                transaction.set_rollback(True)
+
+        payload = json.dumps(report, indent=2, ensure_ascii=False)
+        if opts["output"]:
+            with open(opts["output"], "w", encoding="utf-8") as fh:
+                fh.write(payload + "\n")
+            self.stdout.write(self.style.SUCCESS(
+                f"OK. reporte en {opts['output']} "
+                f"(requirements={report['meta']['requirements']} elapsed={report['elapsed_s']}s)"
+            ))
+        else:
+            self.stdout.write(payload)
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from properties.engine_matching.queue import process_jobs, process_property_jobs
+from properties.engine_matching.versions import warn_if_local_cache
+from properties.engine_matching.reverse import REVERSE_MATCH_LIMIT, REVERSE_MATCH_MIN_SCORE
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker de las colas de matching: requerimientos editados (MatchRecalcJob) "
+        "y propiedades guardadas (PropertyMatchJob)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="Jobs por lote (default 100)")
+        parser.add_argument("--sleep", type=float, default=5.0, help="Segundos de espera con la cola vacía (default 5)")
+        parser.add_argument("--limit", type=int, default=REVERSE_MATCH_LIMIT, help="Top N matches por requerimiento")
+        parser.add_argument("--min-score", type=float, default=REVERSE_MATCH_MIN_SCORE, help="Score mínimo a guardar")
+        parser.add_argument("--once", action="store_true", help="Vaciar lo vencido y salir (para cron)")
+
+    def handle(self, *args, **opts):
+        if opts["batch_size"] < 1:
+            raise CommandError("--batch-size debe ser >= 1")
+        # el worker invalida caches de los procesos web: sin cache compartido no les llega
+        warn_if_local_cache()
+
+        total = 0
+        while True:
+            stats = process_jobs(opts["batch_size"], limit=opts["limit"], min_score=opts["min_score"])
+            if stats["claimed"]:
+                self.stdout.write(
+                    f"jobs={stats['claimed']} requirements={stats['requirements']} "
+                    f"rows_written={stats['written']} deleted={stats['deleted']} failed={stats['failed']}"
+                )
+            prop_stats = process_property_jobs(opts["batch_size"], limit=opts["limit"], min_score=opts["min_score"])
+            if prop_stats["claimed"]:
+                self.stdout.write(
+                    f"jobs={prop_stats['claimed']} properties={prop_stats['properties']} "
+                    f"rows_saved={prop_stats['saved']} removed={prop_stats['removed']} failed={prop_stats['failed']}"
+                )
+            if stats["claimed"] or prop_stats["claimed"]:
+                total += stats["claimed"] + prop_stats["claimed"]
+                continue
+
+            if opts["once"]:
+                break
+            # conexiones caídas / CONN_MAX_AGE entre vueltas, como en un request
+            close_old_connections()
+            time.sleep(opts["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(f"OK. jobs procesados={total}"))
@@ -0,0 +1,65 @@
+import time
+from datetime import datetime, time as dtime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from properties.engine_matching.rematch import rematch_all, select_requirement_ids
+
+
+def _parse_since(value):
+    if not value:
+        return None
+    dt = parse_datetime(value)
+    if dt is None:
+        d = parse_date(value)
+        if d is None:
+            raise CommandError(f"--since inválido: {value!r} (usa YYYY-MM-DD o ISO datetime)")
+        dt = datetime.combine(d, dtime.min)
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
+class Command(BaseCommand):
+    help = "Recalcula RequirementMatch para todos los requerimientos activos (o solo lo cambiado con --since)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=10, help="Top N matches por requerimiento (default 10)")
+        parser.add_argument("--min-score", type=float, default=80.0, help="Score mínimo a guardar (default 80)")
+        parser.add_argument("--workers", type=int, default=1, help="Procesos para el scoring (default 1)")
+        parser.add_argument("--batch-size", type=int, default=500, help="Filas por bulk_create (default 500)")
+        parser.add_argument(
+            "--since",
+            default=None,
+            help="Incremental: requerimientos editados desde esta fecha + los afectados por propiedades editadas",
+        )
+
+    def handle(self, *args, **opts):
+        since = _parse_since(opts["since"])
+        if opts["workers"] < 1:
+            raise CommandError("--workers debe ser >= 1")
+
+        started = time.perf_counter()
+        req_ids = select_requirement_ids(since)
+        if not req_ids:
+            self.stdout.write("No hay requerimientos para recalcular.")
+            return
+
+        self.stdout.write(f"Recalculando {len(req_ids)} requerimientos (workers={opts['workers']})...")
+
+        stats = rematch_all(
+            req_ids,
+            limit=opts["limit"],
+            min_score=opts["min_score"],
+            workers=opts["workers"],
+            batch_size=opts["batch_size"],
+        )
+
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f"OK. requirements={stats['requirements']} groups={stats['groups']} "
+            f"rows_written={stats['written']} created={stats['created']} deleted={stats['deleted']} "
+            f"elapsed={elapsed:.2f}s req/s={stats['requirements'] / elapsed:.1f} rows/s={stats['written'] / elapsed:.1f}"
+        ))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from properties.amenities import encode_amenities
+from properties.engine_matching.versions import bump_inventory_version
+from properties.models import Property
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula Property.amenity_tokens a partir de `amenities` (propiedades guardadas antes "
+        "de la tokenización o cargadas con bulk_create). Después conviene correr rematch_all."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Filas por bulk_update (default 1000)")
+        parser.add_argument("--dry-run", action="store_true", help="Solo reportar, no escribir")
+
+    def handle(self, *args, **opts):
+        batch_size = opts["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size debe ser >= 1")
+
+        qs = Property.objects.only("id", "amenities", "amenity_tokens").order_by("id")
+        ids = list(qs.values_list("id", flat=True))
+        scanned = updated = 0
+
+        for start in range(0, len(ids), batch_size):
+            with transaction.atomic():
+                changed = []
+                for prop in qs.filter(pk__in=ids[start:start + batch_size]):
+                    scanned += 1
+                    tokens = encode_amenities(prop.amenities)
+                    if tokens != prop.amenity_tokens:
+                        prop.amenity_tokens = tokens
+                        changed.append(prop)
+                Property.objects.bulk_update(changed, ["amenity_tokens"], batch_size=batch_size)
+                updated += len(changed)
+                if opts["dry_run"]:
+                    # tampoco quedan los tokens nuevos del vocabulario
+                    transaction.set_rollback(True)
+
+        if updated and not opts["dry_run"]:
+            # bulk_update no dispara signals: recarga completa de snapshots y caches
+            bump_inventory_version()
+
+        prefix = "[dry-run] " if opts["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(f"{prefix}OK. revisadas={scanned} actualizadas={updated}"))
@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from properties.engine_matching.training import train_weights
+
+
+class Command(BaseCommand):
+    help = (
+        "Reentrena MatchingWeight con regresión logística sobre el historial "
+        "(MatchEvent, Proposal aceptadas/rechazadas y matches mostrados sin respuesta)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--l2", type=float, default=1.0, help="Regularización L2 (default 1.0)")
+        parser.add_argument("--blend", type=float, default=0.5, help="0..1: cuánto del peso ajustado se aplica (default 0.5)")
+        parser.add_argument(
+            "--negatives-per-positive", type=int, default=3,
+            help="Matches mostrados sin respuesta por cada positivo del requerimiento (default 3)",
+        )
+        parser.add_argument("--min-samples", type=int, default=30, help="Mínimo de positivos y de negativos (default 30)")
+        parser.add_argument("--dry-run", action="store_true", help="Solo reportar, no escribir pesos")
+        parser.add_argument("--output", default=None, help="Archivo JSON con el reporte")
+
+    def handle(self, *args, **opts):
+        if not 0 <= opts["blend"] <= 1:
+            raise CommandError("--blend debe estar entre 0 y 1")
+        if opts["l2"] < 0:
+            raise CommandError("--l2 debe ser >= 0")
+
+        report = train_weights(
+            l2=opts["l2"],
+            blend=opts["blend"],
+            negatives_per_positive=opts["negatives_per_positive"],
+            min_samples=opts["min_samples"],
+            dry_run=opts["dry_run"],
+        )
+        if opts["output"]:
+            with open(opts["output"], "w", encoding="utf-8") as fh:
+                fh.write(json.dumps(report, indent=2, ensure_ascii=False) + "\n")
+
+        summary = f"muestras={report['samples']} positivos={report['positives']} negativos={report['negatives']}"
+        if "skipped" in report:
+            self.stdout.write(self.style.WARNING(f"Sin cambios ({report['skipped']}). {summary}"))
+            return
+        for key, row in report["weights"].items():
+            self.stdout.write(f"  {key}: {row['current']} -> {row['new']} (coef={row['coef']})")
+        status = "pesos escritos" if report["written"] else "dry-run, no se escribió nada"
+        self.stdout.write(self.style.SUCCESS(f"OK. {status}. {summary} log_loss={report['log_loss']}"))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.10 on 2026-03-20 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0065_event_rejection_reason'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['district_fk', 'operation_type', 'property_type', 'currency', 'availability_status', 'price'], name='idx_prop_match_price'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.10 on 2026-03-24 16:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0066_property_idx_prop_match_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchRecalcJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('enqueued_at', models.DateTimeField(auto_now_add=True)),
+                ('requested_at', models.DateTimeField()),
+                ('run_after', models.DateTimeField(db_index=True)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('locked_by', models.CharField(blank=True, default='', max_length=64)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('requirement', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='recalc_job', to='properties.requirement')),
+            ],
+            options={
+                'verbose_name': 'Recálculo de matches pendiente',
+                'verbose_name_plural': 'Recálculos de matches pendientes',
+                'db_table': 'match_recalc_jobs',
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.10 on 2026-03-26 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0067_matchrecalcjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AmenityToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Token de amenidad',
+                'verbose_name_plural': 'Tokens de amenidades',
+                'db_table': 'amenity_tokens',
+            },
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='amenity_tokens',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='requirement',
+            name='amenities',
+            field=models.TextField(blank=True, help_text='Amenidades deseadas, separadas por coma', null=True),
+        ),
+    ]
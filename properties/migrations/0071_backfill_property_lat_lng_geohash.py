@@ -0,0 +1,84 @@
+import re
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+# Copia congelada de properties/geo.py (parse_coordinates + encode_geohash, precisión 9):
+# la migración no debe cambiar si geo.py cambia después.
+GEOHASH_PRECISION = 9
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_NUMBER_RE = re.compile(r"[-+]?\d+(?:\.\d+)?")
+
+
+def _parse_coordinates(value):
+    if not value:
+        return None, None
+    numbers = _NUMBER_RE.findall(str(value))
+    if len(numbers) != 2:
+        return None, None
+    lat, lng = float(numbers[0]), float(numbers[1])
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0) or (lat == 0.0 and lng == 0.0):
+        return None, None
+    return lat, lng
+
+
+def _encode_geohash(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = value = 0
+    return "".join(chars)
+
+
+def _geohash_for(value):
+    lat, lng = _parse_coordinates(value)
+    if lat is None:
+        return None, None, ""
+    return lat, lng, _encode_geohash(lat, lng)
+
+
+def forwards(apps, schema_editor):
+    Property = apps.get_model("properties", "Property")
+
+    # las columnas nacen vacías: el serializer, el mapper de WordPress y el mapa solo leen estas
+    ids = list(
+        Property.objects.exclude(coordinates__isnull=True).exclude(coordinates="")
+        .order_by("id").values_list("id", flat=True)
+    )
+    for start in range(0, len(ids), BATCH_SIZE):
+        # se lee el lote completo antes de escribir (MSSQL sin MARS)
+        batch = list(
+            Property.objects.filter(pk__in=ids[start:start + BATCH_SIZE])
+            .only("id", "coordinates", "latitude", "longitude", "geohash")
+        )
+        changed = []
+        for prop in batch:
+            values = _geohash_for(prop.coordinates)
+            if values != (prop.latitude, prop.longitude, prop.geohash):
+                prop.latitude, prop.longitude, prop.geohash = values
+                changed.append(prop)
+        if changed:
+            Property.objects.bulk_update(changed, ["latitude", "longitude", "geohash"], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("properties", "0070_property_geohash_idx_prop_geohash"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
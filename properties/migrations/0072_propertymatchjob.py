@@ -0,0 +1,31 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('properties', '0071_backfill_property_lat_lng_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertyMatchJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('enqueued_at', models.DateTimeField(auto_now_add=True)),
+                ('requested_at', models.DateTimeField()),
+                ('run_after', models.DateTimeField(db_index=True)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('locked_by', models.CharField(blank=True, default='', max_length=64)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('property', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='match_job', to='properties.property')),
+            ],
+            options={
+                'verbose_name': 'Matching inverso pendiente',
+                'verbose_name_plural': 'Matching inverso pendiente',
+                'db_table': 'property_match_jobs',
+            },
+        ),
+    ]
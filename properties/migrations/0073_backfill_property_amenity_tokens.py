@@ -0,0 +1,73 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+# Copia congelada de properties/amenities.py (tokenize) y ubigeo.normalize_name:
+# la migración no debe cambiar si esos módulos cambian después.
+TOKEN_SEPARATORS = re.compile(r"[,;/|\n\r\t]+")
+TOKEN_MAX_LENGTH = 100
+
+
+def _normalize_name(text):
+    if not text:
+        return ""
+    plain = ''.join(c for c in unicodedata.normalize('NFD', str(text)) if unicodedata.category(c) != 'Mn')
+    return ' '.join(plain.lower().split())
+
+
+def _tokenize(text):
+    tokens = []
+    for part in TOKEN_SEPARATORS.split(text or ""):
+        token = _normalize_name(part)[:TOKEN_MAX_LENGTH]
+        if token and token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+def forwards(apps, schema_editor):
+    Property = apps.get_model("properties", "Property")
+    AmenityToken = apps.get_model("properties", "AmenityToken")
+
+    # la columna nace vacía: sin tokens el criterio de amenidades puntúa neutro (0.5) a todas
+    ids = list(
+        Property.objects.exclude(amenities__isnull=True).exclude(amenities="")
+        .order_by("id").values_list("id", flat=True)
+    )
+    known = dict(AmenityToken.objects.values_list("name", "id"))
+    for start in range(0, len(ids), BATCH_SIZE):
+        # se lee el lote completo antes de escribir (MSSQL sin MARS)
+        batch = list(
+            Property.objects.filter(pk__in=ids[start:start + BATCH_SIZE]).only("id", "amenities", "amenity_tokens")
+        )
+        names = {prop.pk: _tokenize(prop.amenities) for prop in batch}
+
+        # tokens nuevos del vocabulario, en orden estable (el id define la posición del bit)
+        missing = sorted({name for tokens in names.values() for name in tokens} - known.keys())
+        if missing:
+            AmenityToken.objects.bulk_create([AmenityToken(name=name) for name in missing], batch_size=BATCH_SIZE)
+            # bulk_create no devuelve ids en MSSQL; consultas de a BATCH_SIZE (límite de parámetros)
+            for i in range(0, len(missing), BATCH_SIZE):
+                chunk = missing[i:i + BATCH_SIZE]
+                known.update(AmenityToken.objects.filter(name__in=chunk).values_list("name", "id"))
+
+        changed = []
+        for prop in batch:
+            tokens = " ".join(str(i) for i in sorted({known[name] for name in names[prop.pk]}))
+            if tokens != prop.amenity_tokens:
+                prop.amenity_tokens = tokens
+                changed.append(prop)
+        if changed:
+            Property.objects.bulk_update(changed, ["amenity_tokens"], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("properties", "0072_propertymatchjob"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+import unicodedata
+from collections import defaultdict
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+# Copia congelada de properties/ubigeo.py (normalize_name + DistrictResolver.resolve):
+# la migración no debe cambiar si ubigeo.py cambia después.
+def _normalize_name(text):
+    if not text:
+        return ""
+    plain = ''.join(c for c in unicodedata.normalize('NFD', str(text)) if unicodedata.category(c) != 'Mn')
+    return ' '.join(plain.lower().split())
+
+
+def _same_place(ref_id, ref_name, value):
+    value = str(value or "").strip()
+    if not value:
+        return True
+    if value.isdigit():
+        return int(value) == ref_id
+    return _normalize_name(value) == ref_name
+
+
+def _resolver(District):
+    ids = set()
+    by_name = defaultdict(list)
+    rows = District.objects.values_list(
+        "id", "name",
+        "province_id", "province__name",
+        "province__department_id", "province__department__name",
+    )
+    for pk, name, prov_id, prov_name, dept_id, dept_name in rows:
+        ids.add(pk)
+        by_name[_normalize_name(name)].append(
+            (pk, prov_id, _normalize_name(prov_name), dept_id, _normalize_name(dept_name))
+        )
+
+    def resolve(district, province=None, department=None):
+        value = str(district or "").strip()
+        if not value:
+            return None
+        if value.isdigit():
+            pk = int(value)
+            return pk if pk in ids else None
+        candidates = by_name.get(_normalize_name(value), [])
+        if len(candidates) > 1:
+            candidates = [c for c in candidates if _same_place(c[1], c[2], province)]
+        if len(candidates) > 1:
+            candidates = [c for c in candidates if _same_place(c[3], c[4], department)]
+        return candidates[0][0] if len(candidates) == 1 else None
+
+    return resolve
+
+
+def forwards(apps, schema_editor):
+    Property = apps.get_model("properties", "Property")
+    District = apps.get_model("properties", "District")
+
+    # el hard filter de distritos compara district_fk: sin backfill las filas legacy no matchean
+    resolve = _resolver(District)
+    ids = list(
+        Property.objects.filter(district_fk__isnull=True)
+        .exclude(district__isnull=True).exclude(district="")
+        .order_by("id").values_list("id", flat=True)
+    )
+    for start in range(0, len(ids), BATCH_SIZE):
+        # se lee el lote completo antes de escribir (MSSQL sin MARS)
+        batch = list(
+            Property.objects.filter(pk__in=ids[start:start + BATCH_SIZE])
+            .only("id", "district", "province", "department", "district_fk")
+        )
+        changed = []
+        for prop in batch:
+            district_id = resolve(prop.district, prop.province, prop.department)
+            if district_id is not None:
+                prop.district_fk_id = district_id
+                changed.append(prop)
+        if changed:
+            Property.objects.bulk_update(changed, ["district_fk"], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("properties", "0073_backfill_property_amenity_tokens"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
@@ -492,6 +492,19 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+class AmenityToken(models.Model):
+    """Vocabulario de amenidades normalizadas (ver properties/amenities.py). Solo Property agrega tokens."""
+    name = models.CharField(max_length=100, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'amenity_tokens'
+        verbose_name = 'Token de amenidad'
+        verbose_name_plural = 'Tokens de amenidades'
+
+    def __str__(self):
+        return self.name
+
 class ImageType(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -744,6 +757,10 @@ class Property(TitleCaseMixin, models.Model):
         verbose_name="Dirección Exacta (para mapa)" 
     )
     coordinates = models.CharField(max_length=512, blank=True, null=True) #mal
+    # `coordinates` parseado en save() (ver geo.py); el mapa filtra por estas columnas
+    latitude = models.FloatField(blank=True, null=True, editable=False)
+    longitude = models.FloatField(blank=True, null=True, editable=False)
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False)
     department = models.CharField(max_length=100, blank=True, null=True) #malisimo
     province = models.CharField(max_length=100, blank=True, null=True) #malisimo
     district = models.CharField(max_length=100, blank=True, null=True) #malisimo
@@ -760,6 +777,8 @@ class Property(TitleCaseMixin, models.Model):
     
     # Información adicional
     amenities = models.TextField(blank=True, null=True)
+    # ids de AmenityToken de `amenities` ("3 7 12"), se calcula en save()
+    amenity_tokens = models.TextField(blank=True, default='', editable=False)
     zoning = models.CharField(max_length=100, blank=True, null=True)
     tags = models.ManyToManyField('Tag', blank=True)
     
@@ -817,6 +836,17 @@ class Property(TitleCaseMixin, models.Model):
                 fields=["district_fk", "operation_type", "property_type", "currency", "availability_status"],
                 name="idx_prop_match_core",
             ),
+
+            # mismo prefijo + price: el tolerance band de precio (price__range) sale del índice
+            models.Index(
+                fields=["district_fk", "operation_type", "property_type", "currency", "availability_status", "price"],
+                name="idx_prop_match_price",
+            ),
+
+            # bounding box del mapa (latitude__range + longitude__range)
+            models.Index(fields=["latitude", "longitude"], name="idx_prop_lat_lng"),
+            # bbox / radio por prefijos (geohash__startswith), ver geo.py
+            models.Index(fields=["geohash"], name="idx_prop_geohash"),
         ]
         
     def __str__(self):
@@ -864,54 +894,31 @@ class Property(TitleCaseMixin, models.Model):
         # regla: se habilita legal si marketing ya está habilitado
         return self.marketing_enabled
     
+    # Nombres de ubigeo: los campos guardan el ID (formulario) o el nombre (importadores).
+    # get_ubigeo_names() es un mapa por proceso, sin query por acceso.
     @property
     def department_name(self):
         """Devuelve el nombre del departamento si el campo es numérico (ID), sino el valor original."""
-        val = self.department
-        if val and val.isdigit():
-            # Evitar error si Department no está definido o no se encuentra
-            try:
-                obj = Department.objects.filter(id=int(val)).first()
-                return obj.name if obj else val
-            except Exception:
-                pass
-        return val or ''
+        from .ubigeo import get_ubigeo_names
+        return get_ubigeo_names().department(self.department)
 
     @property
     def province_name(self):
         """Devuelve el nombre de la provincia si el campo es numérico (ID)."""
-        val = self.province
-        if val and val.isdigit():
-            try:
-                obj = Province.objects.filter(id=int(val)).first()
-                return obj.name if obj else val
-            except Exception:
-                pass
-        return val or ''
+        from .ubigeo import get_ubigeo_names
+        return get_ubigeo_names().province(self.province)
 
     @property
     def district_name(self):
         """Devuelve el nombre del distrito si el campo es numérico (ID)."""
-        val = self.district
-        if val and val.isdigit():
-            try:
-                obj = District.objects.filter(id=int(val)).first()
-                return obj.name if obj else val
-            except Exception:
-                pass
-        return val or ''
+        from .ubigeo import get_ubigeo_names
+        return get_ubigeo_names().district(self.district)
 
     @property
     def urbanization_name(self):
         """Devuelve el nombre de la urbanización si el campo es numérico (ID)."""
-        val = self.urbanization
-        if val and val.isdigit():
-            try:
-                obj = Urbanization.objects.filter(id=int(val)).first()
-                return obj.name if obj else val
-            except Exception:
-                pass
-        return val or ''
+        from .ubigeo import get_ubigeo_names
+        return get_ubigeo_names().urbanization(self.urbanization)
 
     def save(self, *args, **kwargs):
         self._apply_title_case()
@@ -929,8 +936,49 @@ class Property(TitleCaseMixin, models.Model):
                 if not Property.objects.filter(codigo_unico_propiedad=nuevo_codigo).exists():
                     self.codigo_unico_propiedad = nuevo_codigo
                     break
+        self._sync_district_fk(kwargs)
+        self._sync_amenity_tokens(kwargs)
+        self._sync_lat_lng(kwargs)
         super().save(*args, **kwargs)
 
+    def _sync_lat_lng(self, kwargs):
+        """Parsea `coordinates` una sola vez aquí; lo que no se entiende queda en NULL / '' (fuera del mapa)."""
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'coordinates' not in update_fields:
+            return
+        from .geo import geohash_for
+        self.latitude, self.longitude, self.geohash = geohash_for(self.coordinates)
+        if update_fields is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'latitude', 'longitude', 'geohash'}
+
+    def _sync_amenity_tokens(self, kwargs):
+        """Tokeniza `amenities` una sola vez aquí (el matching compara los ids como bitset)."""
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'amenities' not in update_fields:
+            return
+        from .amenities import encode_amenities
+        self.amenity_tokens = encode_amenities(self.amenities)
+        if update_fields is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'amenity_tokens'}
+
+    def _sync_district_fk(self, kwargs):
+        """
+        El matching filtra por district_fk; el formulario y los importadores solo llenan
+        `district` (ID como texto o nombre). Un ID manda siempre; un nombre solo completa un FK vacío.
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'district' not in update_fields:
+            return
+        val = (self.district or '').strip()
+        if not val or (self.district_fk_id is not None and not val.isdigit()):
+            return
+        from .ubigeo import get_district_resolver
+        district_id = get_district_resolver().resolve(val, self.province, self.department)
+        if district_id is not None and district_id != self.district_fk_id:
+            self.district_fk_id = district_id
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'district_fk'}
+
 
 # =============================================================================
 # MODELOS PARA MEDIOS Y DOCUMENTOS
@@ -1345,6 +1393,7 @@ class Requirement(models.Model):
 
     has_elevator = models.BooleanField(null=True, blank=True)
     pet_friendly = models.BooleanField(null=True, blank=True)
+    amenities = models.TextField(blank=True, null=True, help_text="Amenidades deseadas, separadas por coma")
     notes = models.TextField(blank=True, null=True)
     source_group = models.CharField(max_length=150, null=True, blank=True)
     source_date = models.DateField(null=True, blank=True)
@@ -1904,6 +1953,60 @@ class RequirementMatch(models.Model):
     def __str__(self):
         return f"Req {self.requirement_id} - Prop {self.property_id} => {self.score}%"
 
+
+class MatchRecalcJob(models.Model):
+    """
+    Cola de recálculo de matches (engine_matching/queue.py).
+    Una fila por requerimiento: varias ediciones seguidas solo corren el recálculo una vez.
+    """
+    requirement = models.OneToOneField(
+        'Requirement',
+        on_delete=models.CASCADE,
+        related_name='recalc_job',
+    )
+    enqueued_at = models.DateTimeField(auto_now_add=True)
+    requested_at = models.DateTimeField()              # última edición que lo pidió
+    run_after = models.DateTimeField(db_index=True)    # requested_at + ventana de debounce
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=64, blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        db_table = 'match_recalc_jobs'
+        verbose_name = "Recálculo de matches pendiente"
+        verbose_name_plural = "Recálculos de matches pendientes"
+
+    def __str__(self):
+        return f"Req {self.requirement_id} (run_after={self.run_after:%Y-%m-%d %H:%M:%S})"
+
+
+class PropertyMatchJob(models.Model):
+    """
+    Cola de matching inverso (engine_matching/queue.py): propiedades guardadas cuyo
+    fan-out a RequirementMatch queda pendiente. Una fila por propiedad, como MatchRecalcJob.
+    """
+    property = models.OneToOneField(
+        'Property',
+        on_delete=models.CASCADE,
+        related_name='match_job',
+    )
+    enqueued_at = models.DateTimeField(auto_now_add=True)
+    requested_at = models.DateTimeField()              # último save que lo pidió
+    run_after = models.DateTimeField(db_index=True)    # requested_at + ventana de debounce
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=64, blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        db_table = 'property_match_jobs'
+        verbose_name = "Matching inverso pendiente"
+        verbose_name_plural = "Matching inverso pendiente"
+
+    def __str__(self):
+        return f"Prop {self.property_id} (run_after={self.run_after:%Y-%m-%d %H:%M:%S})"
+
 class Proposal(models.Model):
     STATUS_SENT = "pending"
     STATUS_ACCEPTED = "accepted"
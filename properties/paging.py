@@ -0,0 +1,137 @@
+# properties/paging.py
+"""
+Paginación keyset (seek) del dashboard de propiedades.
+
+El orden es (availability_rank, -updated_at, -id): id desempata, así la clave es única
+y cada página sigue exactamente a la anterior aunque entren o se editen propiedades
+entre requests (OFFSET se saltaría o repetiría filas). El cursor es la clave de la
+última fila (o la primera, hacia atrás) en base64; la página cuesta page_size + 1
+filas sin importar el tamaño del inventario.
+
+El total es aproximado: COUNT con tope (`DASHBOARD_COUNT_CAP`) guardado en cache por
+usuario + filtros + versión del inventario (sube en cada save/delete de Property).
+"""
+import base64
+import hashlib
+import json
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from properties.engine_matching.versions import get_inventory_version
+
+SEEK_ORDER = ("availability_rank", "-updated_at", "-id")
+REVERSE_ORDER = ("-availability_rank", "updated_at", "id")
+CURSOR_PARAMS = ("after", "before")
+COUNT_CACHE_TIMEOUT = 10 * 60
+
+Key = Tuple[int, object, int]
+
+
+def page_size() -> int:
+    return max(1, int(getattr(settings, "DASHBOARD_PAGE_SIZE", 50)))
+
+
+def count_cap() -> int:
+    return max(1, int(getattr(settings, "DASHBOARD_COUNT_CAP", 1000)))
+
+
+# -----------------------------
+# Cursor
+# -----------------------------
+def encode_cursor(obj) -> str:
+    raw = json.dumps([obj.availability_rank, obj.updated_at.isoformat(), obj.pk], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(value: str) -> Optional[Key]:
+    """(rank, updated_at, id) o None si el cursor no es válido (se vuelve a la primera página)."""
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+        rank, updated_at, pk = json.loads(raw)
+        updated_at = parse_datetime(updated_at)
+        if updated_at is None:
+            return None
+        return int(rank), updated_at, int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+def seek_filter(key: Key, *, backwards: bool = False) -> Q:
+    """Filas estrictamente después de `key` en SEEK_ORDER (o antes, con backwards)."""
+    rank, updated_at, pk = key
+    if backwards:
+        return (
+            Q(availability_rank__lt=rank)
+            | Q(availability_rank=rank, updated_at__gt=updated_at)
+            | Q(availability_rank=rank, updated_at=updated_at, id__gt=pk)
+        )
+    return (
+        Q(availability_rank__gt=rank)
+        | Q(availability_rank=rank, updated_at__lt=updated_at)
+        | Q(availability_rank=rank, updated_at=updated_at, id__lt=pk)
+    )
+
+
+# -----------------------------
+# Página
+# -----------------------------
+class KeysetPage:
+    __slots__ = ("object_list", "has_next", "has_previous", "next_cursor", "previous_cursor")
+
+    def __init__(self, object_list: List, has_next: bool, has_previous: bool):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = encode_cursor(object_list[-1]) if has_next and object_list else ""
+        self.previous_cursor = encode_cursor(object_list[0]) if has_previous and object_list else ""
+
+
+def keyset_page(queryset, *, after: str = "", before: str = "", size: Optional[int] = None) -> KeysetPage:
+    """
+    Una página de `queryset` (que debe anotar availability_rank). `after` gana sobre
+    `before`; sin cursor válido devuelve la primera página.
+    """
+    size = size or page_size()
+    after_key, before_key = decode_cursor(after), decode_cursor(before)
+
+    if after_key is None and before_key is not None:
+        rows = list(queryset.filter(seek_filter(before_key, backwards=True)).order_by(*REVERSE_ORDER)[:size + 1])
+        has_previous = len(rows) > size
+        rows = rows[:size]
+        rows.reverse()
+        return KeysetPage(rows, has_next=True, has_previous=has_previous)
+
+    if after_key is not None:
+        queryset = queryset.filter(seek_filter(after_key))
+    rows = list(queryset.order_by(*SEEK_ORDER)[:size + 1])
+    return KeysetPage(rows[:size], has_next=len(rows) > size, has_previous=after_key is not None)
+
+
+def approximate_count(queryset, *, scope: str) -> Tuple[int, bool]:
+    """
+    (total, capped). Cuenta hasta count_cap() + 1 filas; `scope` identifica usuario y
+    filtros. Se recalcula cuando cambia el inventario.
+    """
+    cap = count_cap()
+    digest = hashlib.md5(scope.encode()).hexdigest()
+    key = f"properties:dashboard_count:{get_inventory_version()}:{cap}:{digest}"
+    try:
+        cached = cache.get(key)
+    except Exception:
+        cached = None
+    if cached is not None:
+        return cached[0], cached[1]
+
+    total = queryset.order_by().values("pk")[:cap + 1].count()
+    result = (min(total, cap), total > cap)
+    try:
+        cache.set(key, result, COUNT_CACHE_TIMEOUT)
+    except Exception:
+        pass
+    return result
@@ -102,8 +102,8 @@ class PropertyOwnerSerializer(serializers.ModelSerializer):
 
 class PropertySerializer(serializers.ModelSerializer):
     # Campos que la app necesita y que no están directamente en el modelo
-    latitude = serializers.SerializerMethodField()
-    longitude = serializers.SerializerMethodField()
+    latitude = serializers.FloatField(read_only=True)
+    longitude = serializers.FloatField(read_only=True)
     currency_symbol = serializers.CharField(source='currency.symbol', read_only=True)
     property_type = serializers.CharField(source='property_type.name', read_only=True)
     status = serializers.CharField(source='status.name', read_only=True)
@@ -129,20 +129,6 @@ class PropertySerializer(serializers.ModelSerializer):
             'real_address', 'exact_address', 'coordinates', 'department', 'province', 'district', 'urbanization',
         )
 
-    def get_latitude(self, obj):
-        try:
-            coords_str = str(obj.coordinates)
-            return float(coords_str.split(',')[0].strip())
-        except (ValueError, IndexError, AttributeError):
-            return None
-
-    def get_longitude(self, obj):
-        try:
-            coords_str = str(obj.coordinates)
-            return float(coords_str.split(',')[1].strip())
-        except (ValueError, IndexError, AttributeError):
-            return None
-
     def get_responsible_name(self, obj):
         try:
             responsible = obj.responsible
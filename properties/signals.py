@@ -1,14 +1,27 @@
-from django.db.models.signals import post_save, m2m_changed, pre_save
+from django.db.models.signals import post_save, post_delete, m2m_changed, pre_save
 from properties.models import RequirementMatch
 from notifications.events import on_property_matched
 from django.dispatch import receiver
-from django.core.cache import cache
 import logging
 from django.db import transaction
 from .models import Property
 
-from .models import Requirement, Event
-from . import matching as matching_module
+from .models import (
+    Requirement, Event, MatchingWeight, Department, Province, District, Urbanization,
+    PaymentMethod, PropertyStatus, PropertyType, AmenityToken,
+)
+from django.contrib.auth import get_user_model
+from users.models import Role
+from django.utils import timezone
+from .engine_matching.profile import invalidate_requirement_profile
+from .engine_matching.index import bump_requirement_index_version
+from .engine_matching.queue import enqueue_property_fan_out, enqueue_requirement_recalc
+from .engine_matching.versions import bump_inventory_version
+from .engine_matching.weights import invalidate_matching_weights
+from .engine_matching.reverse import MATCH_RELEVANT_FIELDS
+from .amenities import forget_token_index, invalidate_token_index
+from .facets import invalidate_dashboard_facets, note_property
+from .ubigeo import invalidate_district_resolver, invalidate_ubigeo_names
 
 logger = logging.getLogger(__name__)
 
@@ -20,121 +33,152 @@ def sync_is_active_with_availability(sender, instance: Property, **kwargs):
     if instance.is_active != should_be_active:
         Property.objects.filter(pk=instance.pk).update(is_active=should_be_active)
 
-"""
-@receiver(post_save, sender=Requirement)
-def requirement_post_save_recalculate_matches(sender, instance: Requirement, created, **kwargs):
-    Al guardar un Requirement, programar recálculo de coincidencias tras el commit.
 
-    Usamos `transaction.on_commit` para garantizar que los cambios (incluyendo M2M)
-    estén persistidos antes de ejecutar el motor de matching. Esto evita casos
-    donde `post_save` se ejecuta antes de `form.save_m2m()` y los filtros quedan incompletos.
-    
-    try:
-        req_id = instance.pk
-        logger.debug('Requirement post_save schedule recalc for %s (created=%s)', req_id, bool(created))
-
-        def _do_recalc():
-            try:
-                # Cargar instancia fresca
-                req = Requirement.objects.filter(pk=req_id).first()
-                if not req:
-                    logger.debug('Requirement %s disappeared before recalc', req_id)
-                    return
+@receiver(post_save, sender=Property)
+def reverse_match_on_property_save(sender, instance: Property, raw=False, update_fields=None, **kwargs):
+    """
+    Matching inverso: encola la propiedad (PropertyMatchJob) y el worker actualiza
+    RequirementMatch solo en los requerimientos cuyos hard filters la admiten
+    (ver engine_matching/reverse.py). El request que guarda no paga el scoring.
+    """
+    if raw:
+        return
+    if update_fields and not (set(update_fields) & MATCH_RELEVANT_FIELDS):
+        return
+    enqueue_property_fan_out([instance.pk])
 
-                matches = matching_module.get_matches_for_requirement(req, limit=10)
-                cached = []
-                for m in matches:
-                    prop = m.get('property')
-                    cached.append({
-                        'property_id': getattr(prop, 'id', None),
-                        'score': m.get('score'),
-                        'details': m.get('details')
-                    })
-                cache_key = f'req_matches_{req.pk}'
-                try:
-                    cache.set(cache_key, cached, 60 * 60)
-                except Exception:
-                    logger.debug('Cache not available when setting matches for Requirement %s', req.pk)
 
-                # notifications for owner
-                try:
-                    if cached and getattr(req, 'created_by', None):
-                        user = req.created_by
-                        notify_key = f'user_new_match_alerts_{user.id}'
-                        notifications = []
-                        for item in cached:
-                            notifications.append({
-                                'requirement_id': req.pk,
-                                'property_id': item.get('property_id'),
-                                'score': item.get('score'),
-                            })
-                        try:
-                            cache.set(notify_key, notifications, 60 * 60 * 24)
-                        except Exception:
-                            logger.debug('Cache not available when setting match notifications for user %s', user.id)
-                except Exception:
-                    logger.exception('Error setting match notification for Requirement %s', req.pk)
-
-                logger.debug('Recalc matches finished for Requirement %s, found %s', req.pk, len(cached))
-            except Exception:
-                logger.exception('Error recalculando matches para Requirement %s', req_id)
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+def property_inventory_changed(sender, instance: Property, raw=False, **kwargs):
+    """
+    Invalida el cache de resultados de matching (engine_matching/cache.py) y le
+    avisa al snapshot qué fila cambió. Otra vez tras el commit, como el índice.
+    """
+    if raw:
+        return
+    prop_id = instance.pk
+    bump_inventory_version(prop_id)
+    transaction.on_commit(lambda: bump_inventory_version(prop_id))
 
-        try:
-            transaction.on_commit(_do_recalc)
-        except Exception:
-            # Fallback immediate call if no transaction management available
-            _do_recalc()
-    except Exception:
-        logger.exception('Failed scheduling recalc for Requirement %s', getattr(instance, 'pk', None))
+
+@receiver(post_save, sender=Property)
+def property_facets_changed(sender, instance: Property, raw=False, **kwargs):
+    """Opciones de filtros del dashboard: solo si aparece un origen/distrito nuevo (facets.py)."""
+    if raw:
+        return
+    transaction.on_commit(lambda: note_property(instance))
 
 
-# Manejar cambios en M2M para campos que afectan el matching
-def _m2m_changed_handler(action, instance, **kwargs):
-    # actions: 'post_add', 'post_remove', 'post_clear' son los relevantes
-    if action not in ('post_add', 'post_remove', 'post_clear'):
+@receiver(m2m_changed, sender=Requirement.districts.through)
+def requirement_districts_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Cambiar los distritos no toca Requirement.updated_at, que es la clave del
+    cache de RequirementProfile. Lo tocamos aquí para invalidar en todos los procesos.
+    """
+    if action not in ("post_add", "post_remove", "post_clear"):
         return
-    try:
-        req_id = instance.pk
-        logger.debug('M2M changed (%s) scheduling recalc for Requirement %s', action, req_id)
 
-        def _do_recalc_m2m():
-            try:
-                req = Requirement.objects.filter(pk=req_id).first()
-                if not req:
-                    return
-                matches = matching_module.get_matches_for_requirement(req, limit=10)
-                cached = []
-                for m in matches:
-                    prop = m.get('property')
-                    cached.append({
-                        'property_id': getattr(prop, 'id', None),
-                        'score': m.get('score'),
-                        'details': m.get('details')
-                    })
-                cache_key = f'req_matches_{req.pk}'
-                try:
-                    cache.set(cache_key, cached, 60 * 60)
-                except Exception:
-                    logger.debug('Cache not available when setting matches for Requirement %s', req.pk)
-            except Exception:
-                logger.exception('Error in m2m recalc for Requirement %s', req_id)
+    if reverse:
+        # district.requirements.add(...) => instance es District, pk_set son requirements
+        if action == "post_clear":
+            # ya no sabemos qué requerimientos tenía: vaciamos el cache local
+            invalidate_requirement_profile()
+            _invalidate_requirement_index()
+            return
+        req_ids = list(pk_set or [])
+    else:
+        req_ids = [instance.pk]
+
+    if not req_ids:
+        return
+
+    Requirement.objects.filter(pk__in=req_ids).update(updated_at=timezone.now())
+    for req_id in req_ids:
+        invalidate_requirement_profile(req_id)
+    _invalidate_requirement_index()
+    enqueue_requirement_recalc(req_ids)
+
+
+def _invalidate_requirement_index():
+    """
+    Sube la versión del índice invertido ahora y otra vez tras el commit:
+    si otro proceso reconstruyó leyendo datos aún sin commitear, vuelve a hacerlo.
+    """
+    bump_requirement_index_version()
+    transaction.on_commit(bump_requirement_index_version)
 
-        try:
-            transaction.on_commit(_do_recalc_m2m)
-        except Exception:
-            _do_recalc_m2m()
-    except Exception:
-        logger.exception('Error handling m2m_changed for Requirement %s', getattr(instance, 'pk', None))
 
+@receiver(post_save, sender=Requirement)
+def requirement_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    _invalidate_requirement_index()
+    # recálculo en background y con debounce (process_match_queue), no inline;
+    # también al desactivarlo, para que el worker borre sus matches
+    enqueue_requirement_recalc([instance.pk])
+
+
+@receiver(post_delete, sender=Requirement)
+def requirement_deleted(sender, instance, **kwargs):
+    invalidate_requirement_profile(instance.pk)
+    _invalidate_requirement_index()
+
+
+@receiver(post_save, sender=MatchingWeight)
+@receiver(post_delete, sender=MatchingWeight)
+def matching_weight_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invalidate_matching_weights()
+
+
+@receiver(post_save, sender=District)
+@receiver(post_delete, sender=District)
+def district_changed(sender, instance, **kwargs):
+    invalidate_district_resolver()
+
+
+@receiver(post_save, sender=Department)
+@receiver(post_delete, sender=Department)
+@receiver(post_save, sender=Province)
+@receiver(post_delete, sender=Province)
+@receiver(post_save, sender=District)
+@receiver(post_delete, sender=District)
+@receiver(post_save, sender=Urbanization)
+@receiver(post_delete, sender=Urbanization)
+def ubigeo_changed(sender, instance, **kwargs):
+    invalidate_ubigeo_names()
+
+
+@receiver(post_save, sender=AmenityToken)
+@receiver(post_delete, sender=AmenityToken)
+def amenity_vocabulary_changed(sender, instance, **kwargs):
+    # este proceso ya ve el token nuevo; los demás, cuando se confirme
+    forget_token_index()
+    transaction.on_commit(invalidate_token_index)
+
+
+@receiver(post_save, sender=PropertyType)
+@receiver(post_delete, sender=PropertyType)
+@receiver(post_save, sender=PaymentMethod)
+@receiver(post_delete, sender=PaymentMethod)
+@receiver(post_save, sender=PropertyStatus)
+@receiver(post_delete, sender=PropertyStatus)
+@receiver(post_save, sender=District)
+@receiver(post_delete, sender=District)
+@receiver(post_save, sender=Urbanization)
+@receiver(post_delete, sender=Urbanization)
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def dashboard_facets_changed(sender, instance, update_fields=None, **kwargs):
+    # cada login guarda last_login: eso no cambia la lista de agentes
+    if update_fields and set(update_fields) <= {"last_login"}:
+        return
+    transaction.on_commit(invalidate_dashboard_facets)
 
-# conectar handlers para los through models de los M2M relevantes
-try:
-    m2m_changed.connect(lambda sender, instance, action, **kw: _m2m_changed_handler(action, instance, **kw), sender=Requirement.districts.through)
-    m2m_changed.connect(lambda sender, instance, action, **kw: _m2m_changed_handler(action, instance, **kw), sender=Requirement.preferred_floors.through)
-    m2m_changed.connect(lambda sender, instance, action, **kw: _m2m_changed_handler(action, instance, **kw), sender=Requirement.zonificaciones.through)
-except Exception:
-    logger.exception('Failed to connect m2m_changed handlers for Requirement')
-"""
 @receiver(post_save, sender=RequirementMatch)
 def requirement_match_saved(sender, instance, created, **kwargs):
     # Solo dispara evento, nada más
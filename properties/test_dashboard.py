@@ -0,0 +1,169 @@
+import base64
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from users.models import Role
+
+from .facets import get_dashboard_facets, invalidate_dashboard_facets
+from .models import Department, District, Property, PropertyType, Province
+from .paging import approximate_count, decode_cursor, encode_cursor
+
+
+def _raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        self.staff = get_user_model().objects.create_user(
+            username='dash', email='d@example.com', password='pass', is_staff=True, is_superuser=True,
+        )
+
+    def _create_property(self, **overrides):
+        base = dict(created_by=self.staff)
+        base.update(overrides)
+        return Property.objects.create(**base)
+
+    @override_settings(DASHBOARD_PAGE_SIZE=2)
+    def test_dashboard_keyset_pagination(self):
+        sold = self._create_property(availability_status='sold')
+        props = [self._create_property() for _ in range(4)]
+        # mismo updated_at: id desempata
+        Property.objects.filter(pk__in=[p.pk for p in props[:3]]).update(updated_at=props[0].updated_at)
+        expected = [p.pk for p in sorted(props[:3], key=lambda p: -p.pk)]
+        expected = [props[3].pk] + expected + [sold.pk]
+
+        self.client.force_login(self.staff)
+        url = reverse('properties:list')
+        seen, params, first_response = [], {}, None
+        while True:
+            response = self.client.get(url, params)
+            first_response = first_response or response
+            seen.extend(p.pk for p in response.context['properties'])
+            self.assertLessEqual(len(response.context['properties']), 2)
+            if not response.context['next_page_url']:
+                break
+            params = {'after': response.context['page'].next_cursor}
+        self.assertEqual(seen, expected)
+        self.assertEqual(first_response.context['property_count'], 5)
+
+        back = self.client.get(url, {'before': response.context['page'].previous_cursor})
+        self.assertEqual([p.pk for p in back.context['properties']], expected[2:4])
+
+        with override_settings(DASHBOARD_COUNT_CAP=3):
+            capped = self.client.get(url, {'q': ''})
+        self.assertEqual((capped.context['property_count'], capped.context['property_count_capped']), (3, True))
+
+    def test_invalid_or_tampered_cursor_falls_back_to_first_page(self):
+        prop = self._create_property()
+        prop.availability_rank = 0
+        valid = encode_cursor(prop)
+        self.assertEqual(decode_cursor(valid), (0, prop.updated_at, prop.pk))
+
+        tampered = [
+            'no-es-base64!',
+            valid[:-3],
+            _raw_cursor({'rank': 0}),
+            _raw_cursor([0, prop.updated_at.isoformat()]),
+            _raw_cursor([0, 'ayer', prop.pk]),
+            _raw_cursor([0, '2026-13-45T99:00:00', prop.pk]),
+            _raw_cursor([None, prop.updated_at.isoformat(), prop.pk]),
+            _raw_cursor([0, prop.updated_at.isoformat(), 'x']),
+            _raw_cursor([[0], 5, {}]),
+            base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+        ]
+        for value in tampered:
+            self.assertIsNone(decode_cursor(value), value)
+
+        self.client.force_login(self.staff)
+        url = reverse('properties:list')
+        for param in ('after', 'before'):
+            response = self.client.get(url, {param: _raw_cursor([0, 'ayer', prop.pk])})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([p.pk for p in response.context['properties']], [prop.pk])
+            self.assertFalse(response.context['page'].has_previous)
+
+    def test_approximate_count_cap_boundary(self):
+        for _ in range(3):
+            self._create_property()
+        qs = Property.objects.all()
+
+        with override_settings(DASHBOARD_COUNT_CAP=3):
+            self.assertEqual(approximate_count(qs, scope='cap-3'), (3, False))
+        with override_settings(DASHBOARD_COUNT_CAP=2):
+            self.assertEqual(approximate_count(qs, scope='cap-2'), (2, True))
+        with override_settings(DASHBOARD_COUNT_CAP=4):
+            self.assertEqual(approximate_count(qs, scope='cap-4'), (3, False))
+
+
+class DashboardFacetsTests(TestCase):
+    def setUp(self):
+        invalidate_dashboard_facets()   # el cache locmem sobrevive entre tests
+        self.user = get_user_model().objects.create_user(username='facets', email='f@example.com', password='pass')
+        dept = Department.objects.create(name='Lima', code='LIM')
+        prov = Province.objects.create(name='Lima', code='LIM', department=dept)
+        self.miraflores = District.objects.create(name='Miraflores', code='MIR', province=prov)
+
+    def _create_property(self, **overrides):
+        base = dict(created_by=self.user)
+        base.update(overrides)
+        return Property.objects.create(**base)
+
+    def test_dashboard_facets_cached_and_invalidated(self):
+        self._create_property(source='Web', district=str(self.miraflores.id))
+        facets = get_dashboard_facets()
+        self.assertEqual(facets['sources'], ['Web'])
+        self.assertEqual(facets['districts_list'], [{'id': self.miraflores.id, 'name': 'Miraflores'}])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_dashboard_facets(), facets)
+
+        # origen ya conocido: no invalida
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_property(source='Web', district=str(self.miraflores.id))
+        with self.assertNumQueries(0):
+            get_dashboard_facets()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_property(source='Referido')
+        self.assertEqual(get_dashboard_facets()['sources'], ['Referido', 'Web'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PropertyType.objects.create(name='Terreno')
+        self.assertIn('Terreno', [t['name'] for t in get_dashboard_facets()['property_types']])
+
+    def test_facets_follow_role_and_user_changes(self):
+        role = Role.objects.create(name='Agente interno', code_name='agente_interno')
+        with self.captureOnCommitCallbacks(execute=True):
+            agent = get_user_model().objects.create_user(
+                username='agente', email='a@example.com', password='pass', first_name='Ana', role=role,
+            )
+        self.assertEqual(get_dashboard_facets()['agents'], [{'id': agent.id, 'name': 'Ana'}])
+
+        # el login solo guarda last_login: no invalida
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(agent)
+        with self.assertNumQueries(0):
+            get_dashboard_facets()
+
+        agent.last_name = 'Rojas'
+        with self.captureOnCommitCallbacks(execute=True):
+            agent.save()
+        self.assertEqual(get_dashboard_facets()['agents'], [{'id': agent.id, 'name': 'Ana Rojas'}])
+
+        # renombrar el rol lo saca de AGENT_ROLES
+        role.name = 'Coordinador'
+        with self.captureOnCommitCallbacks(execute=True):
+            role.save()
+        self.assertEqual(get_dashboard_facets()['agents'], [])
+
+        role.name = 'Agente externo'
+        with self.captureOnCommitCallbacks(execute=True):
+            role.save()
+        self.assertEqual(len(get_dashboard_facets()['agents']), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            agent.delete()
+        self.assertEqual(get_dashboard_facets()['agents'], [])
@@ -0,0 +1,820 @@
+import json
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .engine_matching.engine import (
+    build_candidate_qs,
+    calculate_score,
+    calculate_scores_batch,
+    batch_details,
+    explain_match,
+    get_matches,
+    load_candidate_arrays,
+    pair_subscores,
+    top_k_indices,
+)
+from .engine_matching.profile import get_requirement_profile, invalidate_requirement_profile
+from .engine_matching.registry import Criterion, iter_criteria, register, unregister
+from .engine_matching.versions import bump_version, get_weights_version, inventory_changes, warn_if_local_cache
+from .amenities import get_token_index, invalidate_token_index
+from .engine_matching.weights import default_weights, invalidate_weights, load_weights
+from .engine_matching.cache import get_cached_matches
+from .engine_matching.index import requirement_index
+from .engine_matching.metrics import engine_metrics
+from .engine_matching import persistence
+from .engine_matching.persistence import persist_requirement_matches
+from .engine_matching.queue import process_jobs, process_property_jobs
+from .engine_matching.rematch import rematch_all
+from .engine_matching.snapshot import property_snapshot
+from .engine_matching.reverse import candidate_requirements_qs, fan_out_property
+from notifications.models import Notification
+from . import matching
+from .models import (
+    AmenityToken,
+    Currency,
+    Department,
+    District,
+    MatchEvent,
+    MatchingWeight,
+    MatchRecalcJob,
+    PropertyMatchJob,
+    OperationType,
+    PaymentMethod,
+    Property,
+    PropertyType,
+    Province,
+    Requirement,
+    RequirementMatch,
+)
+
+
+class EngineMatchingTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username='matcher', email='m@example.com', password='pass')
+
+        self.dept = Department.objects.create(name='Lima', code='LIM')
+        self.prov = Province.objects.create(name='Lima', code='LIM', department=self.dept)
+        self.miraflores = District.objects.create(name='Miraflores', code='MIR', province=self.prov)
+        self.surco = District.objects.create(name='Surco', code='SUR', province=self.prov)
+
+        self.sale = OperationType.objects.create(name='Venta', code='sale')
+        self.buy = OperationType.objects.create(name='Compra', code='buy')
+        self.ptype = PropertyType.objects.create(name='Departamento')
+        self.usd = Currency.objects.create(code='USD', name='Dolar', symbol='$')
+        self.cash = PaymentMethod.objects.create(name='Contado', code='cash')
+
+        self.req = Requirement.objects.create(
+            created_by=self.user,
+            operation_type=self.buy,
+            property_type=self.ptype,
+            currency=self.usd,
+            payment_method=self.cash,
+            price_min=Decimal('100000'),
+            price_max=Decimal('200000'),
+            bedrooms_min=Decimal('2'),
+            built_area_max=Decimal('120'),
+            has_elevator=True,
+        )
+        self.req.districts.add(self.miraflores)
+
+    def _create_property(self, **overrides):
+        base = dict(
+            created_by=self.user,
+            operation_type=self.sale,
+            property_type=self.ptype,
+            currency=self.usd,
+            forma_de_pago=self.cash,
+            district_fk=self.miraflores,
+            price=Decimal('150000'),
+            bedrooms=3,
+            built_area=Decimal('100'),
+            has_elevator=True,
+        )
+        base.update(overrides)
+        return Property.objects.create(**base)
+
+    def _run_property_jobs(self):
+        """El worker, sin esperar la ventana de debounce."""
+        PropertyMatchJob.objects.update(run_after=timezone.now() - timedelta(seconds=1))
+        return process_property_jobs()
+
+    def test_batch_scores_match_row_by_row(self):
+        self._create_property()
+        self._create_property(price=Decimal('260000'), bedrooms=1)
+        self._create_property(price=Decimal('90000'), built_area=None, has_elevator=None)
+        self._create_property(price=None, bedrooms=None, has_elevator=False)
+
+        qs = build_candidate_qs(self.req)
+        batch = calculate_scores_batch(self.req, load_candidate_arrays(qs))
+        props = qs.in_bulk([int(i) for i in batch["ids"]])
+
+        self.assertEqual(len(batch["ids"]), 4)
+        for i, prop_id in enumerate(batch["ids"]):
+            expected = calculate_score(self.req, props[int(prop_id)])
+            self.assertEqual(batch_details(batch, i), expected)
+
+    def test_get_matches_applies_hard_filters_and_orders_by_score(self):
+        best = self._create_property()
+        worse = self._create_property(price=Decimal('400000'))
+        self._create_property(district_fk=self.surco)
+
+        results = get_matches(self.req, limit=10)
+
+        self.assertEqual([r["property"].id for r in results], [best.id, worse.id])
+        self.assertEqual(results[0]["score"], 100.0)
+        self.assertGreater(results[0]["score"], results[1]["score"])
+
+    def test_get_matches_without_candidates(self):
+        self.assertEqual(get_matches(self.req), [])
+
+    def test_get_matches_min_score_cutoff(self):
+        best = self._create_property()
+        self._create_property(price=Decimal('400000'))
+
+        results = get_matches(self.req, limit=10, min_score=99.0)
+
+        self.assertEqual([r["property"].id for r in results], [best.id])
+
+    def test_profile_is_cached_and_immutable(self):
+        profile = get_requirement_profile(self.req)
+
+        self.assertIs(get_requirement_profile(self.req), profile)
+        self.assertEqual(profile.district_ids, frozenset({self.miraflores.id}))
+        self.assertEqual(profile.operation_code, "sale")
+        with self.assertRaises(AttributeError):
+            profile.weight = 1.0
+
+    def test_profile_rebuilt_when_districts_change(self):
+        before = get_requirement_profile(self.req)
+
+        self.req.districts.add(self.surco)
+        self.req.refresh_from_db()
+        after = get_requirement_profile(self.req)
+
+        self.assertIsNot(after, before)
+        self.assertEqual(after.district_ids, frozenset({self.miraflores.id, self.surco.id}))
+
+    def test_profile_admits_agrees_with_sql_filters(self):
+        props = [
+            self._create_property(),
+            self._create_property(district_fk=self.surco),
+            self._create_property(operation_type=self.buy),
+            self._create_property(forma_de_pago=None),
+            self._create_property(availability_status="reserved"),
+        ]
+        profile = get_requirement_profile(self.req)
+        sql_ids = set(build_candidate_qs(profile).values_list("id", flat=True))
+
+        for prop in props:
+            prop.refresh_from_db()
+            self.assertEqual(profile.admits(prop), prop.id in sql_ids)
+
+    def test_property_save_creates_reverse_match(self):
+        prop = self._create_property()
+        # el save solo encola: el scoring corre en el worker
+        self.assertFalse(RequirementMatch.objects.filter(property=prop).exists())
+        self.assertEqual(list(PropertyMatchJob.objects.values_list('property_id', flat=True)), [prop.id])
+
+        stats = self._run_property_jobs()
+        self.assertEqual((stats['claimed'], stats['properties'], stats['saved']), (1, 1, 1))
+        match = RequirementMatch.objects.get(requirement=self.req, property=prop)
+        self.assertEqual(float(match.score), 100.0)
+        self.assertFalse(PropertyMatchJob.objects.exists())
+
+        # un save que no toca columnas del matching no encola
+        prop.save(update_fields=['updated_at'])
+        self.assertFalse(PropertyMatchJob.objects.exists())
+
+    def test_property_outside_hard_filters_is_not_matched(self):
+        prop = self._create_property(district_fk=self.surco)
+        self._run_property_jobs()
+
+        self.assertNotIn(self.req, candidate_requirements_qs(prop))
+        self.assertFalse(RequirementMatch.objects.filter(property=prop).exists())
+
+    def test_property_leaving_requirement_district_removes_match(self):
+        prop = self._create_property()
+        self._run_property_jobs()
+        self.assertTrue(RequirementMatch.objects.filter(requirement=self.req, property=prop).exists())
+
+        prop.district_fk = self.surco
+        prop.save()
+        self._run_property_jobs()
+
+        self.assertFalse(RequirementMatch.objects.filter(requirement=self.req, property=prop).exists())
+
+    def test_reverse_insert_trims_row_pushed_out_of_top_k(self):
+        weaker = [
+            self._create_property(has_elevator=None),
+            self._create_property(price=Decimal('250000')),
+        ]
+        for prop in weaker:
+            fan_out_property(prop, limit=2, min_score=0)
+        self.assertEqual(RequirementMatch.objects.filter(requirement=self.req).count(), 2)
+        lowest = min(
+            RequirementMatch.objects.filter(requirement=self.req), key=lambda m: m.score
+        ).property_id
+
+        best = self._create_property()
+        res = fan_out_property(best, limit=2, min_score=0)
+
+        self.assertEqual(res["pushed_out"], 1)
+        rows = RequirementMatch.objects.filter(requirement=self.req)
+        self.assertEqual(rows.count(), 2)
+        self.assertTrue(rows.filter(property=best).exists())
+        self.assertFalse(rows.filter(property_id=lowest).exists())
+
+    def test_reverse_fan_out_writes_in_bulk_and_notifies_in_batch(self):
+        other = Requirement.objects.create(
+            created_by=self.user, operation_type=self.buy, property_type=self.ptype, currency=self.usd,
+        )
+        prop = self._create_property()
+
+        with mock.patch("properties.signals.on_property_matched") as per_row:
+            with self.captureOnCommitCallbacks(execute=True):
+                res = fan_out_property(prop)
+
+        per_row.assert_not_called()
+        self.assertEqual(res["saved"], 2)
+        self.assertEqual(
+            set(RequirementMatch.objects.filter(property=prop).values_list("requirement_id", flat=True)),
+            {self.req.id, other.id},
+        )
+        match = RequirementMatch.objects.get(requirement=self.req, property=prop)
+        self.assertTrue(Notification.objects.filter(object_id=match.id).exists())
+
+    def test_index_agrees_with_sql_prefilter(self):
+        open_req = Requirement.objects.create(created_by=self.user)
+        surco_req = Requirement.objects.create(created_by=self.user, operation_type=self.buy, currency=self.usd)
+        surco_req.districts.add(self.surco)
+        Requirement.objects.create(created_by=self.user, is_active=False)
+
+        props = [
+            self._create_property(),
+            self._create_property(district_fk=self.surco),
+            self._create_property(operation_type=self.buy, forma_de_pago=None),
+            self._create_property(district_fk=None, currency=None),
+        ]
+        for prop in props:
+            sql_ids = set(candidate_requirements_qs(prop).values_list("id", flat=True))
+            self.assertEqual(requirement_index.candidates_for(prop), sql_ids)
+            self.assertIn(open_req.id, sql_ids)
+
+    def test_index_follows_requirement_changes(self):
+        prop = self._create_property(district_fk=self.surco)
+        self.assertNotIn(self.req.id, requirement_index.candidates_for(prop))
+
+        self.req.districts.add(self.surco)
+        self.assertIn(self.req.id, requirement_index.candidates_for(prop))
+
+        self.req.is_active = False
+        self.req.save()
+        self.assertNotIn(self.req.id, requirement_index.candidates_for(prop))
+
+    def test_rematch_all_matches_per_requirement_results(self):
+        twin = Requirement.objects.create(
+            created_by=self.user,
+            operation_type=self.buy,
+            property_type=self.ptype,
+            currency=self.usd,
+            payment_method=self.cash,
+            price_max=Decimal('150000'),
+        )
+        twin.districts.add(self.miraflores)
+        self._create_property()
+        self._create_property(price=Decimal('180000'), bedrooms=1)
+        self._create_property(district_fk=self.surco)
+        stale = self._create_property(price=Decimal('900000'))
+        RequirementMatch.objects.create(requirement=self.req, property=stale, score=1, details={})
+
+        out = StringIO()
+        call_command("rematch_all", "--min-score", "0", stdout=out)
+
+        self.assertIn("groups=1", out.getvalue())
+        for req in (self.req, twin):
+            expected = {(r["property"].id, r["score"]) for r in get_matches(req, limit=10, min_score=0)}
+            saved = {(m.property_id, float(m.score)) for m in RequirementMatch.objects.filter(requirement=req)}
+            self.assertEqual(saved, expected)
+
+    def test_rematch_all_parallel_shards_match_serial(self):
+        for price_max in ('150000', '180000', '220000'):
+            twin = Requirement.objects.create(
+                created_by=self.user,
+                operation_type=self.buy,
+                property_type=self.ptype,
+                currency=self.usd,
+                price_max=Decimal(price_max),
+            )
+            twin.districts.add(self.miraflores)
+        for price in ('120000', '170000', '210000', '260000'):
+            self._create_property(price=Decimal(price))
+        req_ids = list(Requirement.objects.order_by('id').values_list('id', flat=True))
+
+        rematch_all(req_ids, min_score=0)
+        serial = set(RequirementMatch.objects.values_list('requirement_id', 'property_id', 'score'))
+        RequirementMatch.objects.all().delete()
+
+        stats = rematch_all(req_ids, min_score=0, workers=2)
+        self.assertEqual(stats['requirements'], 4)
+        self.assertEqual(set(RequirementMatch.objects.values_list('requirement_id', 'property_id', 'score')), serial)
+
+    def test_recalc_queue_coalesces_edits(self):
+        self.req.price_max = Decimal('210000')
+        self.req.save()
+        self.req.districts.add(self.surco)
+        # save + m2m + save: un solo job
+        self.assertEqual(list(MatchRecalcJob.objects.values_list('requirement_id', flat=True)), [self.req.id])
+
+        prop = self._create_property()
+        self.assertEqual(process_jobs()['claimed'], 0)   # todavía dentro de la ventana
+
+        MatchRecalcJob.objects.update(run_after=timezone.now() - timedelta(seconds=1))
+        stats = process_jobs()
+        self.assertEqual((stats['claimed'], stats['requirements']), (1, 1))
+        self.assertTrue(RequirementMatch.objects.filter(requirement=self.req, property=prop).exists())
+        self.assertFalse(MatchRecalcJob.objects.exists())
+
+        # pedido otra vez mientras corría: queda en la cola, liberado
+        self.req.save()
+        MatchRecalcJob.objects.update(
+            enqueued_at=timezone.now() - timedelta(minutes=10),
+            run_after=timezone.now() - timedelta(seconds=1),
+            requested_at=timezone.now() + timedelta(minutes=1),
+        )
+        process_jobs()
+        job = MatchRecalcJob.objects.get()
+        self.assertIsNone(job.locked_at)
+        # el máximo se cuenta desde el pedido nuevo: la próxima edición respeta el debounce
+        self.assertEqual(job.enqueued_at, job.requested_at)
+        self.req.save()
+        self.assertEqual(process_jobs()['claimed'], 0)
+
+    def test_recalc_queue_clears_matches_of_deactivated_requirement(self):
+        prop = self._create_property()
+        MatchRecalcJob.objects.update(run_after=timezone.now() - timedelta(seconds=1))
+        process_jobs()
+        self.assertTrue(RequirementMatch.objects.filter(requirement=self.req, property=prop).exists())
+
+        self.req.is_active = False
+        self.req.save()
+        self.assertTrue(MatchRecalcJob.objects.filter(requirement=self.req).exists())
+        MatchRecalcJob.objects.update(run_after=timezone.now() - timedelta(seconds=1))
+        stats = process_jobs()
+        self.assertEqual((stats['claimed'], stats['requirements'], stats['deleted']), (1, 0, 1))
+        self.assertFalse(RequirementMatch.objects.filter(requirement=self.req).exists())
+        self.assertFalse(MatchRecalcJob.objects.exists())
+
+    def test_persist_matches_diffs_in_bulk_and_notifies(self):
+        owner = get_user_model().objects.create_user(username='owner', email='o@example.com', password='pass')
+        kept = self._create_property(created_by=owner)
+        new = self._create_property(created_by=owner, price=Decimal('120000'))
+        gone = self._create_property(created_by=owner)
+        RequirementMatch.objects.create(requirement=self.req, property=kept, score=10, details={})
+        RequirementMatch.objects.create(requirement=self.req, property=gone, score=10, details={})
+        results = [
+            {"property": kept, "score": 95.5, "details": {"price": {}}},
+            {"property": new, "score": 40.0, "details": {}},
+        ]
+
+        # diff + delete (con su collector) + update + insert + savepoint: constante, sin importar cuántas filas
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(8):
+                res = persist_requirement_matches(self.req, results)
+
+        self.assertEqual((res["created"], res["updated"], res["deleted"]), (1, 1, 1))
+        saved = {m.property_id: float(m.score) for m in RequirementMatch.objects.filter(requirement=self.req)}
+        self.assertEqual(saved, {kept.id: 95.5, new.id: 40.0})
+        # solo el match >= 50 notifica, a ambos dueños
+        match = RequirementMatch.objects.get(requirement=self.req, property=kept)
+        self.assertEqual(
+            set(Notification.objects.filter(object_id=match.id).values_list("user_id", flat=True)),
+            {owner.id, self.user.id},
+        )
+        self.assertEqual(Notification.objects.count(), 2)
+
+    def test_persist_matches_retries_insert_raced_by_another_writer(self):
+        raced = self._create_property()
+        fresh = self._create_property(price=Decimal('120000'))
+        real_diff = persistence._diff
+
+        def diff_then_race(*args):
+            out = real_diff(*args)
+            # otro proceso inserta el mismo par entre el diff y el bulk_create
+            RequirementMatch.objects.create(requirement=self.req, property=raced, score=10, details={})
+            return out
+
+        results = [
+            {"property": raced, "score": 90.0, "details": {}},
+            {"property": fresh, "score": 85.0, "details": {}},
+        ]
+        with mock.patch.object(connection.features, "supports_update_conflicts_with_target", False), \
+                mock.patch.object(persistence, "_diff", side_effect=diff_then_race):
+            persist_requirement_matches(self.req, results, notify=False)
+
+        saved = {m.property_id: float(m.score) for m in RequirementMatch.objects.filter(requirement=self.req)}
+        self.assertEqual(saved, {raced.id: 90.0, fresh.id: 85.0})
+
+    def test_match_cache_hits_until_inventory_or_requirement_changes(self):
+        first = self._create_property()
+        expected = [(r["property"].id, r["score"]) for r in get_matches(self.req, limit=5)]
+
+        self.assertEqual([(r["property"].id, r["score"]) for r in get_cached_matches(self.req, limit=5)], expected)
+        # hit: sin motor, solo el in_bulk de las propiedades
+        with self.assertNumQueries(1):
+            hit = get_cached_matches(self.req, limit=5)
+        self.assertEqual([(r["property"].id, r["score"]) for r in hit], expected)
+
+        second = self._create_property(price=Decimal('300000'))
+        self.assertEqual([r["property"].id for r in get_cached_matches(self.req, limit=5)], [first.id, second.id])
+
+        self.req.price_max = Decimal('400000')
+        self.req.save()
+        refreshed = get_cached_matches(self.req, limit=5)
+        self.assertEqual(refreshed[1]["score"], calculate_score(self.req, second)["score"])
+
+    @override_settings(MATCHING_EQUAL_WEIGHTS=False)
+    def test_matching_weights_feed_the_engine(self):
+        self.addCleanup(invalidate_weights)
+        prop = self._create_property(price=Decimal('400000'))
+        before = calculate_score(self.req, prop)["score"]
+
+        MatchingWeight.objects.create(key='price', weight=50.0)
+        after = calculate_score(self.req, prop)
+        batch = calculate_scores_batch(self.req, load_candidate_arrays(build_candidate_qs(self.req)))
+
+        self.assertLess(after["score"], before)
+        self.assertEqual(batch_details(batch, 0), after)
+        # la fachada legacy usa el mismo motor
+        self.assertEqual(matching.score_property(self.req, prop, matching._load_weights()), after)
+
+    def test_equal_weights_ignore_matching_weight_table(self):
+        self.addCleanup(invalidate_weights)
+        prop = self._create_property(price=Decimal('400000'))
+        MatchingWeight.objects.create(key='price', weight=50.0)
+
+        with override_settings(MATCHING_EQUAL_WEIGHTS=True):
+            details = calculate_score(self.req, prop)["details"]
+            self.assertEqual(set(load_weights().values()), {1.0})
+        # como el motor anterior: 100 / criterios activos
+        self.assertEqual({round(d["weight"], 6) for d in details.values()}, {round(100.0 / len(details), 6)})
+        with override_settings(MATCHING_EQUAL_WEIGHTS=False):
+            self.assertGreater(calculate_score(self.req, prop)["details"]["price"]["weight"], details["price"]["weight"])
+
+    def test_registered_criterion_filters_and_scores(self):
+        class ProjectCriterion(Criterion):
+            name = "is_project"
+            columns = ("is_project",)
+
+            def prefilter(self, profile, qs):
+                return qs.filter(is_project=False)
+
+            def admits(self, profile, prop):
+                return not prop.is_project
+
+            def score_array(self, profile, arrays):
+                return np.full(len(arrays["id"]), 0.5)
+
+            def score(self, profile, prop):
+                return 0.5
+
+        kept = self._create_property(is_project=False)
+        self._create_property(is_project=True)
+
+        register(ProjectCriterion())
+        self.addCleanup(invalidate_requirement_profile)
+        self.addCleanup(unregister, "is_project")
+        invalidate_requirement_profile()
+
+        results = get_matches(self.req, limit=10)
+        self.assertEqual([r["property"].id for r in results], [kept.id])
+        self.assertEqual(results[0]["details"]["is_project"]["subscore"], 0.5)
+        self.assertEqual(results[0], {**calculate_score(self.req, kept), "property": kept})
+
+    @override_settings(MATCHING_EQUAL_WEIGHTS=False)
+    def test_weights_cached_until_matching_weight_changes(self):
+        self.addCleanup(invalidate_weights)
+        load_weights()
+        with self.assertNumQueries(0):
+            self.assertEqual(load_weights()['price'], 3.0)
+
+        MatchingWeight.objects.create(key='price', weight=7.0)
+        self.assertEqual(load_weights()['price'], 7.0)
+
+    def test_default_weights_cover_only_registered_criteria(self):
+        self.addCleanup(invalidate_weights)
+        keys = {c.key for c in iter_criteria()}
+        self.assertEqual(set(default_weights()), keys)
+        self.assertEqual(
+            [default_weights()[k] for k in ('district', 'price', 'garage_spaces', 'ascensor', 'bedrooms')],
+            [5.0, 3.0, 0.8, 0.5, 1.0],
+        )
+        MatchingWeight.objects.create(key='tags', weight=4.0)   # clave muerta de antes
+
+        staff = get_user_model().objects.create_user(
+            username='pesos', email='p@example.com', password='pass', is_superuser=True,
+        )
+        self.client.force_login(staff)
+        url = reverse('properties:matching_weights')
+        response = self.client.get(url)
+        self.assertEqual({w['key'] for w in response.context['weights']}, keys)
+        self.assertEqual(set(MatchingWeight.objects.values_list('key', flat=True)), keys | {'tags'})
+
+        self.client.post(url, {'weight_tags': '9', 'new_key': 'water_service'})
+        self.assertFalse(MatchingWeight.objects.filter(key='water_service').exists())
+        self.assertEqual(MatchingWeight.objects.get(key='tags').weight, 4.0)
+
+    @override_settings(MATCHING_EQUAL_WEIGHTS=False)
+    def test_record_positive_match_updates_weights_atomically(self):
+        self.addCleanup(invalidate_weights)
+        MatchingWeight.objects.create(key='district', weight=0.1)
+        MatchingWeight.objects.create(key='price', weight=2.0)
+        miss = self._create_property(district_fk=self.surco, price=Decimal('400000'))
+
+        matching.record_positive_match(self.req, miss)
+
+        weights = dict(MatchingWeight.objects.values_list('key', 'weight'))
+        self.assertEqual(weights['district'], 0.1)               # -0.01 con piso 0.1
+        self.assertAlmostEqual(weights['price'], 2.0 + 0.05 * 0.5 - 0.01 * 0.5)
+        self.assertAlmostEqual(weights['property_type'], 5.0 + 0.05)   # no existía: parte del default
+        self.assertEqual(load_weights()['price'], weights['price'])
+
+    def test_explain_match_single_pair(self):
+        self.addCleanup(invalidate_weights)
+        hit = self._create_property()
+        miss = self._create_property(district_fk=self.surco, price=Decimal('260000'))
+        explain_match(self.req, hit.pk)  # calienta profile y pesos
+
+        with self.assertNumQueries(1):
+            res = explain_match(self.req, hit.pk)
+        expected = calculate_score(self.req, hit)
+        self.assertTrue(res['admitted'])
+        self.assertEqual(res['rejected'], [])
+        self.assertEqual((res['score'], res['details']), (expected['score'], expected['details']))
+
+        res = explain_match(self.req, miss.pk)
+        self.assertFalse(res['admitted'])
+        self.assertEqual(res['rejected'], ['districts'])
+        self.assertEqual(res['details']['districts']['subscore'], 0.0)
+        self.assertIsNone(explain_match(self.req, miss.pk + 1000))
+
+    def test_range_floor_prefilters_in_sql(self):
+        near = self._create_property(price=Decimal('300000'))
+        far = self._create_property(price=Decimal('2000000'))
+        unknown = self._create_property(price=None)
+        all_ids = set(build_candidate_qs(self.req).values_list('id', flat=True))
+        self.assertEqual(all_ids, {near.id, far.id, unknown.id})
+
+        with override_settings(MATCHING_RANGE_FLOORS={'price': 0.5}):
+            # max 200k con piso 0.5 -> hasta 400k; sin precio (0.5 neutral) pasa
+            ids = set(build_candidate_qs(self.req).values_list('id', flat=True))
+            self.assertEqual(ids, {near.id, unknown.id})
+            profile = get_requirement_profile(self.req)
+            for prop in (near, far, unknown):
+                self.assertEqual(profile.admits(prop), prop.id in ids)
+            self.assertEqual(explain_match(self.req, far.pk)['rejected'], ['price'])
+            self.assertGreaterEqual(calculate_score(self.req, near)['details']['price']['subscore'], 0.5)
+
+        with override_settings(MATCHING_RANGE_FLOORS={'price': 0.9}):
+            ids = set(build_candidate_qs(self.req).values_list('id', flat=True))
+            self.assertEqual(ids, set())
+
+    def test_snapshot_masks_agree_with_sql(self):
+        self.addCleanup(property_snapshot.invalidate)
+        rent = OperationType.objects.create(name='Alquiler', code='rent')
+        pen = Currency.objects.create(code='PEN', name='Sol', symbol='S/')
+        credit = PaymentMethod.objects.create(name='Credito', code='credit')
+        self._create_property()
+        self._create_property(district_fk=self.surco, price=Decimal('600000'))
+        self._create_property(operation_type=rent)
+        self._create_property(currency=pen)
+        self._create_property(forma_de_pago=credit, price=None)
+        self._create_property(availability_status='reserved')
+        self._create_property(is_draft=True)
+
+        loose = Requirement.objects.create(created_by=self.user, operation_type=self.buy, price_max=Decimal('200000'))
+        by_credit = Requirement.objects.create(created_by=self.user, payment_method=credit)
+        by_credit.districts.add(self.miraflores, self.surco)
+
+        def ids_from_snapshot(req):
+            return set(property_snapshot.candidate_arrays(req)['id'].tolist())
+
+        for req in (self.req, loose, by_credit):
+            self.assertEqual(ids_from_snapshot(req), set(build_candidate_qs(req).values_list('id', flat=True)))
+        with override_settings(MATCHING_RANGE_FLOORS={'price': 0.5}):
+            self.assertEqual(ids_from_snapshot(loose), set(build_candidate_qs(loose).values_list('id', flat=True)))
+
+    def test_snapshot_codes_ignore_case_like_sql(self):
+        self.addCleanup(property_snapshot.invalidate)
+        sale_upper = OperationType.objects.create(name='VENTA', code='SALE')
+        cash_upper = PaymentMethod.objects.create(name='CONTADO', code='CASH')
+        mixed = PaymentMethod.objects.create(name='Mixto', code='Cont_Y_Credito')
+        credit = PaymentMethod.objects.create(name='Credito', code='credit')
+        expected = {
+            self._create_property().id,
+            self._create_property(operation_type=sale_upper).id,
+            self._create_property(forma_de_pago=cash_upper).id,
+            self._create_property(forma_de_pago=mixed).id,
+        }
+        self._create_property(forma_de_pago=credit)
+
+        profile = get_requirement_profile(self.req)
+        self.assertEqual(profile.payment_codes, ('cash', 'cont_y_credito'))
+        sql = set(build_candidate_qs(self.req).values_list('id', flat=True))
+        self.assertEqual(sql, expected)
+        self.assertEqual(set(property_snapshot.candidate_arrays(self.req)['id'].tolist()), expected)
+        admitted = {p.id for p in Property.objects.all() if profile.admits(p)}
+        self.assertEqual(admitted, expected)
+
+    def test_snapshot_updates_only_changed_rows(self):
+        self.addCleanup(property_snapshot.invalidate)
+        prop = self._create_property(price=Decimal('900000'))
+        other = self._create_property()
+        state = property_snapshot.current()
+        self.assertEqual(len(state), 2)
+
+        prop.price = Decimal('150000')
+        prop.save()
+        with self.assertNumQueries(1):
+            state = property_snapshot.current()
+        self.assertEqual(state.column('price')[state.row_of[prop.id]], 150000.0)
+
+        other.delete()
+        state = property_snapshot.current()
+        self.assertEqual(set(state.row_of), {prop.id})
+        self.assertEqual([r['property'].id for r in get_matches(self.req)], [prop.id])
+
+    def test_engine_metrics_record_get_matches(self):
+        engine_metrics.reset()
+        self.addCleanup(engine_metrics.reset)
+        self._create_property()
+        self._create_property(price=Decimal('190000'), bedrooms=1)
+        self._create_property(district_fk=self.surco)
+
+        with self.assertLogs('properties.engine_matching.metrics', level='INFO') as logs:
+            results = get_matches(self.req)
+        payload = json.loads(logs.records[0].getMessage().split(' ', 1)[1])
+        self.assertEqual(payload['candidates'], 2)
+        self.assertEqual(payload['returned'], len(results))
+        self.assertEqual(set(payload['ms']), {'load', 'score', 'fetch'})
+
+        staff = get_user_model().objects.create_user(username='ops', password='pass', is_staff=True)
+        self.client.force_login(staff)
+        data = self.client.get(reverse('properties:api_matching_metrics')).json()
+        self.assertEqual(data['calls'], 1)
+        self.assertEqual(data['candidates']['max'], 2)
+        self.assertEqual(sum(data['score_histogram'].values()), 2)
+        self.assertEqual(data['timings']['score']['count'], 1)
+
+    def test_amenity_tokens_score_as_bitsets(self):
+        self.addCleanup(property_snapshot.invalidate)
+        invalidate_token_index()   # bulk_create no dispara signals
+        # más de 64 tokens: bitsets de más de una palabra
+        AmenityToken.objects.bulk_create(AmenityToken(name=f'extra {i}') for i in range(70))
+        full = self._create_property(amenities='Piscina; GIMNASIO, sauna, terraza')
+        partial = self._create_property(amenities='piscina')
+        unknown = self._create_property(amenities=None)
+        self.assertEqual(full.amenity_tokens.count(' '), 3)
+
+        self.req.amenities = 'piscina, Gimnasio, sauna, jacuzzi'
+        self.req.save()
+        profile = get_requirement_profile(self.req)
+        self.assertIn('amenities', profile.criteria)
+        self.assertEqual(profile.amenity_count, 4)
+
+        expected = {full.id: 0.75, partial.id: 0.25, unknown.id: 0.5}
+        for arrays in (load_candidate_arrays(build_candidate_qs(profile)), property_snapshot.candidate_arrays(profile)):
+            batch = calculate_scores_batch(profile, arrays)
+            got = dict(zip(batch['ids'].tolist(), batch['subscores']['amenities'].tolist()))
+            self.assertEqual(got, expected)
+        for prop in (full, partial, unknown):
+            self.assertEqual(pair_subscores(profile, prop)['amenities'], expected[prop.id])
+
+    def test_token_bits_are_dense_and_follow_vocabulary(self):
+        self.addCleanup(property_snapshot.invalidate)
+        # ids altos con un vocabulario chico: el ancho depende de cuántos tokens hay
+        AmenityToken.objects.bulk_create(AmenityToken(id=500 + i, name=f'alto {i}') for i in range(3))
+        invalidate_token_index()
+        self.addCleanup(invalidate_token_index)   # los ids de este test no sobreviven al rollback
+        pool = self._create_property(amenities='alto 2, piscina')
+        index = get_token_index()
+        self.assertEqual(sorted(index.position.values()), list(range(AmenityToken.objects.count())))
+        arrays = load_candidate_arrays(Property.objects.filter(pk=pool.pk))
+        self.assertEqual(arrays['amenity_tokens'].shape, (1, 1))
+
+        # el requerimiento no agrega tokens: lo desconocido solo cuenta en amenity_count
+        self.req.amenities = 'piscina, jacuzzi'
+        self.req.save()
+        self.assertFalse(AmenityToken.objects.filter(name='jacuzzi').exists())
+        profile = get_requirement_profile(self.req)
+        self.assertEqual((len(profile.amenity_ids), profile.amenity_count), (1, 2))
+        state = property_snapshot.current()
+
+        # una propiedad trae el token: profile y snapshot se rearman con el vocabulario nuevo
+        with self.captureOnCommitCallbacks(execute=True):
+            spa = self._create_property(amenities='jacuzzi, piscina')
+        self.assertIsNot(get_requirement_profile(self.req), profile)
+        self.assertEqual(len(get_requirement_profile(self.req).amenity_ids), 2)
+        self.assertIsNot(property_snapshot.current().token_index, state.token_index)
+        scores = {r['property'].id: r['details']['amenities']['subscore'] for r in get_matches(self.req, limit=10)}
+        self.assertEqual(scores[spa.id], 1.0)
+        self.assertEqual(scores[pool.id], 0.5)
+
+    def test_train_matching_weights_from_history(self):
+        weights = load_weights()
+        version = get_weights_version()
+        # aceptadas: precio en rango; mostradas sin respuesta: fuera de rango. Dormitorios al azar.
+        for i in range(4):
+            good = self._create_property(bedrooms=1 + 2 * (i % 2))
+            MatchEvent.objects.create(requirement=self.req, property=good)
+            bad = self._create_property(price=Decimal('350000'), bedrooms=1 + 2 * ((i + 1) % 2))
+            RequirementMatch.objects.create(requirement=self.req, property=bad, score=70)
+
+        call_command('train_matching_weights', min_samples=3, dry_run=True, stdout=StringIO())
+        self.assertEqual(get_weights_version(), version)
+        self.assertFalse(MatchingWeight.objects.exists())
+
+        out = StringIO()
+        call_command('train_matching_weights', min_samples=3, stdout=out)
+        self.assertIn('pesos escritos', out.getvalue())
+        self.assertGreater(get_weights_version(), version)
+        new = dict(MatchingWeight.objects.values_list('key', 'weight'))
+        self.assertEqual(set(new), {'price', 'bedrooms'})
+        self.assertGreater(new['price'], weights['price'])
+        self.assertLess(new['bedrooms'], weights['bedrooms'])
+        self.assertAlmostEqual(new['price'] + new['bedrooms'], weights['price'] + weights['bedrooms'], places=3)
+
+class VersionCounterTests(TestCase):
+    def test_new_counter_starts_at_the_clock(self):
+        key = 'engine_matching:test_version'
+        self.addCleanup(cache.delete, key)
+        cache.delete(key)
+        with mock.patch('properties.engine_matching.versions.time.time_ns', return_value=1_700_000_000_000_000_000):
+            first = bump_version(key)
+            self.assertEqual(first, 1_700_000_000_000_000)
+            self.assertEqual(bump_version(key), first + 1)
+
+        # desalojado (LRU / reinicio): vuelve a arrancar por encima de lo ya visto
+        cache.delete(key)
+        with mock.patch('properties.engine_matching.versions.time.time_ns', return_value=1_700_000_000_001_000_000):
+            self.assertGreater(bump_version(key), first + 1)
+        # el log de cambios no se recorre a través del salto
+        self.assertIsNone(inventory_changes(0, first))
+
+    @override_settings(DEBUG=False, MATCHING_ALLOW_LOCAL_CACHE=False)
+    def test_local_cache_warns_without_debug(self):
+        with self.assertLogs('properties.engine_matching.versions', 'WARNING'):
+            self.assertTrue(warn_if_local_cache())
+        with override_settings(DEBUG=True):
+            self.assertFalse(warn_if_local_cache())
+        with override_settings(MATCHING_ALLOW_LOCAL_CACHE=True):
+            self.assertFalse(warn_if_local_cache())
+
+
+class TopKSelectionTests(TestCase):
+    def test_matches_stable_full_sort(self):
+        rng = np.random.default_rng(7)
+        scores = rng.integers(0, 20, size=500).astype(float)
+
+        expected = np.argsort(-scores, kind="stable")
+        for k in (0, 1, 5, 37, 500, 800):
+            self.assertEqual(top_k_indices(scores, k).tolist(), expected[:k].tolist())
+
+    def test_min_score_is_applied_before_selection(self):
+        scores = np.array([10.0, 80.0, 79.996, 79.994, 95.0])
+
+        self.assertEqual(top_k_indices(scores, 10, min_score=80.0).tolist(), [4, 1, 2])
+
+
+class BenchmarkMatchingTests(TestCase):
+    def test_benchmark_command_reports_and_rolls_back(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.json')
+            call_command(
+                'benchmark_matching', properties=60, requirements=5, repeat=1, output=path, stdout=StringIO(),
+            )
+            with open(path, encoding='utf-8') as fh:
+                report = json.load(fh)
+
+        self.assertEqual(report['meta']['requirements'], 5)
+        self.assertEqual(report['meta']['properties'], 60)
+        for name in ('build_candidate_qs', 'calculate_score', 'score_property', 'get_matches', 'persist_matches'):
+            self.assertIn(name, report['timings'])
+        self.assertEqual(report['timings']['get_matches']['runs'], 5)
+        self.assertEqual(report['timings']['calculate_score']['runs'], report['candidates']['total'])
+        # el inventario sintético no queda en la base
+        self.assertFalse(Property.objects.exists())
+        self.assertFalse(Requirement.objects.exists())
@@ -0,0 +1,112 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .geo import encode_geohash, in_bbox, parse_bbox
+from .models import Property
+
+
+class GeoTests(TestCase):
+    def setUp(self):
+        self.staff = get_user_model().objects.create_user(
+            username='mapper', email='map@example.com', password='pass', is_staff=True, is_superuser=True,
+        )
+
+    def _create_property(self, **overrides):
+        base = dict(created_by=self.staff)
+        base.update(overrides)
+        return Property.objects.create(**base)
+
+    def test_map_markers_by_bbox_and_clusters(self):
+        near = [
+            self._create_property(coordinates='-12.1211, -77.0297'),
+            self._create_property(coordinates='-12.1215,-77.0301'),
+        ]
+        far = self._create_property(coordinates='-16.4090, -71.5374')
+        self._create_property(coordinates='sin coordenadas')
+        self.assertEqual((near[0].latitude, near[0].longitude), (-12.1211, -77.0297))
+
+        # cargas que no pasan por save(): el backfill las completa
+        Property.objects.filter(pk=far.pk).update(latitude=None, longitude=None)
+        out = StringIO()
+        call_command('backfill_coordinates', stdout=out)
+        self.assertIn('actualizadas=1 sin_parsear=1', out.getvalue())
+
+        self.client.force_login(self.staff)
+        url = reverse('properties:api_map_markers')
+        lima = {'bbox': '-12.2,-77.1,-12.0,-76.9', 'zoom': 14}
+        data = self.client.get(url, lima).json()
+        self.assertFalse(data['clustered'])
+        self.assertEqual(sorted(m['id'] for m in data['markers']), sorted(p.pk for p in near))
+
+        peru = {'bbox': '-18.0,-81.0,-3.0,-68.0', 'zoom': 5}
+        with override_settings(DASHBOARD_MAP_MAX_MARKERS=1):
+            data = self.client.get(url, peru).json()
+        self.assertTrue(data['clustered'])
+        self.assertEqual(sorted(c['count'] for c in data['clusters']), [1, 2])
+
+        self.assertEqual(self.client.get(url, {'bbox': 'x'}).status_code, 400)
+
+    def test_bbox_outside_valid_ranges(self):
+        # se recorta al mundo
+        self.assertEqual(parse_bbox('-95,-200,95,200'), (-90.0, -180.0, 90.0, 180.0))
+        self.assertEqual(parse_bbox('-12.2,-181,-12.0,-76.9'), (-12.2, -180.0, -12.0, -76.9))
+        # invertido, fuera del mundo o no finito
+        for value in (
+            '-12.0,-77.1,-12.2,-76.9',      # south > north
+            '-12.2,170,-12.0,-170',         # cruza el antimeridiano
+            '95,-77.1,100,-76.9',           # todo al norte del polo
+            '-12.2,185,-12.0,190',          # todo al este de 180
+            'nan,-77.1,-12.0,-76.9',
+            '-12.2,-inf,-12.0,-76.9',
+            '-12.2,-77.1,-12.0',
+            '',
+        ):
+            self.assertIsNone(parse_bbox(value), value)
+
+        self._create_property(coordinates='-12.1211, -77.0297')
+        self.client.force_login(self.staff)
+        url = reverse('properties:api_map_markers')
+        for value in ('95,-77.1,100,-76.9', '-12.2,170,-12.0,-170', 'nan,-77.1,-12.0,-76.9'):
+            self.assertEqual(self.client.get(url, {'bbox': value, 'zoom': 14}).status_code, 400, value)
+        data = self.client.get(url, {'bbox': '-95,-200,95,200', 'zoom': 1}).json()
+        self.assertEqual(data['total'], 1)
+
+    def test_geohash_radius_and_bbox_queries(self):
+        center = self._create_property(coordinates='-12.1211,-77.0297')
+        close = self._create_property(coordinates='-12.1250,-77.0300')      # ~430 m
+        farther = self._create_property(coordinates='-12.1300,-77.0400')    # ~1.5 km
+        self._create_property(coordinates='-16.4090,-71.5374')              # Arequipa
+        self.assertEqual(center.geohash, encode_geohash(-12.1211, -77.0297))
+        self.assertEqual(len(center.geohash), 9)
+
+        bbox = (-12.2, -77.1, -12.0, -76.9)
+        plain = Property.objects.filter(latitude__range=(-12.2, -12.0), longitude__range=(-77.1, -76.9))
+        self.assertEqual(set(in_bbox(Property.objects.all(), bbox)), set(plain))
+
+        url = reverse('properties:properties-nearby', kwargs={'pk': center.pk})
+        data = self.client.get(url, {'radius': 1000}).json()
+        self.assertEqual([row['id'] for row in data['results']], [close.pk])
+        self.assertAlmostEqual(data['results'][0]['distance_m'], 435, delta=15)
+        data = self.client.get(url, {'radius': 2000}).json()
+        self.assertEqual([row['id'] for row in data['results']], [close.pk, farther.pk])
+
+    def test_nearby_rejects_invalid_radius(self):
+        center = self._create_property(coordinates='-12.1211,-77.0297')
+        close = self._create_property(coordinates='-12.1250,-77.0300')
+        url = reverse('properties:properties-nearby', kwargs={'pk': center.pk})
+
+        for radius in ('nan', 'NaN', 'inf', '-inf', 'mil', ''):
+            self.assertEqual(self.client.get(url, {'radius': radius}).status_code, 400, radius)
+        # fuera de rango se acota a [1, 20000] m
+        data = self.client.get(url, {'radius': '-5'}).json()
+        self.assertEqual(data['results'], [])
+        data = self.client.get(url, {'radius': '1e9'}).json()
+        self.assertEqual([row['id'] for row in data['results']], [close.pk])
+
+        no_coords = self._create_property()
+        url = reverse('properties:properties-nearby', kwargs={'pk': no_coords.pk})
+        self.assertEqual(self.client.get(url).status_code, 400)
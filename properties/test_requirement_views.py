@@ -0,0 +1,68 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from .models import (
+    Currency,
+    Department,
+    District,
+    MatchRecalcJob,
+    OperationType,
+    PaymentMethod,
+    Property,
+    PropertyType,
+    Province,
+    Requirement,
+    RequirementMatch,
+)
+
+
+class RequirementFormRecalcTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='agent', email='a@example.com', password='pass', is_superuser=True,
+        )
+        dept = Department.objects.create(name='Lima', code='LIM')
+        prov = Province.objects.create(name='Lima', code='LIM', department=dept)
+        self.district = District.objects.create(name='Miraflores', code='MIR', province=prov)
+        self.buy = OperationType.objects.create(name='Compra', code='buy')
+        sale = OperationType.objects.create(name='Venta', code='sale')
+        self.ptype = PropertyType.objects.create(name='Departamento')
+        self.usd = Currency.objects.create(code='USD', name='Dolar', symbol='$')
+        self.cash = PaymentMethod.objects.create(name='Contado', code='cash')
+        Property.objects.create(
+            created_by=self.user, operation_type=sale, property_type=self.ptype, currency=self.usd,
+            forma_de_pago=self.cash, district_fk=self.district, price=Decimal('150000'),
+        )
+        self.client.force_login(self.user)
+
+    def _post_data(self, **overrides):
+        data = {
+            'operation_type': self.buy.pk,
+            'property_type': self.ptype.pk,
+            'currency': self.usd.pk,
+            'payment_method': self.cash.pk,
+            'price_min': '100000',
+            'price_max': '200000',
+            'districts': [self.district.pk],
+        }
+        data.update(overrides)
+        return data
+
+    def test_create_and_update_enqueue_recalc_without_inline_matching(self):
+        response = self.client.post(reverse('properties:requirements_create'), self._post_data())
+        self.assertEqual(response.status_code, 302)
+        req = Requirement.objects.get()
+        self.assertTrue(MatchRecalcJob.objects.filter(requirement=req).exists())
+        self.assertFalse(RequirementMatch.objects.exists())
+
+        MatchRecalcJob.objects.all().delete()
+        response = self.client.post(
+            reverse('properties:requirements_edit', kwargs={'pk': req.pk}),
+            self._post_data(price_max='250000'),
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(MatchRecalcJob.objects.filter(requirement=req).exists())
+        self.assertFalse(RequirementMatch.objects.exists())
@@ -0,0 +1,66 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from .engine_matching.engine import get_matches
+from .models import Department, District, Property, Province, Requirement
+from .ubigeo import get_ubigeo_names
+
+
+class UbigeoTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='ubigeo', email='u@example.com', password='pass')
+        self.dept = Department.objects.create(name='Lima', code='LIM')
+        self.prov = Province.objects.create(name='Lima', code='LIM', department=self.dept)
+        self.miraflores = District.objects.create(name='Miraflores', code='MIR', province=self.prov)
+        self.surco = District.objects.create(name='Surco', code='SUR', province=self.prov)
+
+    def _create_property(self, **overrides):
+        base = dict(created_by=self.user, district_fk=self.miraflores)
+        base.update(overrides)
+        return Property.objects.create(**base)
+
+    def test_legacy_district_resolves_district_fk(self):
+        req = Requirement.objects.create(created_by=self.user)
+        req.districts.add(self.miraflores)
+        arequipa = Province.objects.create(name='Arequipa', code='AQP', department=self.dept)
+        District.objects.create(name='Miraflores', code='AMI', province=arequipa)
+
+        # formulario: `district` guarda el ID como texto
+        by_id = self._create_property(district_fk=None, district=str(self.miraflores.id))
+        self.assertEqual(by_id.district_fk_id, self.miraflores.id)
+        self.assertEqual([r['property'].id for r in get_matches(req)], [by_id.id])
+
+        legacy = [
+            self._create_property(district_fk=None, district='  MIRAFLORES ', province='Lima'),
+            self._create_property(district_fk=None, district='Miraflores'),  # homónimo sin provincia
+            self._create_property(district_fk=None, district='Santiago de Surco'),
+        ]
+        Property.objects.filter(pk__in=[p.pk for p in legacy]).update(district_fk=None)
+
+        out = StringIO()
+        call_command('backfill_district_fk', stdout=out)
+        self.assertIn('actualizadas=1 sin_resolver=2', out.getvalue())
+        self.assertEqual(
+            dict(Property.objects.filter(pk__in=[p.pk for p in legacy]).values_list('id', 'district_fk_id')),
+            {legacy[0].pk: self.miraflores.id, legacy[1].pk: None, legacy[2].pk: None},
+        )
+
+    def test_ubigeo_names_cached_until_ubigeo_changes(self):
+        props = [
+            self._create_property(
+                department=str(self.dept.id), province=str(self.prov.id),
+                district=str(self.miraflores.id), urbanization='999999',
+            ),
+            self._create_property(department='Lima', province='', district=str(self.surco.id)),
+        ]
+        get_ubigeo_names()   # carga inicial
+        with self.assertNumQueries(0):
+            names = [(p.department_name, p.province_name, p.district_name, p.urbanization_name) for p in props]
+        self.assertEqual(names, [('Lima', 'Lima', 'Miraflores', '999999'), ('Lima', '', 'Surco', '')])
+
+        self.surco.name = 'Santiago de Surco'
+        self.surco.save()
+        self.assertEqual(props[1].district_name, 'Santiago de Surco')
@@ -0,0 +1,174 @@
+"""Resolución del ubigeo legacy de `Property`.
+
+`Property.department/province/district` son texto: según de dónde vino la
+propiedad guardan el ID (formulario) o el nombre (importadores, con o sin tildes).
+El motor de matching solo usa `district_fk`; aquí se traduce una cosa a la otra.
+
+- DistrictResolver: mapa precalculado (ID / nombre normalizado -> District.id),
+  una sola query. Para lotes (backfill_district_fk, importadores).
+- get_district_resolver(): el mismo mapa compartido por proceso (lo usa
+  Property.save); signals.py lo invalida en cada save/delete de District.
+- get_ubigeo_names(): ID -> nombre de Department/Province/District/Urbanization
+  (unos miles de filas, una query por tabla) compartido por proceso, para
+  Property.department_name & co. Se invalida con un contador de versión en el cache
+  de Django (signals.py lo sube en cada save/delete de esas tablas), así los demás
+  workers recargan; la versión se consulta a lo sumo cada UBIGEO_VERSION_CHECK segundos.
+"""
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional
+
+from .engine_matching.versions import bump_version, get_version
+from .models import Department, District, Province, Urbanization
+
+DISTRICT_RESOLVER_TTL = 5 * 60
+
+UBIGEO_NAMES_VERSION_KEY = "properties:ubigeo_names_version"
+UBIGEO_VERSION_CHECK = 5.0
+
+
+def normalize_name(text) -> str:
+    """'  San Martín de  Porres ' -> 'san martin de porres'"""
+    if not text:
+        return ""
+    plain = ''.join(c for c in unicodedata.normalize('NFD', str(text)) if unicodedata.category(c) != 'Mn')
+    return ' '.join(plain.lower().split())
+
+
+class _DistrictRow(NamedTuple):
+    id: int
+    province_id: int
+    province: str      # nombre normalizado
+    department_id: int
+    department: str    # nombre normalizado
+
+
+def _same_place(ref_id: int, ref_name: str, value) -> bool:
+    """`value` (ID como texto o nombre) apunta a este departamento / provincia."""
+    value = str(value or "").strip()
+    if not value:
+        return True
+    if value.isdigit():
+        return int(value) == ref_id
+    return normalize_name(value) == ref_name
+
+
+class DistrictResolver:
+    def __init__(self):
+        self.ids = set()
+        self.by_name: Dict[str, List[_DistrictRow]] = defaultdict(list)
+        rows = District.objects.values_list(
+            "id", "name",
+            "province_id", "province__name",
+            "province__department_id", "province__department__name",
+        )
+        for pk, name, prov_id, prov_name, dept_id, dept_name in rows:
+            self.ids.add(pk)
+            self.by_name[normalize_name(name)].append(
+                _DistrictRow(pk, prov_id, normalize_name(prov_name), dept_id, normalize_name(dept_name))
+            )
+        self.built_at = time.monotonic()
+
+    def resolve(self, district, province=None, department=None) -> Optional[int]:
+        """
+        District.id para el texto legacy, o None si no existe / es ambiguo.
+        Un nombre repetido (hay distritos homónimos en distintas provincias) se
+        desempata con `province` y `department`.
+        """
+        value = str(district or "").strip()
+        if not value:
+            return None
+        if value.isdigit():
+            pk = int(value)
+            return pk if pk in self.ids else None
+
+        candidates = self.by_name.get(normalize_name(value), [])
+        if len(candidates) > 1:
+            candidates = [c for c in candidates if _same_place(c.province_id, c.province, province)]
+        if len(candidates) > 1:
+            candidates = [c for c in candidates if _same_place(c.department_id, c.department, department)]
+        return candidates[0].id if len(candidates) == 1 else None
+
+
+_resolver: Optional[DistrictResolver] = None
+_resolver_lock = threading.Lock()
+
+
+def get_district_resolver() -> DistrictResolver:
+    global _resolver
+    resolver = _resolver
+    if resolver is not None and time.monotonic() - resolver.built_at < DISTRICT_RESOLVER_TTL:
+        return resolver
+    with _resolver_lock:
+        _resolver = DistrictResolver()
+        return _resolver
+
+
+def invalidate_district_resolver() -> None:
+    global _resolver
+    with _resolver_lock:
+        _resolver = None
+
+
+# -----------------------------
+# Nombres por ID
+# -----------------------------
+class UbigeoNames:
+    """ID -> nombre de las cuatro tablas de ubigeo, cargadas una vez."""
+
+    def __init__(self, version: int = 0):
+        self.version = version
+        self.departments: Dict[int, str] = dict(Department.objects.values_list("id", "name"))
+        self.provinces: Dict[int, str] = dict(Province.objects.values_list("id", "name"))
+        self.districts: Dict[int, str] = dict(District.objects.values_list("id", "name"))
+        self.urbanizations: Dict[int, str] = dict(Urbanization.objects.values_list("id", "name"))
+        self.checked_at = time.monotonic()
+
+    @staticmethod
+    def _lookup(table: Dict[int, str], value) -> str:
+        """Nombre si `value` es un ID conocido; si no, el valor original ('' si está vacío)."""
+        value = str(value).strip() if value is not None else ""
+        if value.isdigit():
+            return table.get(int(value), value)
+        return value
+
+    def department(self, value) -> str:
+        return self._lookup(self.departments, value)
+
+    def province(self, value) -> str:
+        return self._lookup(self.provinces, value)
+
+    def district(self, value) -> str:
+        return self._lookup(self.districts, value)
+
+    def urbanization(self, value) -> str:
+        return self._lookup(self.urbanizations, value)
+
+
+_names: Optional[UbigeoNames] = None
+_names_lock = threading.Lock()
+
+
+def get_ubigeo_names() -> UbigeoNames:
+    global _names
+    names = _names
+    if names is not None and time.monotonic() - names.checked_at < UBIGEO_VERSION_CHECK:
+        return names
+    version = get_version(UBIGEO_NAMES_VERSION_KEY)
+    with _names_lock:
+        names = _names
+        if names is not None and names.version == version:
+            names.checked_at = time.monotonic()
+            return names
+        _names = UbigeoNames(version)
+        return _names
+
+
+def invalidate_ubigeo_names() -> None:
+    """Este proceso recarga ya; los demás al ver la versión nueva."""
+    global _names
+    bump_version(UBIGEO_NAMES_VERSION_KEY)
+    with _names_lock:
+        _names = None
@@ -18,6 +18,7 @@ urlpatterns = [
     path('ultra-simple/', views.simple_properties_view, name='ultra_simple_list'),
     path('simple-list/', views.SimplePropertyListView.as_view(), name='simple_property_list'),
     path('dashboard/', views.PropertyDashboardView.as_view(), name='list'),
+    path('dashboard/map/markers/', views.PropertyMapMarkersView.as_view(), name='api_map_markers'),
     path('marketing/whatsapp/track/<int:link_id>/', views.track_whatsapp_click, name='track_whatsapp_click'),
     path('crear/', views.create_property_view, name='create'),
     path('mis-propiedades/', views.MyPropertiesView.as_view(), name='my_properties'),
@@ -92,6 +93,7 @@ urlpatterns = [
     path('matching/requirement/<int:pk>/matches/', views.matching_matches_view, name='matching_matches'),
     path("matching/requirement/<int:req_id>/property/<int:prop_id>/detail/",views.match_detail_partial, name="match_detail_partial",),
     path("api/requirements/<int:req_id>/matches/recalculate/",views.api_recalculate_requirement_matches ,name="api_recalculate_requirement_matches",),
+    path("api/matching/metrics/", views.api_matching_metrics, name="api_matching_metrics"),
     
     #PROPUESTA
     path('propuestas/', views.proposals_list, name='proposals_list'),
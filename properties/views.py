@@ -9,9 +9,10 @@ from django.db.models import Case, When, Value, IntegerField
 from django.views.generic import ListView, DetailView
 from django.shortcuts import render, get_object_or_404, redirect
 from users.models import Role
-from django.http import Http404, HttpResponseRedirect, HttpResponse, HttpResponseNotFound
+from django.http import Http404, HttpResponseRedirect, HttpResponse, HttpResponseNotFound, JsonResponse
 from .models import Requirement, RequirementMatch, Proposal
 from django.contrib.auth.decorators import login_required
+import hashlib
 import uuid
 from decimal import Decimal, InvalidOperation
 from django.urls import reverse
@@ -19,16 +20,25 @@ from django.template.loader import get_template
 from django.db.models import Count, Max
 from xhtml2pdf import pisa
 from django.conf import settings
+from django.core.cache import cache
 from django.db.models import Prefetch
 from .models import PropertyImage  # <-- AJUSTA si tu modelo se llama diferente
 from .models import ( PropertyType, PropertyStatus, PropertySubtype, Currency, Event)
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from datetime import date
 from django.db.models import Q
 from rest_framework import status
-from properties.engine_matching.engine import get_matches
+from properties.engine_matching.engine import CANDIDATE_RELATED
+from properties.engine_matching.metrics import engine_metrics
+from properties.engine_matching.persistence import persist_requirement_matches
+from properties.engine_matching.cache import get_cached_matches, get_cached_score
+from properties.engine_matching.versions import bump_inventory_version, get_inventory_version
+from properties.engine_matching.weights import default_weights
+from properties.geo import MAX_ZOOM, cell_size, cluster_cells, extent, in_bbox, parse_bbox, snap_bbox
+from properties.facets import get_dashboard_facets
+from properties.paging import CURSOR_PARAMS, SEEK_ORDER, approximate_count, keyset_page
 from .forms import PropertyOwnerForm, RequirementCreateForm, RequirementUpdateForm, ProposalCreateForm
 from .ai_services import extraer_datos_requerimiento
 from .models import OperationType, PropertyType, District # Asegúrate de importar tus modelos reales
@@ -142,14 +152,25 @@ def get_visible_fields_for_user(user):
     return visible_fields
 
 def match_detail_partial(request, req_id: int, prop_id: int):
-    req = get_object_or_404(Requirement, pk=req_id)
-    prop = get_object_or_404(Property, pk=prop_id)
+    req = get_object_or_404(Requirement.objects.select_related("operation_type", "payment_method"), pk=req_id)
+    # una sola fila con los FKs que leen los criterios: el desglose no hace más queries
+    prop = get_object_or_404(Property.objects.select_related(*CANDIDATE_RELATED), pk=prop_id)
 
     rm = RequirementMatch.objects.filter(requirement=req, property=prop).first()
     if not rm:
-        return render(request, "properties/partials/match_detail_not_ready.html", {
+        # Sin match guardado: si la propiedad pasa los hard filters, calculamos el
+        # desglose en vivo con el profile compilado (cacheado por requerimiento + inventario)
+        sc = get_cached_score(req, prop)
+        if sc is None:
+            return render(request, "properties/partials/match_detail_not_ready.html", {
+                "requirement": req,
+                "property": prop,
+            })
+        return render(request, "properties/partials/match_detail.html", {
             "requirement": req,
             "property": prop,
+            "match": {"score": sc["score"], "details": sc["details"], "computed_at": None},
+            "details": sc["details"],
         })
 
     return render(request, "properties/partials/match_detail.html", {
@@ -187,6 +208,9 @@ def delete_property_view(request, pk):
         return redirect('properties:my_properties')
 
     Property.objects.filter(pk=pk).update(is_active=False)
+    # .update() no dispara signals: avisamos al cache / snapshot del matching
+    bump_inventory_version(pk)
+    transaction.on_commit(lambda: bump_inventory_version(pk))
     messages.success(request, 'Propiedad eliminada correctamente.')
     return redirect('properties:my_properties')
 
@@ -317,6 +341,9 @@ def matching_weights_view(request):
 
     from django.contrib import messages
 
+    # solo las claves de los criterios registrados (engine_matching/registry.py) pesan en el motor
+    defaults = default_weights()
+
     if request.method == 'POST':
         # actualizar pesos desde el formulario
         updated_count = 0
@@ -324,7 +351,7 @@ def matching_weights_view(request):
             if key.startswith('weight_'):
                 k = key.replace('weight_', '')
                 try:
-                    if not value.strip():
+                    if not value.strip() or k not in defaults:
                         continue
                     mw, created = MatchingWeight.objects.get_or_create(key=k)
                     mw.weight = float(value)
@@ -347,6 +374,8 @@ def matching_weights_view(request):
                 import re
                 if not re.match(r'^[a-z0-9_]+$', new_key):
                     messages.error(request, 'Clave inválida (solo minúsculas, números y guiones bajos).')
+                elif new_key not in defaults:
+                    messages.error(request, f'"{new_key}" no es un criterio del motor de matching.')
                 else:
                     if MatchingWeight.objects.filter(key=new_key).exists():
                         messages.warning(request, f'El criterio "{new_key}" ya existe.')
@@ -361,75 +390,31 @@ def matching_weights_view(request):
         
         return redirect('properties:matching_weights')
 
-    # Diccionario de pesos por defecto (copiado de matching.py para consistencia)
-    DEFAULT_WEIGHTS = {
-        'property_type': 5.0,
-        'district': 5.0,
-        'currency': 2.0,
-        'price': 3.0,
-        'area': 2.0,
-        'land_area': 2.0,
-        'built_area': 2.0,
-        'front_measure': 1.0,
-        'depth_measure': 1.0,
-        'bedrooms': 1.0,
-        'bathrooms': 1.0,
-        'half_bathrooms': 0.5,
-        'garage_spaces': 0.8,
-        'garage_type': 0.5,
-        'parking_cost_included': 0.5,
-        'parking_cost': 0.5,
-        'amenities': 1.0,
-        'tags': 1.0,
-        'water_service': 0.5,
-        'energy_service': 0.5,
-        'drainage_service': 0.5,
-        'gas_service': 0.5,
-        'is_project': 0.5,
-        'project_name': 0.5,
-        'unit_location': 0.5,
-        'ascensor': 0.5,
-        'floors': 0.5,
-    }
-
+    # Pesos por defecto: los mismos que usa el motor (engine_matching/weights.py)
     # Asegurar que los pesos por defecto existan en la base de datos
-    for k, v in DEFAULT_WEIGHTS.items():
+    for k, v in defaults.items():
         MatchingWeight.objects.get_or_create(key=k, defaults={'weight': v})
 
-    weights = MatchingWeight.objects.all().order_by('key')
+    weights = MatchingWeight.objects.filter(key__in=defaults).order_by('key')
     # Etiquetas en español para mostrar en el UI del selector
     MATCHING_KEY_LABELS = {
+        'operation_type': 'Tipo de operación',
         'property_type': 'Tipo de propiedad',
         'property_subtype': 'Subtipo',
         'district': 'Distrito',
-        'province': 'Provincia',
-        'department': 'Departamento',
-        'urbanization': 'Urbanización',
         'currency': 'Moneda',
+        'payment_method': 'Forma de pago',
+        'availability_status': 'Disponibilidad',
         'price': 'Precio',
-        'area': 'Área',
-        'land_area': 'Área de terreno',
-        'built_area': 'Área construida',
-        'front_measure': 'Frontera',
-        'depth_measure': 'Profundidad',
         'bedrooms': 'Dormitorios',
         'bathrooms': 'Baños',
-        'half_bathrooms': 'Medios baños',
         'garage_spaces': 'Cochera (espacios)',
-        'garage_type': 'Tipo de garaje',
-        'parking_cost_included': 'Estacionamiento incluido',
-        'parking_cost': 'Costo de estacionamiento',
-        'amenities': 'Servicios / Amenidades',
-        'tags': 'Etiquetas',
-        'water_service': 'Servicio de agua',
-        'energy_service': 'Servicio de energía',
-        'drainage_service': 'Servicio de drenaje',
-        'gas_service': 'Servicio de gas',
-        'is_project': 'Proyecto (sí/no)',
-        'project_name': 'Nombre de proyecto',
-        'unit_location': 'Ubicación en unidad',
+        'land_area': 'Área de terreno',
+        'built_area': 'Área construida',
+        'floors': 'Cantidad de pisos',
+        'antiquity_years': 'Antigüedad (años)',
         'ascensor': 'Ascensor (sí/no)',
-        'floors': 'Cantidad de pisos'
+        'amenities': 'Servicios / Amenidades',
     }
     # Convertir a lista simple con etiqueta legible para facilitar el render en la plantilla
     weights_list = []
@@ -440,7 +425,7 @@ def matching_weights_view(request):
             'label': MATCHING_KEY_LABELS.get(w.key, w.key)
         })
     # claves por defecto reconocidas por el motor de matching para el dropdown de "nuevo"
-    DEFAULT_MATCHING_KEYS = list(MATCHING_KEY_LABELS.keys())
+    DEFAULT_MATCHING_KEYS = list(defaults)
     
     existing = set(weights.values_list('key', flat=True))
     
@@ -454,6 +439,7 @@ def matching_weights_view(request):
     return render(request, 'properties/matching_weights.html', {
         'weights': weights_list,
         'available_keys': available_keys,
+        'equal_weights': getattr(settings, 'MATCHING_EQUAL_WEIGHTS', False),
     })
 
 
@@ -820,40 +806,8 @@ def api_recalculate_requirement_matches(request, req_id: int):
     limit = int(request.query_params.get("limit", 20))
     min_score = float(request.query_params.get("min_score", 0))
 
-    results = get_matches(req, limit=limit)
-
-    created = 0
-    updated = 0
-    saved = []
-    new_prop_ids = set()
-
-    with transaction.atomic():
-        for item in results:
-            prop = item["property"]
-            score = float(item.get("score") or 0)
-            details = item.get("details") or {}
-
-            if score < min_score:
-                continue
-
-            obj, was_created = RequirementMatch.objects.update_or_create(
-                requirement=req,
-                property=prop,
-                defaults={"score": score, "details": details},
-            )
-
-            new_prop_ids.add(prop.id)
-            created += 1 if was_created else 0
-            updated += 0 if was_created else 1
-            saved.append({"property_id": prop.id, "score": score})
-
-        qs_old = RequirementMatch.objects.filter(requirement=req)
-        if new_prop_ids:
-            qs_old.exclude(property_id__in=new_prop_ids).delete()
-        else:
-            qs_old.delete()
-
-    total_saved = created + updated
+    res = recalculate_requirement_matches(req, limit=limit, min_score=min_score)
+    total_saved = res["total_saved"]
 
     if total_saved == 0:
         messages.warning(
@@ -864,18 +818,16 @@ def api_recalculate_requirement_matches(request, req_id: int):
     else:
         messages.success(request, f"Listo: se guardaron {total_saved} coincidencias.")
 
-    return Response(
-        {
-            "requirement_id": req.id,
-            "limit": limit,
-            "min_score": min_score,
-            "created": created,
-            "updated": updated,
-            "total_saved": total_saved,
-            "saved_preview": saved[:50],
-        },
-        status=status.HTTP_200_OK
-    )
+    return Response(res, status=status.HTTP_200_OK)
+
+
+@api_view(["GET", "DELETE"])
+@permission_classes([IsAdminUser])
+def api_matching_metrics(request):
+    """Métricas del motor de matching de este proceso (DELETE las reinicia)."""
+    if request.method == "DELETE":
+        engine_metrics.reset()
+    return Response(engine_metrics.snapshot(), status=status.HTTP_200_OK)
 
 # Vista para editar contacto
 class ContactEditView(LoginRequiredMixin, UpdateView):
@@ -1047,53 +999,20 @@ class MyPropertiesView(LoginRequiredMixin, ListView):
 def recalculate_requirement_matches(req: Requirement, *, limit: int = 20, min_score: float = 0.0) -> dict:
     """
     Reusa EXACTAMENTE la lógica de tu API:
-    - llama get_matches(req, limit=limit)
-    - guarda en RequirementMatch con update_or_create
-    - respeta min_score
+    - llama get_matches(req, limit=limit, min_score=min_score) vía get_cached_matches (el corte va dentro del motor)
+    - guarda en RequirementMatch con persist_requirement_matches (bulk insert/update/delete + notificaciones en batch)
     """
-    results = get_matches(req, limit=limit)
-
-    created = 0
-    updated = 0
-    saved = []
-    new_prop_ids = set()
-
-    with transaction.atomic():
-        for item in results:
-            prop = item["property"]
-            score = float(item.get("score") or 0)
-            details = item.get("details") or {}
-
-            if score < float(min_score):
-                continue
-
-            obj, was_created = RequirementMatch.objects.update_or_create(
-                requirement=req,
-                property=prop,
-                defaults={"score": score, "details": details},
-            )
-            new_prop_ids.add(prop.id)
-            created += 1 if was_created else 0
-            updated += 0 if was_created else 1
-            saved.append({"property_id": prop.id, "score": score})
-
-        qs_old = RequirementMatch.objects.filter(requirement=req)
-        if new_prop_ids:
-            qs_old.exclude(property_id__in=new_prop_ids).delete()
-        else:
-            # si no se guardó nada nuevo, entonces el requerimiento quedó sin matches
-            qs_old.delete()
-
-    total_saved = created + updated
+    results = get_cached_matches(req, limit=limit, min_score=float(min_score))
+    res = persist_requirement_matches(req, results)
 
     return {
         "requirement_id": req.id,
         "limit": limit,
         "min_score": float(min_score),
-        "created": created,
-        "updated": updated,
-        "total_saved": total_saved,
-        "saved_preview": saved[:50],
+        "created": res["created"],
+        "updated": res["updated"],
+        "total_saved": res["created"] + res["updated"],
+        "saved_preview": [{"property_id": p, "score": score} for _, p, score in res["saved"][:50]],
     }
 
 
@@ -1234,20 +1153,8 @@ def requirement_create_view(request):
         req.save()
         form.save_m2m()
 
-        try:
-            res = recalculate_requirement_matches(req, limit=10, min_score=80.0)
-            total_saved = int(res.get("created", 0)) + int(res.get("updated", 0))
-
-            if total_saved == 0:
-                messages.warning(
-                    request,
-                    "No se encontraron matches para este requerimiento.\n"
-                    "Edita tu búsqueda (precio, distritos, dormitorios/baños) y vuelve a recalcular.\n"
-                )
-            else:
-                messages.success(request, "Requerimiento creado. Se calcularon coincidencias.")
-        except Exception:
-            messages.success(request, "Requerimiento creado correctamente (sin recalcular coincidencias).")
+        # las coincidencias las calcula process_match_queue (el signal de Requirement encola)
+        messages.success(request, "Requerimiento creado. Actualizando coincidencias en segundo plano.")
 
         return redirect("properties:requirements_my")
 
@@ -1341,21 +1248,13 @@ def requirement_update_view(request, pk):
         req2.save()
         form.save_m2m()
 
-        # recalcular matches y mensaje ÚNICO
-        try:
-            res = recalculate_requirement_matches(req2, limit=10, min_score=80.0)
-            total_saved = int(res.get("total_saved") or (res.get("created", 0) + res.get("updated", 0)))
-
-            if total_saved == 0:
-                messages.warning(
-                    request,
-                    "No se encontraron matches para este requerimiento.\n"
-                    "Edita tu búsqueda (precio, distritos, dormitorios/baños) y vuelve a recalcular.\n"
-                )
-            else:
-                messages.success(request, f"Requerimiento actualizado. Se guardaron {total_saved} coincidencias.")
-        except Exception:
-            messages.success(request, "Requerimiento actualizado correctamente (sin recalcular coincidencias).")
+        # las coincidencias las recalcula process_match_queue (el signal de Requirement encola);
+        # mientras tanto se muestran las que ya había
+        current = RequirementMatch.objects.filter(requirement=req2).count()
+        messages.success(
+            request,
+            f"Requerimiento actualizado. Actualizando coincidencias ({current} guardadas por ahora).",
+        )
 
         return redirect("properties:requirements_my")
 
@@ -1958,28 +1857,9 @@ class PropertyPDFView(LoginRequiredMixin, DetailView):
         agency = AgencyConfig.objects.first()
         
         # Resolver nombres de ubicación si son IDs (pueden venir como string numérico desde el formulario)
-        from .models import Department, Province, District
-        
-        distrito_nombre = property_obj.district
-        if distrito_nombre and distrito_nombre.isdigit():
-            try:
-                distrito_nombre = District.objects.get(id=int(distrito_nombre)).name
-            except (District.DoesNotExist, ValueError):
-                pass
-        
-        provincia_nombre = property_obj.province
-        if provincia_nombre and provincia_nombre.isdigit():
-            try:
-                provincia_nombre = Province.objects.get(id=int(provincia_nombre)).name
-            except (Province.DoesNotExist, ValueError):
-                pass
-
-        departamento_nombre = property_obj.department
-        if departamento_nombre and departamento_nombre.isdigit():
-            try:
-                departamento_nombre = Department.objects.get(id=int(departamento_nombre)).name
-            except (Department.DoesNotExist, ValueError):
-                pass
+        distrito_nombre = property_obj.district_name
+        provincia_nombre = property_obj.province_name
+        departamento_nombre = property_obj.department_name
 
         template_path = 'properties/property_pdf.html'
         context = {
@@ -2051,6 +1931,47 @@ def drafts_list_view(request):
     })
 
 
+def _property_marker(request, property_obj):
+    """Marker del mapa del dashboard (requiere prefetched_images, ver PropertyDashboardView)."""
+    first_image_url = ''
+    imgs = getattr(property_obj, "prefetched_images", []) or []
+    if imgs and getattr(imgs[0], "image", None):
+        try:
+            first_image_url = request.build_absolute_uri(imgs[0].image.url)
+        except Exception:
+            first_image_url = imgs[0].image.url
+
+    # Preparar nombre seguro del propietario: puede ser método o atributo string
+    try:
+        _owner = getattr(property_obj, 'owner', None)
+        _full = getattr(_owner, 'full_name', None)
+        if callable(_full):
+            owner_display = _full()
+        elif isinstance(_full, str):
+            owner_display = _full
+        else:
+            owner_display = str(_owner) if _owner is not None else ''
+    except Exception:
+        owner_display = str(getattr(property_obj, 'owner', ''))
+
+    return {
+        'id': property_obj.id,
+        'title': property_obj.title,
+        'code': property_obj.code,
+        'property_type': property_obj.property_type.name if property_obj.property_type else '',
+        'status': property_obj.status.name if property_obj.status else '',
+        'price': f"{property_obj.currency.symbol if property_obj.currency else ''} {format(round(property_obj.price or 0), ',.0f')}",
+        'address': property_obj.real_address or property_obj.exact_address or property_obj.district or 'Ubicación no disponible',
+        'real_address': property_obj.real_address or '',
+        'lat': property_obj.latitude,
+        'lng': property_obj.longitude,
+        'url': reverse('properties:detail', kwargs={'pk': property_obj.pk}),
+        'owner': owner_display,
+        'created': property_obj.created_at.strftime('%d/%m/%Y'),
+        'thumbnail': first_image_url,
+    }
+
+
 class PropertyDashboardView(LoginRequiredMixin, ListView):
 
     model = Property
@@ -2287,59 +2208,36 @@ class PropertyDashboardView(LoginRequiredMixin, ListView):
             )
         )
 
-        return queryset.order_by('availability_rank', '-updated_at', '-created_at')
+        return queryset.order_by(*SEEK_ORDER)
 
     def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        properties = context['properties']
-        context['user_role'] = self.request.user.role.name if self.request.user.role else 'Sin rol'
-        # Listas para selects reducidas según requerimiento
-        context['property_types'] = PropertyType.objects.filter(is_active=True).order_by('name')
-        from .models import PaymentMethod, District, Urbanization, Department, Province
-        context['payment_methods'] = PaymentMethod.objects.filter(is_active=True).order_by('order')
-        from users.models import CustomUser  # ajusta si tu import real es distinto
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-        context["agents"] = (
-            User.objects
-            .filter(
-                is_active=True,
-                role__name__in=["Agente interno", "Agente externo", "Agente remax"],
-            )
-            .order_by("first_name", "last_name", "username")
-        )
-        # Obtener distritos de las propiedades ya cargadas en memoria
-        # Resolver posibles valores numéricos a nombres usando el modelo District
-        raw_districts = [p.district for p in properties if p.district]
-        numeric_district_ids = {int(d) for d in raw_districts if str(d).isdigit()}
-        district_map = {}
-        if numeric_district_ids:
-            district_map = {d.id: d.name for d in District.objects.filter(id__in=numeric_district_ids)}
-
-        seen = set()
-        districts = []
-        for d in raw_districts:
-            if str(d).isdigit():
-                did = int(d)
-                name = district_map.get(did, str(d))
-                key = (str(did), name)
-                if key not in seen:
-                    seen.add(key)
-                    districts.append({'id': did, 'name': name})
-            else:
-                key = ('', str(d))
-                if key not in seen:
-                    seen.add(key)
-                    districts.append({'id': '', 'name': str(d)})
-
-        context['districts_list'] = sorted(districts, key=lambda x: (x.get('name') or ''))
-        context["sources"] = list(
-            Property.objects.exclude(source__isnull=True)
-            .exclude(source="")
-            .values_list("source", flat=True)
-            .distinct()
-            .order_by("source")
+        # Solo se materializa la página (keyset): imágenes, ubigeo y markers salen de ella
+        page = keyset_page(
+            self.object_list,
+            after=self.request.GET.get('after', '').strip(),
+            before=self.request.GET.get('before', '').strip(),
         )
+        context = super().get_context_data(object_list=page.object_list, **kwargs)
+        properties = page.object_list
+        filters_qs = self.request.GET.copy()
+        for param in CURSOR_PARAMS:
+            filters_qs.pop(param, None)
+        context['page'] = page
+        context['next_page_url'] = ''
+        context['previous_page_url'] = ''
+        if page.has_next:
+            filters_qs['after'] = page.next_cursor
+            context['next_page_url'] = f"?{filters_qs.urlencode()}"
+            filters_qs.pop('after')
+        if page.has_previous:
+            filters_qs['before'] = page.previous_cursor
+            context['previous_page_url'] = f"?{filters_qs.urlencode()}"
+            filters_qs.pop('before')
+        context['user_role'] = self.request.user.role.name if self.request.user.role else 'Sin rol'
+        # Listas para selects: cacheadas (facets.py), no dependen de los filtros ni de la página
+        context.update({
+            key: value for key, value in get_dashboard_facets().items() if key != 'district_values'
+        })
         # ------------
         # filtros UI
         # ------------
@@ -2399,86 +2297,18 @@ class PropertyDashboardView(LoginRequiredMixin, ListView):
 
         context['age_warning'] = age_warning
 
-        # Listas para selects avanzados
-        context['statuses'] = PropertyStatus.objects.filter(is_active=True).order_by('order')
-        try:
-            context['urbanizations_list'] = list(Urbanization.objects.filter(is_active=True).order_by('name').values('id', 'name'))
-        except Exception:
-            context['urbanizations_list'] = []
-
-        props_list = list(properties) 
-        first_50 = list(properties[:50])
-
-        dept_ids = {int(p.department) for p in first_50 if p.department and str(p.department).isdigit()}
-        prov_ids = {int(p.province) for p in first_50 if p.province and str(p.province).isdigit()}
-        dist_ids = {int(p.district) for p in first_50 if p.district and str(p.district).isdigit()}
-        urb_ids  = {int(p.urbanization) for p in first_50 if p.urbanization and str(p.urbanization).isdigit()}
 
-        dept_map = {o.id: o.name for o in Department.objects.filter(id__in=dept_ids)} if dept_ids else {}
-        prov_map = {o.id: o.name for o in Province.objects.filter(id__in=prov_ids)} if prov_ids else {}
-        dist_map2 = {o.id: o.name for o in District.objects.filter(id__in=dist_ids)} if dist_ids else {}
-        urb_map  = {o.id: o.name for o in Urbanization.objects.filter(id__in=urb_ids)} if urb_ids else {}
+        props_list = properties
 
         for p in props_list:
-            p.display_department = dept_map.get(int(p.department), p.department) if (p.department and str(p.department).isdigit()) else (p.department or '')
-            p.display_province   = prov_map.get(int(p.province), p.province) if (p.province and str(p.province).isdigit()) else (p.province or '')
-            p.display_district   = dist_map2.get(int(p.district), p.district) if (p.district and str(p.district).isdigit()) else (p.district or '')
-            p.display_urbanization = urb_map.get(int(p.urbanization), p.urbanization) if (p.urbanization and str(p.urbanization).isdigit()) else (p.urbanization or '')
-        # -------------------------
-        # ✅ markers + thumbnail sin N+1 de images
-        # -------------------------
-
-        markers = []
-        for property_obj in first_50:
-            lat = lng = None
-            if property_obj.coordinates:
-                parts = [p.strip() for p in property_obj.coordinates.split(',') if p.strip()]
-                if len(parts) == 2:
-                    try:
-                        lat = float(parts[0])
-                        lng = float(parts[1])
-                    except ValueError:
-                        lat = lng = None
-
-            first_image_url = ''
-            imgs = getattr(property_obj, "prefetched_images", []) or []
-            if imgs and getattr(imgs[0], "image", None):
-                try:
-                    first_image_url = self.request.build_absolute_uri(imgs[0].image.url)
-                except Exception:
-                    first_image_url = imgs[0].image.url
-
-            # Preparar nombre seguro del propietario: puede ser método o atributo string
-            try:
-                _owner = getattr(property_obj, 'owner', None)
-                _full = getattr(_owner, 'full_name', None)
-                if callable(_full):
-                    owner_display = _full()
-                elif isinstance(_full, str):
-                    owner_display = _full
-                else:
-                    owner_display = str(_owner) if _owner is not None else ''
-            except Exception:
-                owner_display = str(getattr(property_obj, 'owner', ''))
-
-            markers.append({
-                'id': property_obj.id,
-                'title': property_obj.title,
-                'code': property_obj.code,
-                'property_type': property_obj.property_type.name if property_obj.property_type else '',
-                'status': property_obj.status.name if property_obj.status else '',
-                'price': f"{property_obj.currency.symbol if property_obj.currency else ''} {format(round(property_obj.price), ',.0f')}",
-                'address': property_obj.real_address or property_obj.exact_address or property_obj.district or 'Ubicación no disponible',
-                'real_address': property_obj.real_address or '',
-                'lat': lat,
-                'lng': lng,
-                'url': reverse('properties:detail', kwargs={'pk': property_obj.pk}),
-                'owner': owner_display,
-                'created': property_obj.created_at.strftime('%d/%m/%Y'),
-                'thumbnail': first_image_url,
-            })
-
-        context['property_markers'] = markers
+            p.display_department = p.department_name
+            p.display_province = p.province_name
+            p.display_district = p.district_name
+            p.display_urbanization = p.urbanization_name
+        # Markers: los pide el mapa por viewport a PropertyMapMarkersView; aquí solo el
+        # encuadre inicial del resultado filtrado
+        map_extent = extent(Property.objects.filter(pk__in=self.object_list.values('pk')))
+        context['property_map_extent'] = list(map_extent) if map_extent else None
 
         marker_icon_url = getattr(settings, 'PROPERTY_MARKER_ICON_URL', '').strip()
         if not marker_icon_url:
@@ -2487,10 +2317,65 @@ class PropertyDashboardView(LoginRequiredMixin, ListView):
                 marker_icon_url = static(marker_icon_static_path)
 
         context['property_marker_icon_url'] = marker_icon_url
-        context['property_count'] = len(properties)
+        context['property_count'], context['property_count_capped'] = approximate_count(
+            self.object_list,
+            scope=f"{self.request.user.pk}:{sorted(filters_qs.lists())}",
+        )
 
         return context
 
+
+class PropertyMapMarkersView(PropertyDashboardView):
+    """
+    JSON del mapa del dashboard: mismos filtros que el listado, limitado al bbox visible
+    (?bbox=south,west,north,east&zoom=N). Hasta DASHBOARD_MAP_MAX_MARKERS puntos devuelve
+    markers; con más, un cluster por celda de la grilla (ver geo.py). Cacheado por
+    usuario + filtros + celdas + versión del inventario.
+    """
+    http_method_names = ['get']
+
+    def get(self, request, *args, **kwargs):
+        bbox = parse_bbox(request.GET.get('bbox'))
+        if bbox is None:
+            return JsonResponse({'detail': 'bbox inválido (south,west,north,east)'}, status=400)
+        try:
+            zoom = min(max(int(request.GET.get('zoom', '')), 0), MAX_ZOOM)
+        except ValueError:
+            zoom = 12
+        size = cell_size(zoom)
+        bbox = snap_bbox(bbox, size)
+
+        filters_qs = request.GET.copy()
+        for param in ('bbox', 'zoom', *CURSOR_PARAMS):
+            filters_qs.pop(param, None)
+        scope = f"{request.user.pk}:{sorted(filters_qs.lists())}:{zoom}:{bbox}"
+        key = f"properties:map_markers:{get_inventory_version()}:{hashlib.md5(scope.encode()).hexdigest()}"
+        try:
+            payload = cache.get(key)
+        except Exception:
+            payload = None
+        if payload is None:
+            payload = self._payload(bbox, zoom, size)
+            try:
+                cache.set(key, payload, getattr(settings, 'DASHBOARD_MAP_CACHE_TIMEOUT', 60))
+            except Exception:
+                pass
+        return JsonResponse(payload)
+
+    def _payload(self, bbox, zoom, size):
+        queryset = in_bbox(self.get_queryset(), bbox)
+        # sin los joins/DISTINCT de los filtros, para contar y agrupar
+        points = Property.objects.filter(pk__in=queryset.values('pk'))
+        total = points.count()
+        limit = getattr(settings, 'DASHBOARD_MAP_MAX_MARKERS', 300)
+        payload = {'zoom': zoom, 'bbox': list(bbox), 'total': total, 'clustered': False, 'markers': [], 'clusters': []}
+        if total <= limit or zoom >= getattr(settings, 'DASHBOARD_MAP_CLUSTER_MAX_ZOOM', 17):
+            payload['markers'] = [_property_marker(self.request, p) for p in queryset.order_by(*SEEK_ORDER)[:limit]]
+        else:
+            payload['clustered'] = True
+            payload['clusters'] = cluster_cells(points, size)
+        return payload
+
     
 
 # ===================== VISTA FUNCIONAL PARA CREAR PROPIEDAD =====================
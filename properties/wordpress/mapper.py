@@ -37,12 +37,8 @@ def property_to_wp_payload(
 
     address = p.exact_address or p.real_address or ""
 
-    lat = ""
-    lng = ""
-    if p.coordinates and "," in p.coordinates:
-        parts = [x.strip() for x in p.coordinates.split(",")]
-        if len(parts) >= 2:
-            lat, lng = parts[0], parts[1]
+    lat = "" if p.latitude is None else str(p.latitude)
+    lng = "" if p.longitude is None else str(p.longitude)
 
     internal_code = (p.codigo_unico_propiedad or p.code or "").strip()
     internal_slug = f"propify-{p.id}"